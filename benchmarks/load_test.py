@@ -0,0 +1,379 @@
+'''
+Load tests the API server in :py:mod:`tweebo.server`, which requires the \
+TweeboParser to be installed.
+
+By default a server is started locally on a free port for the duration of \
+the test. Requests are sent either:
+1. Open loop (`--rates`) - requests arrive at the given rates (requests per \
+second) following a Poisson process regardless of how quickly the server \
+responds. Latency is measured from when a request was due to be sent, so \
+time spent waiting for a free connection counts towards the latency.
+2. Closed loop (no `--rates`) - each of the `--concurrency` connections \
+sends its next request as soon as it receives a response.
+
+Each request contains `--batch-size` Tweets from the Tweebank training data \
+of the length classes given in `--mix` e.g. `short:0.6,medium:0.3,long:0.1` \
+where short Tweets have at most 10 tokens, medium 11 to 20 and long more \
+than 20.
+
+For each rate the p50/p95/p99 latency, throughput and error rate are \
+reported. The saturation point is the first rate at which the throughput \
+falls below 90% of the offered rate or the p99 latency exceeds `--slo`.
+
+Usage: python -m benchmarks.load_test --rates 0.5 1 2 4 --duration 60
+'''
+
+import argparse
+from collections import OrderedDict
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import requests
+
+from benchmarks.throughput_benchmark import CORPORA, ROOT_DIR
+
+LENGTH_CLASSES = OrderedDict([('short', (1, 10)), ('medium', (11, 20)),
+                              ('long', (21, float('inf')))])
+# The offered rate is not sustained once throughput falls below this
+# fraction of it.
+SATURATION_THROUGHPUT = 0.9
+
+
+def _texts_by_length():
+    '''
+    :return: The Tweebank training Tweets grouped by the length classes in \
+    `LENGTH_CLASSES`
+    :rtype: Dict[str, list[str]]
+    '''
+
+    texts_by_length = OrderedDict((name, []) for name in LENGTH_CLASSES)
+    for text in CORPORA['tweebank_train']():
+        num_tokens = len(text.split())
+        for name, (min_length, max_length) in LENGTH_CLASSES.items():
+            if min_length <= num_tokens <= max_length:
+                texts_by_length[name].append(text)
+    return texts_by_length
+
+
+def _parse_mix(mix):
+    '''
+    :param mix: Length class weights e.g. `short:0.6,medium:0.3,long:0.1`
+    :type mix: str
+    :return: List of tuples of length class and weight.
+    :rtype: list[tuple[str, float]]
+    :raises argparse.ArgumentTypeError: If the mix is not correctly formatted
+    '''
+
+    weights = []
+    try:
+        for class_weight in mix.split(','):
+            name, weight = class_weight.split(':')
+            if name not in LENGTH_CLASSES:
+                raise ValueError('Unknown length class {}'.format(name))
+            weights.append((name, float(weight)))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError('Mix should be of the form '
+                                         'short:0.6,medium:0.3,long:0.1 '
+                                         'not {}: {}'.format(mix, error))
+    return weights
+
+
+def _request_generator(mix, batch_size, output_type, seed):
+    '''
+    :param mix: Length class weights see :py:func:`_parse_mix`
+    :param batch_size: Number of Tweets in each request.
+    :param output_type: `conll` or `stanford`
+    :param seed: Random seed so that runs send the same requests.
+    :type mix: list[tuple[str, float]]
+    :type batch_size: int
+    :type output_type: str
+    :type seed: int
+    :return: A function that returns the next request's JSON data.
+    :rtype: Callable[[], Dict]
+    '''
+
+    texts_by_length = _texts_by_length()
+    rng = random.Random(seed)
+    total_weight = sum(weight for _, weight in mix)
+    lock = threading.Lock()
+
+    def next_request():
+        texts = []
+        with lock:
+            for _ in range(batch_size):
+                choice = rng.uniform(0, total_weight)
+                for name, weight in mix:
+                    choice -= weight
+                    if choice <= 0:
+                        break
+                texts.append(rng.choice(texts_by_length[name]))
+        return {'texts': texts, 'output_type': output_type}
+    return next_request
+
+
+def percentile(values, percent):
+    '''
+    :param values: Values to get the percentile of
+    :param percent: Percentile between 0 and 100
+    :type values: list[float]
+    :type percent: float
+    :return: The nearest rank percentile of the values or None if there \
+    are no values.
+    :rtype: float or None
+    '''
+
+    if not values:
+        return None
+    sorted_values = sorted(values)
+    rank = int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def _send(session, url, data):
+    '''
+    :param session: Session to send the request with.
+    :param url: URL of the server.
+    :param data: JSON data to send.
+    :type session: requests.Session
+    :type url: str
+    :type data: Dict
+    :return: True if the request succeeded
+    :rtype: bool
+    '''
+
+    try:
+        response = session.post(url, json=data)
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def _run(url, next_request, concurrency, duration, rate, seed):
+    '''
+    Sends requests for duration seconds, open loop if rate is given else \
+    closed loop.
+
+    :param url: URL of the server.
+    :param next_request: Function that returns the next request's data.
+    :param concurrency: Maximum number of requests in flight.
+    :param duration: Seconds to send requests for.
+    :param rate: Open loop arrival rate in requests per second or None for \
+    closed loop.
+    :param seed: Random seed for the arrival times.
+    :type url: str
+    :type next_request: Callable[[], Dict]
+    :type concurrency: int
+    :type duration: float
+    :type rate: float or None
+    :type seed: int
+    :return: List of (latency seconds, succeeded) tuples one for each \
+    request sent and the wall clock time the requests took to complete.
+    :rtype: tuple[list[tuple[float, bool]], float]
+    '''
+
+    results = []
+    results_lock = threading.Lock()
+    arrivals = queue.Queue()
+    start_time = time.time()
+    end_time = start_time + duration
+
+    def worker():
+        session = requests.Session()
+        while True:
+            if rate is None:
+                due_time = time.time()
+                if due_time >= end_time:
+                    return
+            else:
+                due_time = arrivals.get()
+                if due_time is None:
+                    return
+            succeeded = _send(session, url, next_request())
+            with results_lock:
+                results.append((time.time() - due_time, succeeded))
+
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for worker_thread in workers:
+        worker_thread.daemon = True
+        worker_thread.start()
+    if rate is not None:
+        rng = random.Random(seed)
+        due_time = start_time
+        while True:
+            due_time += rng.expovariate(rate)
+            if due_time >= end_time:
+                break
+            time.sleep(max(0, due_time - time.time()))
+            arrivals.put(due_time)
+        for _ in workers:
+            arrivals.put(None)
+    for worker_thread in workers:
+        worker_thread.join()
+    return results, time.time() - start_time
+
+
+def _summarise(results, wall_time, rate, concurrency):
+    '''
+    :param results: Latencies and whether each request succeeded see \
+    :py:func:`_run`
+    :param wall_time: Time in seconds the requests took to complete.
+    :param rate: Open loop arrival rate or None if closed loop.
+    :param concurrency: Maximum number of requests in flight.
+    :type results: list[tuple[float, bool]]
+    :type wall_time: float
+    :type rate: float or None
+    :type concurrency: int
+    :return: Throughput (successful requests per second), error rate and \
+    p50/p95/p99 latency in seconds of the successful requests.
+    :rtype: Dict
+    '''
+
+    latencies = [latency for latency, succeeded in results if succeeded]
+    num_errors = sum(1 for _, succeeded in results if not succeeded)
+    return OrderedDict([
+        ('rate', rate), ('concurrency', concurrency),
+        ('requests', len(results)),
+        ('throughput', len(latencies) / wall_time),
+        ('error_rate', num_errors / float(len(results)) if results else 0.0),
+        ('p50', percentile(latencies, 50)),
+        ('p95', percentile(latencies, 95)),
+        ('p99', percentile(latencies, 99))])
+
+
+def _free_port():
+    '''
+    :return: A port on localhost that is not in use.
+    :rtype: int
+    '''
+
+    free_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    free_socket.bind(('127.0.0.1', 0))
+    port = free_socket.getsockname()[1]
+    free_socket.close()
+    return port
+
+
+def start_server(port, threads, timeout=30):
+    '''
+    Starts the API server in a new process and waits until it accepts \
+    connections.
+
+    :param port: Port the server listens on.
+    :param threads: Number of threads the server uses.
+    :param timeout: Seconds to wait for the server to start.
+    :type port: int
+    :type threads: int
+    :type timeout: float
+    :return: The server process.
+    :rtype: subprocess.Popen
+    :raises SystemError: If the server does not start within the timeout.
+    '''
+
+    server_process = subprocess.Popen(
+        [sys.executable, '-m', 'tweebo.server', '--hostname', '127.0.0.1',
+         '--port', str(port), '--threads', str(threads)],
+        cwd=str(ROOT_DIR))
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        if server_process.poll() is not None:
+            break
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server_process
+        except socket.error:
+            time.sleep(0.1)
+    server_process.kill()
+    raise SystemError('The TweeboParser server did not start on port {}'
+                      .format(port))
+
+
+description = 'Load tests the TweeboParser API server'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--url', type=str,
+                    help='URL of an already running local server. If not '
+                         'given a server is started')
+parser.add_argument('--server-threads', type=int, default=4,
+                    help='Threads of the started server (default: 4)')
+parser.add_argument('--concurrency', type=int, default=8,
+                    help='Maximum number of requests in flight (default: 8)')
+parser.add_argument('--rates', type=float, nargs='+',
+                    help='Open loop arrival rates in requests per second to '
+                         'test. If not given the test is closed loop')
+parser.add_argument('--duration', type=float, default=30,
+                    help='Seconds to send requests for at each rate '
+                         '(default: 30)')
+parser.add_argument('--batch-size', type=int, default=1,
+                    help='Number of Tweets per request (default: 1)')
+parser.add_argument('--mix', type=_parse_mix,
+                    default=_parse_mix('short:1,medium:1,long:1'),
+                    help='Weights of the Tweet length classes (default: '
+                         'short:1,medium:1,long:1)')
+parser.add_argument('--output-type', type=str, default='conll',
+                    choices=['conll', 'stanford'])
+parser.add_argument('--slo', type=float, default=10.0,
+                    help='p99 latency in seconds above which the server is '
+                         'considered saturated (default: 10)')
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--output', type=str,
+                    help='JSON file to also write the results to')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    server_process = None
+    url = args.url
+    if url is None:
+        port = _free_port()
+        server_process = start_server(port, args.server_threads)
+        url = 'http://127.0.0.1:{}/'.format(port)
+    try:
+        next_request = _request_generator(args.mix, args.batch_size,
+                                          args.output_type, args.seed)
+        summaries = []
+        saturation_rate = None
+        for rate in (args.rates or [None]):
+            results, wall_time = _run(url, next_request, args.concurrency,
+                                      args.duration, rate, args.seed)
+            summary = _summarise(results, wall_time, rate, args.concurrency)
+            summaries.append(summary)
+            if rate is not None and saturation_rate is None:
+                p99 = summary['p99']
+                if summary['throughput'] < SATURATION_THROUGHPUT * rate or \
+                   p99 is None or p99 > args.slo:
+                    saturation_rate = rate
+        row_format = '{:>8}{:>10}{:>12}{:>8}{:>9}{:>9}{:>9}'
+        print(row_format.format('rate', 'requests', 'throughput', 'errors',
+                                'p50', 'p95', 'p99'))
+        for summary in summaries:
+            latencies = ['-' if summary[key] is None else
+                         '{:.3f}'.format(summary[key])
+                         for key in ['p50', 'p95', 'p99']]
+            print(row_format.format(
+                'closed' if summary['rate'] is None else summary['rate'],
+                summary['requests'],
+                '{:.3f}'.format(summary['throughput']),
+                '{:.1%}'.format(summary['error_rate']), *latencies))
+        if args.rates:
+            print('Saturation point: {}'.format(
+                '{} requests/s'.format(saturation_rate)
+                if saturation_rate is not None else
+                'not reached at the rates tested'))
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump({'url': url, 'batch_size': args.batch_size,
+                           'mix': args.mix, 'slo': args.slo,
+                           'saturation_rate': saturation_rate,
+                           'results': summaries}, output_file, indent=2)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
@@ -0,0 +1,233 @@
+'''
+Benchmarks the throughput and memory usage of :py:func:`tweebo.process_texts` \
+end to end, which requires the TweeboParser to be installed.
+
+The following corpora can be benchmarked:
+1. tweebank_train - Tweets from `Tweebank/Train_Test_Splited/train`
+2. tweebank_test - Tweets from `Tweebank/Train_Test_Splited/test`
+3. sherlock - Lines of `tests/test_data/sherlock_holmes_text_only.txt`
+
+Each corpus is parsed in batches of each of the batch sizes given. When the \
+batch size is larger than the corpus the corpus is repeated to fill the \
+batch. For each corpus and batch size the Tweets and tokens per second, the \
+time and CPU time of each stage and the peak resident set size of the \
+pipeline processes are written to a JSON results file together with \
+information about the machine, so that releases and configurations can be \
+compared on the same hardware. When more than one value of `--n-jobs` is \
+given each batch is also parsed with each number of parallel shards, to \
+show how throughput scales with the number of cores.
+
+Usage: python -m benchmarks.throughput_benchmark --output results.json
+'''
+
+import argparse
+from collections import OrderedDict
+import datetime
+import json
+import multiprocessing
+from pathlib import Path
+import platform
+import resource
+import subprocess
+import sys
+
+from tweebo import stages
+from tweebo.tweebo import process_texts
+
+ROOT_DIR = Path(__file__).absolute().parent.joinpath('..').resolve()
+
+
+def _read_conll_texts(conll_fp):
+    '''
+    :param conll_fp: CoNLL formatted file where each Tweet is seperated by \
+    an empty line.
+    :type conll_fp: Path
+    :return: The text of each Tweet, created by joining the tokens by spaces.
+    :rtype: list[str]
+    '''
+
+    texts = []
+    tokens = []
+    with conll_fp.open('r', encoding='utf-8') as conll_file:
+        for line in conll_file:
+            line = line.strip()
+            if line:
+                tokens.append(line.split('\t')[1])
+            elif tokens:
+                texts.append(u' '.join(tokens))
+                tokens = []
+    if tokens:
+        texts.append(u' '.join(tokens))
+    return texts
+
+
+def _read_line_texts(text_fp):
+    '''
+    :param text_fp: File with one text per line.
+    :type text_fp: Path
+    :return: The non-empty lines in the file.
+    :rtype: list[str]
+    '''
+
+    with text_fp.open('r', encoding='utf-8') as text_file:
+        return [line.strip() for line in text_file if line.strip()]
+
+
+CORPORA = OrderedDict([
+    ('tweebank_train', lambda: _read_conll_texts(
+        ROOT_DIR.joinpath('Tweebank', 'Train_Test_Splited', 'train'))),
+    ('tweebank_test', lambda: _read_conll_texts(
+        ROOT_DIR.joinpath('Tweebank', 'Train_Test_Splited', 'test'))),
+    ('sherlock', lambda: _read_line_texts(
+        ROOT_DIR.joinpath('tests', 'test_data',
+                          'sherlock_holmes_text_only.txt')))])
+
+
+def _batch(texts, batch_size):
+    '''
+    :param texts: Texts of a corpus
+    :param batch_size: Number of texts to return
+    :type texts: list[str]
+    :type batch_size: int
+    :return: The first batch_size texts, repeating the texts if there are \
+    fewer than batch_size of them.
+    :rtype: list[str]
+    '''
+
+    repeats = (batch_size // len(texts)) + 1
+    return (texts * repeats)[:batch_size]
+
+
+def _machine_info():
+    '''
+    :return: Information about the machine and code being benchmarked.
+    :rtype: Dict
+    '''
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=str(ROOT_DIR)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': datetime.datetime.utcnow().isoformat(),
+            'commit': commit,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': multiprocessing.cpu_count()}
+
+
+def _benchmark_batch(corpus, batch, repeats, n_jobs):
+    '''
+    :param corpus: Name of the corpus the batch is from.
+    :param batch: Texts to parse.
+    :param repeats: Number of times to parse the batch. The fastest run is \
+    reported.
+    :param n_jobs: See :py:func:`tweebo.process_texts`
+    :type corpus: str
+    :type batch: list[str]
+    :type repeats: int
+    :type n_jobs: int
+    :return: The result of the fastest run see :py:func:`benchmark`
+    :rtype: Dict
+    '''
+
+    best_report = None
+    for _ in range(repeats):
+        _, report = process_texts(batch, timing_report=True, n_jobs=n_jobs)
+        if best_report is None or \
+           report['wall_time'] < best_report['wall_time']:
+            best_report = report
+    stage_times = OrderedDict()
+    for info in best_report['stages']:
+        stage_time = stage_times.setdefault(
+            info['stage'], {'wall_time': 0.0, 'user_time': 0.0,
+                            'system_time': 0.0, 'max_rss': 0})
+        for key in ['wall_time', 'user_time', 'system_time']:
+            stage_time[key] += info[key]
+        stage_time['max_rss'] = max(stage_time['max_rss'], info['max_rss'])
+    wall_time = best_report['wall_time']
+    return OrderedDict([
+        ('corpus', corpus), ('batch_size', len(batch)), ('n_jobs', n_jobs),
+        ('tweets', best_report['tweets']),
+        ('tokens', best_report['tokens']),
+        ('wall_time', wall_time),
+        ('tweets_per_second', best_report['tweets'] / wall_time),
+        ('tokens_per_second', best_report['tokens'] / wall_time),
+        ('user_time', best_report['user_time']),
+        ('system_time', best_report['system_time']),
+        ('max_rss', best_report['max_rss']),
+        ('bytes_written', best_report['bytes_written']),
+        ('stages', stage_times)])
+
+
+def benchmark(corpora, batch_sizes, repeats, n_jobs=(1,)):
+    '''
+    :param corpora: Names of the corpora to benchmark see `CORPORA`
+    :param batch_sizes: Number of texts per call to \
+    :py:func:`tweebo.process_texts`
+    :param repeats: Number of times to parse each batch. The fastest run \
+    is reported.
+    :param n_jobs: Values of the `n_jobs` argument of \
+    :py:func:`tweebo.process_texts` to parse each batch with.
+    :type corpora: list[str]
+    :type batch_sizes: list[int]
+    :type repeats: int
+    :type n_jobs: list[int]
+    :return: A list of results, one for each corpus, batch size and \
+    n_jobs. Each \
+    result contains the keys of the report returned by \
+    :py:func:`tweebo.process_texts` when `timing_report` is True, with the \
+    stages as a dictionary of stage name to the stage's timings summed over \
+    the shards, and the following additional keys: `corpus`, `batch_size`, \
+    `n_jobs`, `tweets_per_second` and `tokens_per_second`
+    :rtype: list[Dict]
+    '''
+
+    results = []
+    for corpus in corpora:
+        texts = CORPORA[corpus]()
+        for batch_size in batch_sizes:
+            batch = _batch(texts, batch_size)
+            for jobs in n_jobs:
+                results.append(_benchmark_batch(corpus, batch, repeats, jobs))
+                sys.stderr.write('{} batch size {} n_jobs {}: {:.1f} Tweets/s '
+                                 '{:.1f} tokens/s\n'.format(
+                                     corpus, batch_size, jobs,
+                                     results[-1]['tweets_per_second'],
+                                     results[-1]['tokens_per_second']))
+    return results
+
+
+description = 'Benchmarks the throughput and memory usage of the '\
+              'TweeboParser pipeline'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--corpora', nargs='+', choices=list(CORPORA),
+                    default=list(CORPORA),
+                    help='Corpora to benchmark (default: all)')
+parser.add_argument('--batch-sizes', type=int, nargs='+',
+                    default=[1, 10, 100, 1000, 10000],
+                    help='Number of texts per call to process_texts '
+                         '(default: 1 10 100 1000 10000)')
+parser.add_argument('--repeats', type=int, default=1,
+                    help='Number of times each batch is parsed, the fastest '
+                         'run is reported (default: 1)')
+parser.add_argument('--n-jobs', type=int, nargs='+', default=[1],
+                    help='Number of parallel shards to parse each batch '
+                         'with, e.g. 1 2 4 8 to measure scaling (default: 1)')
+parser.add_argument('--output', type=str, default='benchmark_results.json',
+                    help='JSON file to write the results to (default: '
+                         'benchmark_results.json)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    benchmark_results = benchmark(args.corpora, args.batch_sizes,
+                                  args.repeats, args.n_jobs)
+    self_max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output = OrderedDict([('machine', _machine_info()),
+                          ('stages', stages.STAGES),
+                          ('benchmark_max_rss',
+                           self_max_rss * stages.MAX_RSS_UNIT),
+                          ('results', benchmark_results)])
+    with open(args.output, 'w') as output_file:
+        json.dump(output, output_file, indent=2)
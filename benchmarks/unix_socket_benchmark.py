@@ -0,0 +1,174 @@
+'''
+Benchmarks the latency of small requests to the API server in \
+:py:mod:`tweebo.server` over its Unix domain socket, see \
+:py:mod:`tweebo.unix_socket`, against JSON over HTTP on TCP.
+
+The HTTP server and the Unix socket server run in threads of this process \
+and each sends its requests one after the other over one connection that is \
+kept open. By default the pipeline is replaced by the parse of the test \
+Tweets in `tests/test_data/tweets.txt.predict`, as in \
+:py:mod:`benchmarks.wire_format_benchmark`, so that the overhead of each \
+transport is measured on its own and the TweeboParser does not have to be \
+installed. With `--parse` the Tweets are parsed by the TweeboParser, which \
+shows the overhead relative to the pipeline.
+
+Usage: python -m benchmarks.unix_socket_benchmark --batch-sizes 1 5 10
+'''
+
+import argparse
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+from waitress.server import create_server
+
+from tweebo import server, unix_socket
+from tweebo.tweebo import _timing_report, _to_conll, _to_stanford
+
+TEST_DATA_DIR = Path(__file__).absolute().parent.joinpath(
+    '..', 'tests', 'test_data').resolve()
+
+
+def _batch(items, batch_size):
+    '''
+    :return: The items repeated until there are batch_size of them.
+    :rtype: list
+    '''
+
+    repeats = (batch_size // len(items)) + 1
+    return (items * repeats)[:batch_size]
+
+
+def _stored_process_texts():
+    '''
+    :return: A stand in for :py:func:`tweebo.process_texts` that returns the \
+    stored parse of the test Tweets, repeated to the number of texts.
+    :rtype: Callable
+    '''
+
+    predict_fp = TEST_DATA_DIR.joinpath('tweets.txt.predict')
+    outputs = {'conll': _to_conll(predict_fp),
+               'stanford': _to_stanford(predict_fp)}
+
+    def process_texts(texts, output_type='conll', **kwargs):
+        start_time = time.time()
+        processed_texts = _batch(outputs[output_type], len(texts))
+        return processed_texts, _timing_report([], processed_texts,
+                                               output_type, start_time, 0)
+
+    return process_texts
+
+
+def _percentile(latencies, percent):
+    latencies = sorted(latencies)
+    index = int(round(percent / 100.0 * (len(latencies) - 1)))
+    return latencies[index]
+
+
+def benchmark(batch_sizes, num_requests, output_type='conll', parse=False):
+    '''
+    :param batch_sizes: Number of Tweets in each request to benchmark.
+    :param num_requests: Number of requests sent for each batch size over \
+    each transport, after one request to warm up.
+    :param output_type: Either `conll` or `stanford`
+    :param parse: Whether the Tweets are parsed by the TweeboParser rather \
+    than the stored parse being returned.
+    :type batch_sizes: list[int]
+    :type num_requests: int
+    :type output_type: str
+    :type parse: bool
+    :return: A list of dicts with the following keys: `batch_size`, \
+    `transport`, `mean_ms`, `p50_ms` and `p99_ms`
+    :rtype: list[Dict]
+    '''
+
+    if not parse:
+        server.process_texts = _stored_process_texts()
+    with TEST_DATA_DIR.joinpath('tweets.txt').open('r',
+                                                   encoding='utf-8') as texts:
+        tweets = [tweet.strip() for tweet in texts if tweet.strip()]
+
+    http_server = create_server(server.app, host='127.0.0.1', port=0)
+    http_thread = threading.Thread(target=http_server.run)
+    http_thread.daemon = True
+    http_thread.start()
+    url = 'http://127.0.0.1:{}'.format(http_server.effective_port)
+    temp_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(temp_dir, 'tweebo.sock')
+    socket_server = unix_socket.serve_in_background(socket_path,
+                                                    server._socket_request)
+    session = requests.Session()
+    socket_client = unix_socket.UnixSocketClient(socket_path)
+
+    def send_http(texts):
+        response = session.post(url, json={'texts': texts,
+                                           'output_type': output_type})
+        response.raise_for_status()
+        return response.json()
+
+    def send_socket(texts):
+        return socket_client.parse(texts, output_type)
+
+    results = []
+    try:
+        for batch_size in batch_sizes:
+            texts = _batch(tweets, batch_size)
+            for transport, send in [('http+json', send_http),
+                                    ('unix+msgpack', send_socket)]:
+                send(texts)
+                latencies = []
+                for _ in range(num_requests):
+                    start_time = time.time()
+                    send(texts)
+                    latencies.append((time.time() - start_time) * 1000)
+                results.append({'batch_size': batch_size,
+                                'transport': transport,
+                                'mean_ms': sum(latencies) / len(latencies),
+                                'p50_ms': _percentile(latencies, 50),
+                                'p99_ms': _percentile(latencies, 99)})
+    finally:
+        session.close()
+        socket_client.close()
+        socket_server.shutdown()
+        socket_server.server_close()
+        http_server.close()
+        shutil.rmtree(temp_dir)
+    return results
+
+
+description = 'Benchmarks the Unix domain socket of the TweeboParser API '\
+              'server against HTTP'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 5, 10],
+                    help='Number of Tweets per request (default: 1 5 10)')
+parser.add_argument('--requests', type=int, default=200,
+                    help='Number of requests sent for each batch size over '
+                         'each transport (default: 200)')
+parser.add_argument('--output-type', choices=['conll', 'stanford'],
+                    default='conll',
+                    help='Output type of the requests (default: conll)')
+parser.add_argument('--parse', action='store_true',
+                    help='Parse the Tweets with the TweeboParser instead of '
+                         'returning the stored parse')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    row_format = '{:>8}  {:<14}{:>10}{:>10}{:>10}{:>10}'
+    print(row_format.format('tweets', 'transport', 'mean ms', 'p50 ms',
+                            'p99 ms', 'mean %'))
+    http_means = {}
+    for result in benchmark(args.batch_sizes, args.requests,
+                            args.output_type, args.parse):
+        if result['transport'] == 'http+json':
+            http_means[result['batch_size']] = result['mean_ms']
+        relative_mean = 100.0 * result['mean_ms'] / \
+            http_means[result['batch_size']]
+        print(row_format.format(result['batch_size'], result['transport'],
+                                '{:.3f}'.format(result['mean_ms']),
+                                '{:.3f}'.format(result['p50_ms']),
+                                '{:.3f}'.format(result['p99_ms']),
+                                '{:.1f}'.format(relative_mean)))
@@ -0,0 +1,116 @@
+'''
+Benchmarks the encode time and payload size of the wire formats the API \
+server in :py:mod:`tweebo.server` can respond with, against the default \
+`jsonify` path.
+
+The Stanford styled output is created from the parse of the test Tweets in \
+`tests/test_data/tweets.txt.predict` so the TweeboParser does not have to be \
+installed to run this benchmark. The Tweets are repeated to create batches \
+of the requested sizes, therefore the gzip payload sizes of the larger \
+batches are smaller than they would be for batches of unique Tweets.
+
+Usage: python -m benchmarks.wire_format_benchmark --batch-sizes 1 100 1000
+'''
+
+import argparse
+from pathlib import Path
+import timeit
+
+from tweebo import server
+from tweebo.tweebo import _to_conll, _to_stanford
+
+
+def _encode_jsonify(data):
+    with server.app.test_request_context():
+        return server.jsonify(data).get_data()
+
+
+def _encode_json_gzip(data):
+    return server._gzip_compress(_encode_jsonify(data))
+
+
+def _encode_msgpack(data):
+    return server.msgpack.packb(data, use_bin_type=True)
+
+
+def _encode_msgpack_gzip(data):
+    return server._gzip_compress(_encode_msgpack(data))
+
+
+ENCODERS = [('jsonify', _encode_jsonify), ('json+gzip', _encode_json_gzip),
+            ('msgpack', _encode_msgpack),
+            ('msgpack+gzip', _encode_msgpack_gzip)]
+
+
+def _batch(parsed_tweets, batch_size):
+    '''
+    :param parsed_tweets: Output of the TweeboParser for a few Tweets
+    :param batch_size: Number of Tweets to return
+    :type parsed_tweets: list
+    :type batch_size: int
+    :return: The parsed_tweets repeated until there are batch_size of them.
+    :rtype: list
+    '''
+
+    repeats = (batch_size // len(parsed_tweets)) + 1
+    return (parsed_tweets * repeats)[:batch_size]
+
+
+def benchmark(batch_sizes, repeats):
+    '''
+    :param batch_sizes: Number of Tweets in each batch to benchmark
+    :param repeats: Number of times to encode each batch. The fastest time is \
+    reported.
+    :type batch_sizes: list[int]
+    :type repeats: int
+    :return: A list of dicts with the following keys: `output_type`, \
+    `batch_size`, `encoding`, `encode_ms` and `size_bytes`
+    :rtype: list[Dict]
+    '''
+
+    this_dir = Path(__file__).absolute().parent.resolve()
+    predict_fp = this_dir.joinpath('..', 'tests', 'test_data',
+                                   'tweets.txt.predict').resolve()
+    outputs = [('conll', _to_conll(predict_fp)),
+               ('stanford', _to_stanford(predict_fp))]
+    results = []
+    for output_type, parsed_tweets in outputs:
+        for batch_size in batch_sizes:
+            data = _batch(parsed_tweets, batch_size)
+            for encoding, encoder in ENCODERS:
+                encode_time = min(timeit.repeat(lambda: encoder(data),
+                                                number=1, repeat=repeats))
+                results.append({'output_type': output_type,
+                                'batch_size': batch_size,
+                                'encoding': encoding,
+                                'encode_ms': encode_time * 1000,
+                                'size_bytes': len(encoder(data))})
+    return results
+
+
+description = 'Benchmarks the wire formats of the TweeboParser API server'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--batch-sizes', type=int, nargs='+',
+                    default=[1, 10, 100, 1000],
+                    help='Number of Tweets per response (default: 1 10 100 '
+                         '1000)')
+parser.add_argument('--repeats', type=int, default=5,
+                    help='Number of times each batch is encoded, the fastest '
+                         'time is reported (default: 5)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    row_format = '{:<10}{:>8}  {:<14}{:>12}{:>14}{:>9}'
+    print(row_format.format('output', 'tweets', 'encoding', 'encode ms',
+                            'size bytes', 'size %'))
+    jsonify_sizes = {}
+    for result in benchmark(args.batch_sizes, args.repeats):
+        key = (result['output_type'], result['batch_size'])
+        if result['encoding'] == 'jsonify':
+            jsonify_sizes[key] = result['size_bytes']
+        relative_size = 100.0 * result['size_bytes'] / jsonify_sizes[key]
+        print(row_format.format(result['output_type'], result['batch_size'],
+                                result['encoding'],
+                                '{:.3f}'.format(result['encode_ms']),
+                                result['size_bytes'],
+                                '{:.1f}'.format(relative_size)))
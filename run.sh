@@ -48,9 +48,50 @@ function cleanup {
 trap cleanup EXIT
 
 
+# --stream connects the tagging, conversion, Brown Clustering and token
+# selection steps with pipes so that they run at the same time, each of the
+# Python steps writing a sentence as soon as it has read it, and writes the
+# parse straight to the output file.
+STREAM=false
+if [ "$1" == "--stream" ]; then
+  STREAM=true
+  shift
+fi
+
 # To run the parser:
 if [ "$#" -ne 1 ]; then
-    echo "Usage: ./run.sh [path_to_raw_input_file_one_sentence_a_line]"
+    echo "Usage: ./run.sh [--stream] [path_to_raw_input_file_one_sentence_a_line]"
+elif [ "$STREAM" = true ]; then
+  INPUT_FILE=$1
+  # The output is written to the same place as below where it is copied
+  # after changing to ROOT_DIR
+  if [[ "$INPUT_FILE" = /* ]]; then
+    OUTPUT_FILE="${INPUT_FILE}.predict"
+  else
+    OUTPUT_FILE="${ROOT_DIR}/${INPUT_FILE}.predict"
+  fi
+  # Fail if any of the piped steps fail, not only the last
+  set -o pipefail
+
+  # --> Tag, convert to CoNLL, append the Brown Clusters and the token
+  # selections in one pipeline. Only the token selection output is written
+  # to disk as both parser runs read it.
+  ${TAGGER_DIR}/runTagger.sh --model ${MODEL_DIR}/tagging_model --output-format conll ${INPUT_FILE} \
+    | python ${SCRIPT_DIR}/ConvertFromTaggingResToConll.py /dev/stdin \
+    | python ${SCRIPT_DIR}/AugumentBrownClusteringFeature46.py ${MODEL_DIR}/twitter_brown_clustering_full /dev/stdin N \
+    | python ${TOKENSEL_DIR}/pipeline.py /dev/stdin ${MODEL_DIR}/tokensel_weights > ${WORKING_DIR}/test \
+    || exit 1
+
+  # -- Start Parsing. TurboParser reads its input file more than once so
+  # the two runs cannot be piped.
+  cd ${PARSER_DIR}
+  export LD_LIBRARY_PATH="$LD_LIBRARY_PATH:`pwd;`/deps/local/lib:"
+  mkdir ${WORKING_DIR}/test_score
+
+  ./TurboParser --test --file_model=${MODEL_DIR}/ptb_parsing_model --file_test=${WORKING_DIR}/test --file_prediction=${WORKING_DIR}/ptb_single_predict_test --output_posterior=true --use_posterior=false --posterior_dir=${WORKING_DIR}/test_score || exit 1
+
+  # --> Write the final results straight to the output file.
+  ./TurboParser --test --file_model=${MODEL_DIR}/parsing_model --file_test=${WORKING_DIR}/test --file_prediction=${OUTPUT_FILE} --output_posterior=false --use_posterior=true --posterior_dir=${WORKING_DIR}/test_score || exit 1
 else
   # Starting point:
   # -- Raw text tweets, one line per tweet.
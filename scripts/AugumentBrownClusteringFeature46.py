@@ -61,6 +61,8 @@ if __name__ == "__main__":
         line = line.strip()
         if line == "":
             sys.stdout.write("\n")
+            # The next stage can start on the sentence straight away
+            sys.stdout.flush()
             continue
         cvlist = line.split("\t")
         if sys.argv[3] == "N":
@@ -30,12 +30,13 @@ A = parser.parse_args()
 
 
 def read_corpus(filename):
+    # Yields each sentence as soon as it has been read, so that when the
+    # input is piped from the tagger the output starts before the input ends
     f = codecs.open(filename, "r", "utf-8")
-    corpus = []
     sentence = []
     for line in f:
         if line.strip() == "":
-            corpus.append(sentence)
+            yield sentence
             sentence = []
             continue
         else:
@@ -43,7 +44,6 @@ def read_corpus(filename):
             cline = line.split(u"\t")
             sentence.append(cline)
     f.close()
-    return corpus
 
 def print_sentence(sentence, outputf):
     for line in sentence:
@@ -69,12 +69,8 @@ def convert_sentence(sen):
 if __name__ == '__main__':
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout)
     #sys.stdout = io.TextIOWrapper(sys.stdout.detach(), encoding='UTF-8', line_buffering=True)   #Ref: https://wiki.python.org/moin/PortingToPy3k/BilingualQuickRef#codecs
-    corpus = read_corpus(A.inputf)
-
-    conll_format_corpus = []
-    for sen in corpus:
-        conll_format_corpus.append(convert_sentence(sen))
-
-    for sen in conll_format_corpus:
-        print_sentence(sen, sys.stdout)
+    for sen in read_corpus(A.inputf):
+        print_sentence(convert_sentence(sen), sys.stdout)
+        # The next stage can start on the sentence straight away
+        sys.stdout.flush()
 
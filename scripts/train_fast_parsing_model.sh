@@ -0,0 +1,20 @@
+# This script trains the model used by the fast parsing mode, which parses in
+# a single pass without the posteriors of the PTB model as features. It is
+# trained on the Tweebank train split and written to
+# pretrained_models/fast_parsing_model. Any arguments are passed on to
+# TurboParser e.g. --model_type=basic --train_epochs=5
+
+ROOT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )/.." && pwd )"
+PARSER_DIR="${ROOT_DIR}/TBParser"
+MODEL_DIR="${ROOT_DIR}/pretrained_models"
+TRAIN_FILE="${ROOT_DIR}/Tweebank/Train_Test_Splited/train"
+
+cd ${PARSER_DIR}
+export LD_LIBRARY_PATH="$LD_LIBRARY_PATH:`pwd;`/deps/local/lib:"
+
+./TurboParser --train --file_train=${TRAIN_FILE} --file_model=${MODEL_DIR}/fast_parsing_model --output_posterior=false --use_posterior=false "$@" || exit 1
+
+# --> Measure the accuracy of the fast mode against the full pipeline on the
+# Tweebank test split.
+echo "Trained ${MODEL_DIR}/fast_parsing_model, to measure its accuracy run:"
+echo "python -m tweebo.evaluate --modes full fast"
@@ -0,0 +1,253 @@
+'''
+Tests the functions and classes within :py:mod:`tweebo.admission`, none of \
+which require the TweeboParser to be installed. The test functions within \
+this module are the following:
+1. test_estimate_tokens -- tests that tokens are estimated for each input \
+format.
+2. test_admission_controller -- tests that requests run up to the pipeline \
+limit, wait in order in the queue and are rejected when the queue is full.
+3. test_priority_lanes -- tests that interactive requests are admitted \
+before bulk requests and that reserved pipelines are only used by their \
+lane.
+4. test_admission_deadline -- tests that a request still waiting at its \
+deadline leaves the queue with QueueTimeout.
+5. test_admission_controller_exceptions -- tests that ValueError is raised \
+for invalid limits, reserved pipelines and lanes.
+6. test_request_too_large -- tests that a request larger than the queue is \
+rejected with RequestTooLarge rather than QueueFull.
+'''
+
+import threading
+import time
+
+import pytest
+
+from tweebo import admission
+
+
+def test_estimate_tokens():
+    '''
+    Tests :py:func:`tweebo.admission.estimate_tokens` on raw text, CoNLL \
+    Strings and tagged Tweets.
+    '''
+
+    assert admission.estimate_tokens([u'I win :)', u'', u' a  b ']) == 5
+    assert admission.estimate_tokens([u'I\tO\n\nwin\tV\n'], 'conll') == 2
+    assert admission.estimate_tokens([[(u'I', u'O')], []], 'tagged') == 1
+
+
+def test_admission_controller():
+    '''
+    Tests :py:class:`tweebo.admission.AdmissionController` with 1 pipeline \
+    and a queue of 3 requests or 3 Tweets:
+    1. The first request is admitted without waiting.
+    2. Requests that arrive while it runs wait and are admitted in the \
+    order they arrived once it finishes.
+    3. A request that would go over the Tweet limit, or the request limit, \
+    is rejected with a retry after of at least 1 second.
+    4. Nothing is running or queued once every request has finished.
+    5. Without a request limit a request waits in the queue rather than \
+    being rejected.
+    '''
+
+    controller = admission.AdmissionController(1, 3, max_queued_tweets=3)
+    order = []
+    errors = []
+
+    def run_request(name, tweets):
+        try:
+            with controller.admit(tweets, tweets) as wait:
+                order.append((name, wait))
+                time.sleep(0.05)
+        except Exception as error:
+            errors.append(error)
+
+    with controller.admit(1, 1) as wait:
+        assert wait < 0.05
+        assert controller.running() == 1
+        threads = []
+        for name, tweets in [('second', 2), ('third', 1)]:
+            thread = threading.Thread(target=run_request,
+                                      args=(name, tweets))
+            thread.start()
+            threads.append(thread)
+            # Ensures the requests are queued in order
+            while controller.queued_requests() < len(threads):
+                time.sleep(0.01)
+        assert controller.queued_tweets() == 3
+        assert controller.queued_tokens() == 3
+        with pytest.raises(admission.QueueFull) as queue_full:
+            with controller.admit(1, 1):
+                pass
+        assert queue_full.value.retry_after >= 1
+        assert 'Tweets' in str(queue_full.value)
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert [name for name, _ in order] == ['second', 'third']
+    assert order[1][1] > order[0][1]
+    assert controller.running() == 0
+    assert controller.queued_requests() == 0
+    assert controller.queued_tweets() == 0
+
+    controller = admission.AdmissionController(1, 0)
+    with controller.admit(1, 1):
+        with pytest.raises(admission.QueueFull) as queue_full:
+            with controller.admit(1, 1):
+                pass
+        assert 'requests' in str(queue_full.value)
+
+    controller = admission.AdmissionController(1, None)
+    with controller.admit(1, 1):
+        with pytest.raises(admission.QueueTimeout):
+            with controller.admit(1, 1, deadline=time.time() + 0.05):
+                pass
+
+
+def test_priority_lanes():
+    '''
+    Tests the priority lanes of \
+    :py:class:`tweebo.admission.AdmissionController`:
+    1. With 1 shared pipeline, a waiting interactive request is admitted \
+    before a bulk request that arrived earlier.
+    2. With 1 pipeline reserved for each lane and 1 shared, a bulk request \
+    cannot use the interactive pipeline, so bulk requests wait once the \
+    bulk and shared pipelines are busy while an interactive request runs \
+    straight away, and an interactive request cannot use the bulk pipeline.
+    3. The queues of each lane are counted and limited separately.
+    '''
+
+    controller = admission.AdmissionController(1, 2)
+    order = []
+
+    def run_request(name, lane):
+        with controller.admit(1, 1, lane):
+            order.append(name)
+
+    with controller.admit(1, 1, 'bulk'):
+        threads = []
+        for name, lane in [('bulk', 'bulk'), ('interactive', 'interactive')]:
+            thread = threading.Thread(target=run_request, args=(name, lane))
+            thread.start()
+            threads.append(thread)
+            while controller.queued_requests(lane) < 1:
+                time.sleep(0.01)
+        assert controller.queued_requests() == 2
+    for thread in threads:
+        thread.join()
+    assert order == ['interactive', 'bulk']
+
+    controller = admission.AdmissionController(
+        3, 0, reserved_pipelines={'interactive': 1, 'bulk': 1})
+    with controller.admit(1, 1, 'bulk'), controller.admit(1, 1, 'bulk'):
+        with pytest.raises(admission.QueueFull) as queue_full:
+            with controller.admit(1, 1, 'bulk'):
+                pass
+        assert 'bulk lane' in str(queue_full.value)
+        with controller.admit(1, 1, 'interactive') as wait:
+            assert wait < 0.05
+            assert controller.running('interactive') == 1
+            assert controller.running() == 3
+    with controller.admit(1, 1, 'interactive'), \
+            controller.admit(1, 1, 'interactive'):
+        with pytest.raises(admission.QueueFull):
+            with controller.admit(1, 1, 'interactive'):
+                pass
+        with controller.admit(1, 1, 'bulk'):
+            assert controller.running('bulk') == 1
+    assert controller.running() == 0
+
+
+def test_admission_deadline():
+    '''
+    Tests the deadline of :py:meth:`tweebo.admission.AdmissionController.\
+    admit` with 1 pipeline:
+    1. A request that is still waiting at its deadline raises QueueTimeout \
+    and is removed from the queue.
+    2. A request admitted before its deadline runs.
+    '''
+
+    controller = admission.AdmissionController(1, 2)
+    with controller.admit(1, 1):
+        start_time = time.time()
+        with pytest.raises(admission.QueueTimeout):
+            with controller.admit(2, 2, deadline=start_time + 0.1):
+                pass
+        assert 0.05 < time.time() - start_time < 5
+        assert controller.queued_requests() == 0
+        assert controller.queued_tweets() == 0
+        assert controller.queued_tokens() == 0
+    with controller.admit(1, 1, deadline=time.time() - 1):
+        assert controller.running() == 1
+    assert controller.running() == 0
+
+
+def test_admission_controller_exceptions():
+    '''
+    Tests that :py:class:`tweebo.admission.AdmissionController` raises \
+    ValueError when the number of pipelines is not positive, a queue \
+    limit is negative, more pipelines are reserved than exist, a reserved \
+    lane does not exist or a request is in a lane that does not exist.
+    '''
+
+    with pytest.raises(ValueError):
+        admission.AdmissionController(0, 1)
+    with pytest.raises(ValueError):
+        admission.AdmissionController(1, -1)
+    with pytest.raises(ValueError):
+        admission.AdmissionController(1, 1, max_queued_tokens=-1)
+    with pytest.raises(ValueError):
+        admission.AdmissionController(1, 1, reserved_pipelines={'bulk': -1})
+    with pytest.raises(ValueError):
+        admission.AdmissionController(
+            2, 1, reserved_pipelines={'interactive': 2, 'bulk': 1})
+    with pytest.raises(ValueError):
+        admission.AdmissionController(2, 1, reserved_pipelines={'batch': 1})
+    with pytest.raises(ValueError):
+        with admission.AdmissionController(1, 1).admit(1, 1, 'batch'):
+            pass
+
+
+def test_request_too_large():
+    '''
+    Tests :py:meth:`tweebo.admission.AdmissionController.admit` with 1 \
+    pipeline, a queue of at most 3 Tweets and 10 tokens:
+    1. A request with more Tweets or more tokens than the queue can hold \
+    raises RequestTooLarge, even when a pipeline is free.
+    2. A request that fits the queue exactly runs.
+    3. While the pipeline is busy, a request too large for the queue \
+    raises RequestTooLarge and one that only does not fit the Tweets \
+    already queued raises QueueFull.
+    '''
+
+    controller = admission.AdmissionController(1, 2, max_queued_tweets=3,
+                                               max_queued_tokens=10)
+    with pytest.raises(admission.RequestTooLarge):
+        with controller.admit(4, 4):
+            pass
+    with pytest.raises(admission.RequestTooLarge):
+        with controller.admit(1, 11):
+            pass
+    assert controller.running() == 0
+    with controller.admit(3, 10):
+        assert controller.running() == 1
+
+    def run_request():
+        with controller.admit(2, 2):
+            pass
+
+    waiting_thread = threading.Thread(target=run_request)
+    with controller.admit(1, 1):
+        waiting_thread.start()
+        while controller.queued_requests() < 1:
+            time.sleep(0.01)
+        with pytest.raises(admission.RequestTooLarge) as too_large:
+            with controller.admit(4, 4):
+                pass
+        assert 'Tweets' in str(too_large.value)
+        with pytest.raises(admission.QueueFull):
+            with controller.admit(2, 2):
+                pass
+    waiting_thread.join()
+    assert controller.running() == 0
+    assert controller.queued_tweets() == 0
@@ -0,0 +1,192 @@
+'''
+Tests the functions within :py:mod:`tweebo.bulk`. The test functions within \
+this module are the following:
+1. test_read_chunks -- tests that the input file is read in chunks of lines.
+2. test_count_lines -- tests that lines are counted with and without a new \
+line at the end of the file.
+3. test_load_manifest -- tests that a manifest is only resumed from when it \
+was created with the same settings.
+4. test_parse_corpus -- tests that a corpus is parsed in chunks and that a \
+run resumes by only parsing the chunks missing from the manifest. Requires \
+the TweeboParser to be installed.
+5. test_parse_corpus_isolate_errors -- tests that the texts the pipeline \
+fails on are written to the chunk's errors file and recorded in the \
+manifest, with a stand in for the pipeline.
+'''
+
+import io
+import json
+from pathlib import Path
+import shutil
+import tempfile
+
+import pytest
+
+from tweebo import bulk, tweebo
+import tweebo_test
+
+THIS_DIR = Path(__file__).absolute().parent
+TWEETS_FP = THIS_DIR.joinpath('test_data', 'tweets.txt')
+
+
+def _write_lines(file_path, text):
+    with io.open(str(file_path), 'w', encoding='utf-8') as text_file:
+        text_file.write(text)
+
+
+def test_read_chunks():
+    '''
+    Tests :py:func:`tweebo.bulk.read_chunks`:
+    1. 5 lines in chunks of 2 gives 3 chunks, the last with 1 line, with the \
+    index of the chunk and of its first line.
+    2. Empty lines are kept so the output lines up with the input.
+    3. Lines end at a line feed, with or without a carriage return before \
+    it, but not at a lone carriage return, so there are as many texts as \
+    :py:func:`tweebo.bulk.count_lines` counts.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_fp = Path(temp_dir, 'input.txt')
+        _write_lines(input_fp, u'a\nb\n\nd\ne')
+        chunks = list(bulk.read_chunks(input_fp, 2))
+        _write_lines(input_fp, u'a\rb\r\nc\n\r\nd\r')
+        windows_chunks = list(bulk.read_chunks(input_fp, 10))
+        num_lines = bulk.count_lines(input_fp)
+    finally:
+        shutil.rmtree(temp_dir)
+    assert chunks == [(0, 0, [u'a', u'b']), (1, 2, [u'', u'd']),
+                      (2, 4, [u'e'])]
+    assert windows_chunks == [(0, 0, [u'a\rb', u'c', u'', u'd\r'])]
+    assert num_lines == 4
+
+
+def test_count_lines():
+    '''
+    Tests :py:func:`tweebo.bulk.count_lines` on files with and without a new \
+    line at the end and on an empty file.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_fp = Path(temp_dir, 'input.txt')
+        _write_lines(input_fp, u'a\nb\n')
+        assert bulk.count_lines(input_fp) == 2
+        _write_lines(input_fp, u'a\nb\nc')
+        assert bulk.count_lines(input_fp) == 3
+        _write_lines(input_fp, u'')
+        assert bulk.count_lines(input_fp) == 0
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_load_manifest():
+    '''
+    Tests :py:func:`tweebo.bulk.load_manifest`:
+    1. A new manifest with no chunks is returned when there is no manifest.
+    2. An existing manifest with the same settings is returned.
+    3. ValueError is raised when the existing manifest has a different \
+    chunk size or output type.
+    '''
+
+    output_dir = Path(tempfile.mkdtemp())
+    try:
+        manifest = bulk.load_manifest(output_dir, TWEETS_FP, 2, 'conll')
+        assert manifest['chunks'] == {}
+        assert manifest['input_size'] == TWEETS_FP.stat().st_size
+        assert not manifest['complete']
+
+        manifest['chunks']['0'] = {'file': bulk.chunk_name(0),
+                                   'first_line': 0, 'texts': 2,
+                                   'seconds': 1.0}
+        with output_dir.joinpath(bulk.MANIFEST_NAME).open('wb') as \
+                manifest_file:
+            json.dump(manifest, manifest_file)
+        resumed = bulk.load_manifest(output_dir, TWEETS_FP, 2, 'conll')
+        assert list(resumed['chunks']) == ['0']
+        with pytest.raises(ValueError):
+            bulk.load_manifest(output_dir, TWEETS_FP, 3, 'conll')
+        with pytest.raises(ValueError):
+            bulk.load_manifest(output_dir, TWEETS_FP, 2, 'stanford')
+    finally:
+        shutil.rmtree(str(output_dir))
+
+
+def test_parse_corpus():
+    '''
+    Tests :py:func:`tweebo.bulk.parse_corpus` on the 3 Tweets in \
+    `tests/test_data/tweets.txt` in chunks of 2 Tweets parsed in parallel:
+    1. The chunks contain the same output as :py:func:`tweebo.process_texts`
+    2. The manifest records both chunks and that the run is complete.
+    3. Resuming after removing the second chunk from the manifest only \
+    parses the second chunk again.
+    '''
+
+    with TWEETS_FP.open('r', encoding='utf-8') as tweets_file:
+        texts = [line.rstrip(u'\n') for line in tweets_file]
+    expected_output = tweebo.process_texts(texts)
+
+    output_dir = Path(tempfile.mkdtemp())
+    try:
+        manifest = bulk.parse_corpus(TWEETS_FP, output_dir, chunk_size=2,
+                                     jobs=2, progress_file=None)
+        assert manifest['complete']
+        assert sorted(manifest['chunks']) == ['0', '1']
+        output = []
+        for chunk_index in range(2):
+            chunk_fp = output_dir.joinpath(bulk.chunk_name(chunk_index))
+            with chunk_fp.open('r', encoding='utf-8') as chunk_file:
+                output.extend(json.loads(line) for line in chunk_file)
+        assert output == expected_output
+
+        first_chunk_fp = output_dir.joinpath(bulk.chunk_name(0))
+        first_chunk_mtime = first_chunk_fp.stat().st_mtime
+        del manifest['chunks']['1']
+        with output_dir.joinpath(bulk.MANIFEST_NAME).open('wb') as \
+                manifest_file:
+            json.dump(manifest, manifest_file)
+        manifest = bulk.parse_corpus(TWEETS_FP, output_dir, chunk_size=2,
+                                     progress_file=None)
+        assert sorted(manifest['chunks']) == ['0', '1']
+        assert first_chunk_fp.stat().st_mtime == first_chunk_mtime
+    finally:
+        shutil.rmtree(str(output_dir))
+
+
+def test_parse_corpus_isolate_errors(monkeypatch):
+    '''
+    Tests :py:func:`tweebo.bulk.parse_corpus` with isolate_errors on 5 \
+    lines in chunks of 3 where the pipeline fails on the line containing \
+    `BAD` see :py:func:`tweebo_test._failing_process_file`:
+    1. The failed line is `null` in its chunk and the other lines are \
+    parsed.
+    2. The chunk's errors file contains the line number and text of the \
+    failed line, and the manifest records it.
+    3. The chunk without failures has no errors file.
+    '''
+
+    monkeypatch.setattr(tweebo, '_process_file',
+                        tweebo_test._failing_process_file)
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        input_fp = temp_dir.joinpath('input.txt')
+        _write_lines(input_fp, u'a\nb\nc\nd BAD\ne')
+        output_dir = temp_dir.joinpath('output')
+        manifest = bulk.parse_corpus(input_fp, output_dir, chunk_size=3,
+                                     progress_file=None, isolate_errors=True)
+        assert manifest['chunks']['0']['failed_texts'] == 0
+        assert manifest['chunks']['0']['errors_file'] is None
+        assert manifest['chunks']['1']['failed_texts'] == 1
+        errors_fp = output_dir.joinpath(bulk.chunk_errors_name(1))
+        assert manifest['chunks']['1']['errors_file'] == errors_fp.name
+        assert not output_dir.joinpath(bulk.chunk_errors_name(0)).exists()
+        with output_dir.joinpath(bulk.chunk_name(1)).open(
+                'r', encoding='utf-8') as chunk_file:
+            output = [json.loads(line) for line in chunk_file]
+        assert output == [None, u'1\te\t_\tN\tN\t_\t0\t_\t_\t_']
+        with errors_fp.open('r', encoding='utf-8') as errors_file:
+            errors = [json.loads(line) for line in errors_file]
+        assert [(error['line'], error['text']) for error in errors] == \
+            [(3, u'd BAD')]
+    finally:
+        shutil.rmtree(str(temp_dir))
@@ -0,0 +1,163 @@
+'''
+Tests the functions and classes within :py:mod:`tweebo.client`. The test \
+functions within this module are the following:
+1. test_batch_bounds -- tests that texts are split into contiguous batches \
+limited by Tweets, tokens and concurrency.
+2. test_retry_delay -- tests that the `Retry-After` of a 503 is used and \
+that otherwise the delay backs off exponentially.
+3. test_client_retries -- tests that the client retries 503 and 5xx \
+responses, does not retry other errors and reassembles concurrent batches \
+in order, against a stand in server that does not require the \
+TweeboParser to be installed.
+4. test_client_parse -- tests that the client parses texts the same as \
+:py:func:`tweebo.process_texts`. Requires the TweeboParser to be installed.
+'''
+
+from multiprocessing import Process, Value
+import time
+
+from flask import Flask, jsonify, request
+import pytest
+import requests
+from waitress import serve
+
+from tweebo import client, server
+import tweebo_test
+
+
+def test_batch_bounds():
+    '''
+    Tests :py:func:`tweebo.client.batch_bounds`:
+    1. No texts gives no batches.
+    2. 5 texts with a batch size of 2 gives 3 batches, the last with 1 text.
+    3. A concurrency of 3 splits 5 texts into batches of at most 2 texts.
+    4. A token limit starts a new batch before the limit would be passed, \
+    a text longer than the limit is in a batch by itself.
+    5. ValueError is raised when a limit is not positive.
+    '''
+
+    texts = [u'a', u'b c', u'd', u'e f g h', u'i']
+    assert client.batch_bounds([]) == []
+    assert client.batch_bounds(texts, batch_size=2) == [(0, 2), (2, 4),
+                                                        (4, 5)]
+    assert client.batch_bounds(texts, concurrency=3) == [(0, 2), (2, 4),
+                                                         (4, 5)]
+    assert client.batch_bounds(texts, batch_tokens=3) == [(0, 2), (2, 3),
+                                                          (3, 4), (4, 5)]
+    with pytest.raises(ValueError):
+        client.batch_bounds(texts, concurrency=0)
+    with pytest.raises(ValueError):
+        client.batch_bounds(texts, batch_tokens=0)
+
+
+def test_retry_delay():
+    '''
+    Tests :py:func:`tweebo.client.retry_delay`:
+    1. A 503 with a `Retry-After` header waits as long as the header says.
+    2. Without the header the delay is between half and all of the \
+    backoff, which doubles with each attempt up to the maximum backoff.
+    '''
+
+    response = requests.Response()
+    response.status_code = 503
+    response.headers['Retry-After'] = '7'
+    assert client.retry_delay(0, response) == 7.0
+    response.status_code = 500
+    assert 0.5 <= client.retry_delay(0, response, backoff=1) <= 1
+    assert 4 <= client.retry_delay(3, None, backoff=1) <= 8
+    assert 5 <= client.retry_delay(10, None, backoff=1, max_backoff=10) <= 10
+
+
+def _start_flaky_server(num_requests):
+    '''
+    Starts a stand in for the API server that returns 503 with \
+    `Retry-After: 0` for the first request, 500 for the second and \
+    otherwise echoes the texts, or 422 if a text is `invalid`
+
+    :param num_requests: Shared counter of the requests received.
+    :type num_requests: multiprocessing.Value
+    '''
+
+    app = Flask(__name__)
+
+    @app.route('/', methods=['POST'])
+    def parse():
+        texts = request.get_json()['texts']
+        with num_requests.get_lock():
+            num_requests.value += 1
+            if num_requests.value == 1:
+                response = jsonify({'message': 'The queue is full'})
+                response.status_code = 503
+                response.headers['Retry-After'] = '0'
+                return response
+            if num_requests.value == 2:
+                response = jsonify({'message': 'Error'})
+                response.status_code = 500
+                return response
+        if u'invalid' in texts:
+            response = jsonify({'message': 'Invalid'})
+            response.status_code = 422
+            return response
+        return jsonify(texts)
+
+    serve(app, port=8001, threads=4)
+
+
+def test_client_retries():
+    '''
+    Tests :py:class:`tweebo.client.TweeboClient` against a stand in server:
+    1. 8 texts in batches of 2 sent 4 at a time are returned in order \
+    after the 503 and 500 responses are retried.
+    2. A 422 response is not retried and raises HTTPError.
+    3. A request that fails more than max_retries times raises HTTPError.
+    '''
+
+    num_requests = Value('i', 0)
+    flaky_server = Process(target=_start_flaky_server, args=(num_requests,))
+    flaky_server.start()
+    time.sleep(1)
+    try:
+        texts = [u'text {}'.format(index) for index in range(8)]
+        with client.TweeboClient('http://127.0.0.1:8001', concurrency=4,
+                                 batch_size=2, backoff=0.01) as tweebo_client:
+            assert tweebo_client.parse(texts) == texts
+            with pytest.raises(requests.HTTPError):
+                tweebo_client.parse([u'invalid'])
+            assert num_requests.value == 7
+        num_requests.value = 0
+        with client.TweeboClient('http://127.0.0.1:8001', max_retries=0) \
+                as tweebo_client:
+            with pytest.raises(requests.HTTPError):
+                tweebo_client.parse(texts)
+    finally:
+        flaky_server.terminate()
+
+
+def test_client_parse():
+    '''
+    Tests that :py:class:`tweebo.client.TweeboClient` parses Tweets sent \
+    in one Tweet batches to the API server the same as \
+    :py:func:`tweebo.process_texts`, including the index of each Tweet in \
+    the Stanford format.
+    '''
+
+    tweebo_server = Process(target=serve, args=(server.app,),
+                            kwargs={'port': 8000, 'threads': 4})
+    tweebo_server.start()
+    time.sleep(1)
+    try:
+        with client.TweeboClient(batch_size=1) as tweebo_client:
+            conll_parses = tweebo_client.parse(tweebo_test.TEST_SENTENCES_0)
+            assert conll_parses == [tweebo_test.CONLL_0, tweebo_test.CONLL_1]
+            stanford_parses = tweebo_client.parse(
+                tweebo_test.TEST_SENTENCES_0, output_type='stanford')
+            assert stanford_parses == [{'index': 0,
+                                        'basicDependencies':
+                                            tweebo_test.B_DEP_0,
+                                        'tokens': tweebo_test.TOKENS_0},
+                                       {'index': 1,
+                                        'basicDependencies':
+                                            tweebo_test.B_DEP_1,
+                                        'tokens': tweebo_test.TOKENS_1}]
+    finally:
+        tweebo_server.terminate()
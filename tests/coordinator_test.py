@@ -0,0 +1,282 @@
+'''
+Tests the classes within :py:mod:`tweebo.coordinator` against stand in \
+backend servers, so none of the tests require the TweeboParser to be \
+installed. The test functions within this module are the following:
+1. test_hash_ring -- tests that keys go round the ring in a consistent \
+order and that adding a name only moves keys to that name.
+2. test_backend_health -- tests that a backend is unhealthy after too many \
+failures in a row and is checked by one request once its cooldown passes.
+3. test_coordinator -- tests that the texts of a request are routed to \
+their backends by consistent hashing and merged in order.
+4. test_coordinator_failover -- tests that texts of a backend that cannot \
+be reached go to the next backend, that slow batches are hedged, that \
+errors of the request are not retried and that a backend that times out \
+counts as a failure.
+5. test_coordinator_shards -- tests that an unhealthy backend is only \
+checked by a request that has texts for it.
+'''
+
+import json
+from multiprocessing import Process
+import time
+
+from flask import Flask, jsonify, request
+import pytest
+from waitress import serve
+
+from tweebo import coordinator, server
+
+FAST_URLS = ['http://127.0.0.1:8002', 'http://127.0.0.1:8003']
+SLOW_URL = 'http://127.0.0.1:8004'
+# Nothing listens on this port
+DEAD_URL = 'http://127.0.0.1:8009'
+
+
+def _start_backend(port, delay):
+    '''
+    Starts a stand in for the API server that waits delay seconds and \
+    returns each text prefixed with the port, as a dictionary for the \
+    Stanford output type, or 422 if a text is `invalid` or the body has \
+    fields that are not given to :py:func:`tweebo.process_texts`
+
+    :param port: Port to listen on.
+    :param delay: Seconds to wait before responding.
+    :type port: int
+    :type delay: float
+    '''
+
+    app = Flask(__name__)
+
+    @app.route('/', methods=['POST'])
+    def parse():
+        request_data = request.get_json()
+        texts = request_data['texts']
+        time.sleep(delay)
+        unexpected_fields = set(request_data) - set(server.PROCESS_FIELDS)
+        if u'invalid' in texts or unexpected_fields:
+            response = jsonify({'message': 'Invalid'})
+            response.status_code = 422
+            return response
+        outputs = [u'{}:{}'.format(port, text) for text in texts]
+        if request_data['output_type'] == 'stanford':
+            outputs = [{'index': index, 'text': output}
+                       for index, output in enumerate(outputs)]
+        return jsonify(outputs)
+
+    serve(app, port=port, threads=4)
+
+
+def _start_backends(ports_delays):
+    '''
+    :param ports_delays: Port and delay of each stand in backend see \
+    :py:func:`_start_backend`
+    :type ports_delays: list[tuple[int, float]]
+    :return: The processes of the backends, which have had a second to \
+    start.
+    :rtype: list[Process]
+    '''
+
+    processes = [Process(target=_start_backend, args=(port, delay))
+                 for port, delay in ports_delays]
+    for process in processes:
+        process.start()
+    time.sleep(1)
+    return processes
+
+
+def _post(coordinator_client, texts, output_type='conll', **fields):
+    '''
+    :param fields: Other fields of the request e.g. `timeout`
+    :return: The status code and JSON body of the response of the \
+    coordinator.
+    :rtype: tuple[int, list or Dict]
+    '''
+
+    fields.update(texts=texts, output_type=output_type)
+    response = coordinator_client.post(
+        '/', data=json.dumps(fields), content_type='application/json')
+    return response.status_code, json.loads(response.get_data())
+
+
+def test_hash_ring():
+    '''
+    Tests :py:class:`tweebo.coordinator.HashRing`:
+    1. The preference of a key contains every name once and is the same \
+    for another ring of the same names.
+    2. Adding a name moves roughly a quarter of the keys of 3 names, and \
+    only to the new name.
+    3. ValueError is raised when there are no names.
+    '''
+
+    names = ['a', 'b', 'c']
+    ring = coordinator.HashRing(names)
+    keys = [u'tweet {}'.format(index) for index in range(1000)]
+    for key in keys[:10]:
+        assert sorted(ring.preference(key)) == names
+        assert ring.preference(key) == \
+            coordinator.HashRing(names).preference(key)
+    larger_ring = coordinator.HashRing(names + ['d'])
+    moved = [key for key in keys
+             if ring.preference(key)[0] != larger_ring.preference(key)[0]]
+    assert 100 < len(moved) < 400
+    assert all(larger_ring.preference(key)[0] == 'd' for key in moved)
+    with pytest.raises(ValueError):
+        coordinator.HashRing([])
+
+
+def test_backend_health():
+    '''
+    Tests :py:class:`tweebo.coordinator.Backend` with 2 failures allowed \
+    and a 0.2 second cooldown:
+    1. The backend is available after 1 failure but not after 2.
+    2. Once the cooldown passes one request is let through.
+    3. A success makes the backend healthy again.
+    '''
+
+    backend = coordinator.Backend('http://backend', max_failures=2,
+                                  cooldown=0.2)
+    backend.record(False)
+    assert backend.available() and backend.healthy()
+    backend.record(False)
+    assert not backend.available() and not backend.healthy()
+    time.sleep(0.3)
+    assert backend.available()
+    assert not backend.available()
+    backend.record(True)
+    assert backend.available()
+    assert backend.status() == {'url': 'http://backend', 'healthy': True,
+                                'failures': 0}
+
+
+def test_coordinator(monkeypatch):
+    '''
+    Tests :py:class:`tweebo.coordinator.Coordinator` with 2 backends:
+    1. Each text is processed by the first backend of its preference and \
+    the outputs are in the order of the request.
+    2. The Stanford index is the index in the request.
+    3. Both backends are healthy.
+    4. The priority and timeout fields are not sent on to the backends in \
+    the body, and a request with a field that is not part of the API \
+    returns 422 without being sent to a backend.
+    '''
+
+    backend_processes = _start_backends([(8002, 0), (8003, 0)])
+    try:
+        tweebo_coordinator = coordinator.Coordinator(FAST_URLS)
+        monkeypatch.setattr(coordinator, 'coordinator', tweebo_coordinator)
+        coordinator_client = coordinator.app.test_client()
+        texts = [u'text {}'.format(index) for index in range(20)]
+        status_code, outputs = _post(coordinator_client, texts)
+        assert status_code == 200
+        expected = []
+        for text in texts:
+            backend_url = tweebo_coordinator.ring.preference(text)[0]
+            expected.append(u'{}:{}'.format(backend_url.split(':')[-1],
+                                            text))
+        assert outputs == expected
+        assert len(set(output.split(':')[0] for output in outputs)) == 2
+
+        status_code, outputs = _post(coordinator_client, texts, 'stanford')
+        assert status_code == 200
+        assert [output['index'] for output in outputs] == list(range(20))
+        assert [output['text'] for output in outputs] == expected
+
+        backend_status = json.loads(coordinator_client.get('/backends')
+                                    .get_data())
+        assert [status['healthy'] for status in backend_status] == \
+            [True, True]
+
+        status_code, outputs = _post(coordinator_client, texts,
+                                     priority='bulk', timeout=10)
+        assert status_code == 200
+        assert outputs == expected
+        status_code, output = _post(coordinator_client, texts, n_jobs=64)
+        assert status_code == 422
+        assert 'n_jobs' in output['message']
+    finally:
+        for process in backend_processes:
+            process.terminate()
+
+
+def test_coordinator_failover(monkeypatch):
+    '''
+    Tests the failover and hedging of \
+    :py:class:`tweebo.coordinator.Coordinator`:
+    1. With a backend that cannot be reached, and 1 failure allowed, every \
+    text is processed by the other backend and the unreachable backend is \
+    unhealthy.
+    2. With a backend that takes 3 seconds and hedging after 0.2 seconds, \
+    every text is processed by the fast backend within 2 seconds.
+    3. A 422 from a backend is returned rather than sent to another backend.
+    4. A backend that does not respond before the deadline of the request \
+    returns 504 and counts as a failure.
+    '''
+
+    backend_processes = _start_backends([(8002, 0), (8004, 3)])
+    try:
+        tweebo_coordinator = coordinator.Coordinator(
+            [DEAD_URL, FAST_URLS[0]], max_failures=1)
+        monkeypatch.setattr(coordinator, 'coordinator', tweebo_coordinator)
+        coordinator_client = coordinator.app.test_client()
+        texts = [u'text {}'.format(index) for index in range(20)]
+        status_code, outputs = _post(coordinator_client, texts)
+        assert status_code == 200
+        assert outputs == [u'8002:{}'.format(text) for text in texts]
+        assert not tweebo_coordinator.backends[DEAD_URL].healthy()
+
+        tweebo_coordinator = coordinator.Coordinator(
+            [SLOW_URL, FAST_URLS[0]], hedge_after=0.2)
+        monkeypatch.setattr(coordinator, 'coordinator', tweebo_coordinator)
+        start_time = time.time()
+        status_code, outputs = _post(coordinator_client, texts)
+        assert time.time() - start_time < 2
+        assert status_code == 200
+        assert outputs == [u'8002:{}'.format(text) for text in texts]
+
+        status_code, output = _post(coordinator_client, [u'invalid'])
+        assert status_code == 422
+        assert 'Invalid' in output['message']
+
+        tweebo_coordinator = coordinator.Coordinator([SLOW_URL],
+                                                     max_failures=1)
+        monkeypatch.setattr(coordinator, 'coordinator', tweebo_coordinator)
+        status_code, _ = _post(coordinator_client, texts, timeout=0.2)
+        assert status_code == 504
+        assert not tweebo_coordinator.backends[SLOW_URL].healthy()
+    finally:
+        for process in backend_processes:
+            process.terminate()
+
+
+def test_coordinator_shards():
+    '''
+    Tests :py:meth:`tweebo.coordinator.Coordinator.shards` with 2 backends, \
+    1 failure allowed and a 0.2 second cooldown, where one backend has \
+    failed and its cooldown has passed:
+    1. A request with no texts for the failed backend does not use up the \
+    request that checks it, nor does it send its texts there on failover.
+    2. A request with texts for the failed backend sends them to it, which \
+    uses up the check, so the next request sends them to the other backend.
+    '''
+
+    tweebo_coordinator = coordinator.Coordinator(FAST_URLS, max_failures=1,
+                                                 cooldown=0.2)
+    failed_url, other_url = FAST_URLS
+    texts = [u'text {}'.format(index) for index in range(20)]
+    failed_texts = [text for text in texts
+                    if tweebo_coordinator.ring.preference(text)[0] ==
+                    failed_url]
+    other_texts = [text for text in texts if text not in failed_texts]
+    assert failed_texts and other_texts
+    tweebo_coordinator.backends[failed_url].record(False)
+    time.sleep(0.3)
+
+    shards = tweebo_coordinator.shards(other_texts)
+    assert list(shards) == [other_url]
+    assert shards[other_url][1] == [other_url]
+    shards = tweebo_coordinator.shards(failed_texts)
+    assert list(shards) == [failed_url]
+    assert shards[failed_url] == (list(range(len(failed_texts))),
+                                  [failed_url, other_url])
+    shards = tweebo_coordinator.shards(failed_texts)
+    assert list(shards) == [other_url]
@@ -0,0 +1,115 @@
+'''
+Tests the functions within :py:mod:`tweebo.equivalence` that compare parses \
+and do not require the TweeboParser to be installed. The test functions \
+within this module are the following:
+1. test_read_parses -- tests that CoNLL files are read into Tweets of tokens.
+2. test_compare -- tests that divergent tokens are counted by field with \
+examples.
+3. test_gate -- tests that a comparison is gated as exact, within tolerance \
+or diverged.
+'''
+
+from pathlib import Path
+import shutil
+import tempfile
+
+from tweebo import equivalence
+
+GOLD_FP = Path(__file__).absolute().parent.joinpath('test_data',
+                                                    'tweets.txt.predict')
+
+
+def test_read_parses():
+    '''
+    Tests :py:func:`tweebo.equivalence.read_parses` on the gold parse of \
+    `tests/test_data/tweets.txt` which contains 3 Tweets:
+    1. The number of Tweets and tokens in each Tweet is correct.
+    2. The fields of a token are correct and tokens with a HEAD of -1 are \
+    not selected.
+    '''
+
+    parses = equivalence.read_parses(GOLD_FP)
+    assert [len(tweet) for tweet in parses] == [32, 11, 10]
+    assert parses[0][0] == {'form': 'I', 'pos': 'O', 'head': 2,
+                            'relation': '_', 'selection': True}
+    unselected = [token for tweet in parses for token in tweet
+                  if token['head'] == -1]
+    assert len(unselected) == 15
+    assert not any(token['selection'] for token in unselected)
+
+
+def test_compare():
+    '''
+    Tests :py:func:`tweebo.equivalence.compare`:
+    1. Identical parses do not diverge.
+    2. Changing the HEAD of a token to -1 diverges on head and selection, \
+    with an example of each.
+    3. A missing token diverges on every field and the Tweets that are not \
+    missing tokens do not diverge.
+    '''
+
+    reference = equivalence.read_parses(GOLD_FP)
+    comparison = equivalence.compare(reference, equivalence.read_parses(
+        GOLD_FP))
+    assert comparison['tweets'] == 3
+    assert comparison['tokens'] == 53
+    assert comparison['diverged_tweets'] == 0
+    assert not any(comparison['divergences'].values())
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        test_fp = Path(temp_dir, 'test.conll')
+        with GOLD_FP.open('r', encoding='utf-8') as gold_file:
+            lines = gold_file.readlines()
+        # First token of the first Tweet has HEAD 2, remove the last token
+        # of the last Tweet
+        lines[0] = lines[0].replace(u'\t2\t', u'\t-1\t')
+        del lines[-2]
+        with test_fp.open('w', encoding='utf-8') as test_file:
+            test_file.writelines(lines)
+        comparison = equivalence.compare(
+            reference, equivalence.read_parses(test_fp), num_examples=1)
+    finally:
+        shutil.rmtree(temp_dir)
+    assert comparison['diverged_tweets'] == 2
+    divergences = comparison['divergences']
+    assert divergences == {'form': 1, 'pos': 1, 'head': 2, 'relation': 1,
+                           'selection': 2}
+    assert comparison['rates']['head'] == 2 / 53.0
+    head_example = comparison['examples']['head'][0]
+    assert head_example['tweet'] == 0
+    assert head_example['token'] == 1
+    assert head_example['reference'] == 2
+    assert head_example['test'] == -1
+    assert len(comparison['examples']['selection']) == 1
+    assert comparison['examples']['form'][0]['test_form'] is None
+
+
+def test_gate():
+    '''
+    Tests :py:func:`tweebo.equivalence.gate`:
+    1. No divergences is exact regardless of the tolerance.
+    2. Divergence rates within a single tolerance or a tolerance per field \
+    are within tolerance.
+    3. Divergence rates above the tolerance, or divergence on a field not \
+    given a tolerance, are diverged.
+    '''
+
+    fields = equivalence.FIELDS
+    exact = {'divergences': {field: 0 for field in fields},
+             'rates': {field: 0.0 for field in fields}}
+    assert equivalence.gate(exact) == equivalence.EXACT
+    assert equivalence.gate(exact, 0.1) == equivalence.EXACT
+
+    head_diverged = {'divergences': {field: 0 for field in fields},
+                     'rates': {field: 0.0 for field in fields}}
+    head_diverged['divergences']['head'] = 1
+    head_diverged['rates']['head'] = 0.01
+    assert equivalence.gate(head_diverged) == equivalence.DIVERGED
+    assert equivalence.gate(head_diverged, 0.01) == \
+        equivalence.WITHIN_TOLERANCE
+    assert equivalence.gate(head_diverged, {'head': 0.02}) == \
+        equivalence.WITHIN_TOLERANCE
+    assert equivalence.gate(head_diverged, 0.005) == equivalence.DIVERGED
+    assert equivalence.gate(head_diverged, {'relation': 0.02}) == \
+        equivalence.DIVERGED
@@ -0,0 +1,83 @@
+'''
+Tests the functions within :py:mod:`tweebo.evaluate` that score parses and \
+do not require the TweeboParser to be installed. The test functions within \
+this module are the following:
+1. test_attachments -- tests that only the selected tokens have attachments.
+2. test_score -- tests the attachment precision, recall and F1.
+3. test_markdown_table -- tests the table of results recorded in the README.
+'''
+
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+from tweebo import equivalence, evaluate
+
+GOLD_FP = Path(__file__).absolute().parent.joinpath('test_data',
+                                                    'tweets.txt.predict')
+
+
+def test_attachments():
+    '''
+    Tests :py:func:`tweebo.evaluate.attachments` on the gold parse of \
+    `tests/test_data/tweets.txt` which has 53 tokens of which 15 are not \
+    selected, and that a HEAD of -3, as used in Tweebank, is not selected.
+    '''
+
+    parses = equivalence.read_parses(GOLD_FP)
+    gold_attachments = evaluate.attachments(parses)
+    assert len(gold_attachments) == 53 - 15
+    assert (0, 1, 2) in gold_attachments
+
+    parses[0][0]['head'] = -3
+    assert len(evaluate.attachments(parses)) == 53 - 16
+
+
+def test_score():
+    '''
+    Tests :py:func:`tweebo.evaluate.score`:
+    1. The gold parse scores 1 on precision, recall and F1.
+    2. Changing the HEAD of one selected token lowers the precision and \
+    recall by one attachment.
+    3. Unselecting a token lowers the recall but not the precision.
+    '''
+
+    gold_parses = equivalence.read_parses(GOLD_FP)
+    result = evaluate.score(gold_parses, equivalence.read_parses(GOLD_FP))
+    assert result['correct'] == 38
+    assert result['precision'] == result['recall'] == result['f1'] == 1.0
+
+    test_parses = equivalence.read_parses(GOLD_FP)
+    test_parses[0][0]['head'] = 3
+    result = evaluate.score(gold_parses, test_parses)
+    assert result['correct'] == 37
+    assert result['precision'] == result['recall'] == 37 / 38.0
+
+    test_parses[0][0]['head'] = -1
+    result = evaluate.score(gold_parses, test_parses)
+    assert result['test_attachments'] == 37
+    assert result['precision'] == 1.0
+    assert result['recall'] == 37 / 38.0
+    assert result['f1'] == pytest.approx(2 * 37 / 75.0)
+
+
+def test_markdown_table():
+    '''
+    Tests :py:func:`tweebo.evaluate.markdown_table` gives a header, a \
+    separator and a row per mode in order, with the F1 difference and speed \
+    up relative to the first mode.
+    '''
+
+    results = OrderedDict([
+        ('full', {'precision': 0.8, 'recall': 0.8, 'f1': 0.8,
+                  'parse_time': 10.0}),
+        ('fast', {'precision': 0.75, 'recall': 0.75, 'f1': 0.75,
+                  'parse_time': 4.0})])
+    lines = evaluate.markdown_table(results).split('\n')
+    assert len(lines) == 4
+    assert lines[0].startswith('| Mode | Precision |')
+    assert lines[2] == '| full | 80.00% | 80.00% | 80.00% | +0.00% | 10.0s '\
+                       '| 1.00x |'
+    assert lines[3] == '| fast | 75.00% | 75.00% | 75.00% | -5.00% | 4.0s '\
+                       '| 2.50x |'
@@ -4,6 +4,9 @@ Contains the following test functions:
 works correctly by testing it on different and same files.
 2. test_output -- Tests if the output of the new code base is the same as \
 a stable code commit.
+3. test_execution_modes -- Tests that each execution mode in \
+:py:mod:`tweebo.equivalence` gives exactly the same parses as the stable \
+code commit.
 '''
 
 import logging
@@ -17,6 +20,8 @@ import sha
 
 import pytest
 
+from tweebo import equivalence
+
 
 def _get_sha_digest(file_path):
     '''
@@ -175,6 +180,27 @@ def test_output():
         shutil.rmtree(temp_dir_fp)
 
 
+def test_execution_modes():
+    '''
+    Tests that every execution mode, other than the reference run.sh \
+    script and the approximate modes, parses the Tweets in \
+    `tests/test_data/tweets.txt` exactly the same as the stable code \
+    commit, see :py:func:`test_output`. Divergent tokens are shown in the \
+    assertion error.
+    '''
+
+    this_dir = Path(__file__).absolute().parent.resolve()
+    tweets_fp = this_dir.joinpath('test_data', 'tweets.txt')
+    gold_test_fp = this_dir.joinpath('test_data', 'tweets.txt.predict')
+    modes = [mode for mode in equivalence.MODES if mode != 'reference'
+             and mode not in equivalence.APPROXIMATE_MODES]
+    results = equivalence.run_modes(tweets_fp, modes,
+                                    reference_fp=gold_test_fp)
+    for mode, comparison in results.items():
+        assert comparison['gate'] == equivalence.EXACT, \
+            '{} diverged: {}'.format(mode, comparison['examples'])
+
+
 def test_multi_threading_output():
     '''
     This checks that the run.sh script can be run on different threads. This \
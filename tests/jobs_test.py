@@ -0,0 +1,108 @@
+'''
+Tests the classes within :py:mod:`tweebo.jobs`. Only empty texts, which do \
+not run the pipeline, are processed so none of the tests require the \
+TweeboParser to be installed. The test functions within this module are the \
+following:
+1. test_job_runner -- tests that jobs return the output or exception of \
+:py:func:`tweebo.process_texts` and call their done callbacks.
+2. test_job_cancel -- tests that a job waiting for a running job can be \
+cancelled and is never run, and that a finished job cannot be cancelled.
+3. test_job_runner_exceptions -- tests that ValueError is raised for an \
+invalid max_concurrency and when submitting to a runner that is shut down.
+'''
+
+import threading
+
+import pytest
+
+from tweebo import jobs, stages
+
+
+class _BlockingTexts(list):
+    '''
+    Texts that block :py:func:`tweebo.process_texts` when it first reads \
+    them until released, so that the job processing them keeps running.
+    '''
+
+    def __init__(self, texts):
+        super(_BlockingTexts, self).__init__(texts)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __iter__(self):
+        self.started.set()
+        self.release.wait()
+        return super(_BlockingTexts, self).__iter__()
+
+
+def test_job_runner():
+    '''
+    Tests :py:class:`tweebo.jobs.JobRunner`:
+    1. Jobs return the output of :py:func:`tweebo.process_texts` with the \
+    options they were submitted with.
+    2. A job whose texts are invalid raises the exception \
+    :py:func:`tweebo.process_texts` raised.
+    3. Done callbacks are called once the job is done, or straight away if \
+    it is already done.
+    '''
+
+    done_jobs = []
+    with jobs.JobRunner(max_concurrency=2) as runner:
+        conll_job = runner.submit([u'', u' '])
+        conll_job.add_done_callback(done_jobs.append)
+        stanford_job = runner.submit([u''], output_type='stanford')
+        error_job = runner.submit(u'not a list')
+        assert conll_job.result() == [u'', u'']
+        assert stanford_job.result() == [{'index': 0,
+                                          'basicDependencies': [],
+                                          'tokens': []}]
+        with pytest.raises(TypeError):
+            error_job.result()
+    assert done_jobs == [conll_job]
+    assert conll_job.done() and not conll_job.cancelled()
+    assert error_job.state == jobs.FINISHED
+    conll_job.add_done_callback(done_jobs.append)
+    assert done_jobs == [conll_job, conll_job]
+
+
+def test_job_cancel():
+    '''
+    Tests :py:meth:`tweebo.jobs.Job.cancel` with 1 job running at a time:
+    1. A job waiting for the running job is cancelled straight away, calls \
+    its done callbacks and raises PipelineCancelled from result.
+    2. The running job still finishes and cannot be cancelled once finished.
+    '''
+
+    blocking_texts = _BlockingTexts([u''])
+    done_jobs = []
+    with jobs.JobRunner(max_concurrency=1) as runner:
+        running_job = runner.submit(blocking_texts)
+        blocking_texts.started.wait(5)
+        assert running_job.state == jobs.RUNNING
+        waiting_job = runner.submit([u''])
+        waiting_job.add_done_callback(done_jobs.append)
+        assert not waiting_job.done()
+        assert waiting_job.cancel()
+        assert waiting_job.cancelled() and waiting_job.done()
+        assert done_jobs == [waiting_job]
+        with pytest.raises(stages.PipelineCancelled):
+            waiting_job.result()
+        blocking_texts.release.set()
+        assert running_job.result() == [u'']
+        assert not running_job.cancel()
+    assert waiting_job.state == jobs.CANCELLED
+
+
+def test_job_runner_exceptions():
+    '''
+    Tests that :py:class:`tweebo.jobs.JobRunner` raises ValueError when \
+    max_concurrency is not positive and when a job is submitted after the \
+    runner is shut down.
+    '''
+
+    with pytest.raises(ValueError):
+        jobs.JobRunner(max_concurrency=0)
+    runner = jobs.JobRunner()
+    runner.shutdown()
+    with pytest.raises(ValueError):
+        runner.submit([u''])
@@ -0,0 +1,120 @@
+'''
+Tests :py:class:`tweebo.prefork.PreforkServer` serving a stand in WSGI app \
+so none of the tests require the TweeboParser to be installed. The test \
+functions within this module are the following:
+1. test_prefork_restart -- tests that the workers share the port and that \
+a worker that is killed is restarted.
+2. test_prefork_drain -- tests that stopping the server lets an in-flight \
+request finish before the workers exit.
+'''
+
+from multiprocessing import Process
+import os
+import signal
+import threading
+import time
+
+import pytest
+import requests
+
+from tweebo.prefork import PreforkServer
+
+PORT = 8005
+URL = 'http://127.0.0.1:{}'.format(PORT)
+
+
+def _app(environ, start_response):
+    '''
+    Stand in WSGI app that returns the process ID of the worker, after 2 \
+    seconds for the path `/slow`
+    '''
+
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(2)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode('utf-8')]
+
+
+def _serve(workers):
+    PreforkServer(_app, '127.0.0.1', PORT, workers, graceful_timeout=10,
+                  threads=2).run()
+
+
+def _start_server(workers):
+    '''
+    :param workers: Number of worker processes.
+    :type workers: int
+    :return: The process of the supervisor, which has had a second to \
+    start the workers.
+    :rtype: Process
+    '''
+
+    process = Process(target=_serve, args=(workers,))
+    process.start()
+    time.sleep(1)
+    return process
+
+
+def _worker_pids(num_requests=50):
+    '''
+    :return: The process IDs of the workers that answered the requests, \
+    each request being sent on a new connection.
+    :rtype: set[int]
+    '''
+
+    return set(int(requests.get(URL).text) for _ in range(num_requests))
+
+
+def test_prefork_restart():
+    '''
+    Tests that:
+    1. Requests are answered by both of the 2 workers.
+    2. After one worker is killed requests are still answered and a new \
+    worker, with a different process ID, answers them within 5 seconds.
+    '''
+
+    process = _start_server(2)
+    try:
+        pids = _worker_pids()
+        assert len(pids) == 2
+        killed_pid = pids.pop()
+        os.kill(killed_pid, signal.SIGKILL)
+        deadline = time.time() + 5
+        new_pids = set()
+        while time.time() < deadline:
+            new_pids = _worker_pids(10) - pids
+            if new_pids:
+                break
+            time.sleep(0.2)
+        assert len(new_pids) == 1
+        assert killed_pid not in new_pids
+    finally:
+        process.terminate()
+        process.join(15)
+
+
+def test_prefork_drain():
+    '''
+    Tests that when the supervisor receives SIGTERM while a request that \
+    takes 2 seconds is in flight:
+    1. The request is answered.
+    2. The supervisor exits soon after and no longer accepts connections.
+    '''
+
+    process = _start_server(2)
+    responses = []
+    request_thread = threading.Thread(
+        target=lambda: responses.append(requests.get(URL + '/slow')))
+    try:
+        request_thread.start()
+        time.sleep(0.5)
+        process.terminate()
+        request_thread.join(10)
+        assert [response.status_code for response in responses] == [200]
+        process.join(10)
+        assert process.exitcode == 0
+        with pytest.raises(requests.ConnectionError):
+            requests.get(URL)
+    finally:
+        if process.is_alive():
+            process.terminate()
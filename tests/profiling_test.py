@@ -0,0 +1,96 @@
+'''
+Tests :py:mod:`tweebo.profiling`. The test functions within this module are \
+the following:
+1. test_get_profile_dir - tests that the profile directory comes from the \
+argument first and then the TWEEBO_PROFILE_DIR environment variable.
+2. test_profile_call - tests that profiling a function call writes a \
+cProfile file and an allocation report.
+3. test_profile_command - tests that a profiled Python script produces the \
+same output as when it is not profiled and writes the profile files.
+'''
+
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from tweebo import profiling
+
+
+def test_get_profile_dir():
+    '''
+    Tests :py:func:`tweebo.profiling.get_profile_dir`
+    1. The argument is returned when given.
+    2. The environment variable is used when the argument is None.
+    3. None is returned when neither are set.
+    '''
+
+    original_env = os.environ.pop(profiling.PROFILE_DIR_ENV, None)
+    try:
+        assert profiling.get_profile_dir('/some/dir') == '/some/dir'
+        assert profiling.get_profile_dir() is None
+        os.environ[profiling.PROFILE_DIR_ENV] = '/env/dir'
+        assert profiling.get_profile_dir() == '/env/dir'
+        assert profiling.get_profile_dir('/some/dir') == '/some/dir'
+    finally:
+        os.environ.pop(profiling.PROFILE_DIR_ENV, None)
+        if original_env is not None:
+            os.environ[profiling.PROFILE_DIR_ENV] = original_env
+
+
+def test_profile_call():
+    '''
+    Tests that :py:func:`tweebo.profiling.profile_call` returns the result \
+    of the function and writes a cProfile file that contains the function \
+    and an allocation report.
+    '''
+
+    def build_lists(size):
+        return [list(range(10)) for _ in range(size)]
+
+    profile_dir = tempfile.mkdtemp()
+    try:
+        result = profiling.profile_call(profile_dir, 'run', 'build',
+                                        build_lists, 100)
+        assert result == build_lists(100)
+        profile_fp = os.path.join(profile_dir, 'run.build.prof')
+        function_names = [function[2] for function in
+                          pstats.Stats(profile_fp).stats]
+        assert 'build_lists' in function_names
+        alloc_fp = os.path.join(profile_dir, 'run.build.allocations.txt')
+        with open(alloc_fp, 'r') as alloc_file:
+            assert 'Peak resident set size' in alloc_file.read()
+    finally:
+        shutil.rmtree(profile_dir)
+
+
+def test_profile_command():
+    '''
+    Tests that a Python script run with the command returned by \
+    :py:func:`tweebo.profiling.profile_command` receives its arguments, \
+    writes the same standard output and exit code, and that the profile \
+    files are written.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        script_fp = os.path.join(temp_dir, 'script.py')
+        with open(script_fp, 'w') as script_file:
+            script_file.write('import sys\n'
+                              'print(" ".join(sys.argv[1:]))\n'
+                              'sys.exit(int(sys.argv[1]))\n')
+        profile_dir = os.path.join(temp_dir, 'profiles')
+        command = profiling.profile_command(profile_dir, 'run', 'script',
+                                            [sys.executable, script_fp,
+                                             '0', 'hello'])
+        assert subprocess.check_output(command).strip() == b'0 hello'
+        assert os.path.isfile(os.path.join(profile_dir, 'run.script.prof'))
+        assert os.path.isfile(os.path.join(profile_dir,
+                                           'run.script.allocations.txt'))
+        command = profiling.profile_command(profile_dir, 'run', 'script',
+                                            [sys.executable, script_fp, '3'])
+        assert subprocess.call(command) == 3
+    finally:
+        shutil.rmtree(temp_dir)
@@ -9,19 +9,40 @@ process data and return it in the stanford format.
 codes for exception cases.
 4. test_multi_requests - Ensure the API server can handle multiple \
 simultaneous requests.
+5. test_server_wire_formats - Ensures the API server can receive and \
+return MessagePack and gzip compressed data.
+6. test_metrics - Ensures the API server exposes the request and pipeline \
+stage metrics and returns the resources used by each request.
+7. test_server_input_format - Ensures the API server can parse Tweets that \
+have already been tokenized and POS tagged.
+8. test_server_priority - Ensures the API server queues requests in the \
+priority lane set by the header or field and exposes per lane metrics.
+9. test_profile_dir - Ensures only the operator of the API server can \
+turn on profiling.
+10. test_health - Ensures the API server is live while it warms up and is \
+only ready once a warm-up parse has succeeded.
+11. test_request_too_large - Ensures a request larger than the queue is \
+rejected with 413 and no Retry-After header.
+12. test_fast_model - Ensures a fast request to a server without the fast \
+parsing model is rejected with 501 before it is queued.
 '''
 
 from itertools import product
 import json
 from multiprocessing import Process, Pool
+from pathlib import Path
+import shutil
+import tempfile
 import time
 
+import msgpack
 import requests
 from requests.exceptions import HTTPError
 from waitress import serve
 import pytest
 
-from tweebo import server
+from tweebo import admission, server, stages
+from tweebo.tweebo import _timing_report
 import tweebo_test
 
 
@@ -140,6 +161,9 @@ def test_exceptions():
     4. Raise 422 when output_type contain the wrong input type.
     5. Raise 422 when output_type is not `conll` or `stanford`
     6. Raise 400 when data is not json formated
+    7. Raise 422 when there are fields that are not part of the API e.g. \
+    `n_jobs`, which would otherwise start more pipelines than the server \
+    allows.
     '''
 
     tweebo_server = Process(target=_start_server)
@@ -184,6 +208,14 @@ def test_exceptions():
         with pytest.raises(HTTPError):
             error = response.raise_for_status()
         assert response.status_code == 400
+        # Test 7
+        test_data = {'texts': [''], 'output_type': 'conll', 'n_jobs': 64,
+                     'profile_dir': '/tmp', 'isolate_errors': True}
+        response = requests.post('http://127.0.0.1:8000', json=test_data)
+        assert response.status_code == 422
+        message = response.json()['message']
+        for field in ['n_jobs', 'profile_dir', 'isolate_errors']:
+            assert field in message
     except Exception as error:
         tweebo_server.terminate()
         raise error
@@ -230,3 +262,366 @@ def test_multi_requests():
         raise error
     else:
         tweebo_server.terminate()
+
+
+def test_server_wire_formats():
+    '''
+    Tests that the API server can decode MessagePack and gzip compressed \
+    requests and encode the response as MessagePack when requested, while \
+    JSON remains the default. Test cases:
+    1. MessagePack request and response.
+    2. gzip compressed JSON request with a JSON response.
+    3. gzip compressed MessagePack request and response.
+    4. Raise 400 when the MessagePack data cannot be decoded.
+    5. Raise 400 when the gzip data cannot be decompressed.
+    '''
+
+    tweebo_server = Process(target=_start_server)
+    tweebo_server.start()
+    time.sleep(1)
+    try:
+        test_data = {'texts': tweebo_test.TEST_SENTENCES_0,
+                     'output_type': 'conll'}
+        expected_return = [tweebo_test.CONLL_0, tweebo_test.CONLL_1]
+        msgpack_headers = {'Content-Type': 'application/msgpack',
+                           'Accept': 'application/msgpack'}
+        # Test 1
+        response = requests.post('http://127.0.0.1:8000',
+                                 data=msgpack.packb(test_data,
+                                                    use_bin_type=True),
+                                 headers=msgpack_headers)
+        assert response.headers['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(response.content, raw=False) == \
+            expected_return
+        # Test 2
+        gzip_headers = {'Content-Type': 'application/json',
+                        'Content-Encoding': 'gzip'}
+        gzip_data = server._gzip_compress(json.dumps(test_data)
+                                          .encode('utf-8'))
+        response = requests.post('http://127.0.0.1:8000', data=gzip_data,
+                                 headers=gzip_headers)
+        assert response.json() == expected_return
+        # Test 3
+        gzip_headers.update(msgpack_headers)
+        gzip_data = server._gzip_compress(msgpack.packb(test_data,
+                                                        use_bin_type=True))
+        response = requests.post('http://127.0.0.1:8000', data=gzip_data,
+                                 headers=gzip_headers)
+        assert msgpack.unpackb(response.content, raw=False) == \
+            expected_return
+        # Test 4
+        response = requests.post('http://127.0.0.1:8000',
+                                 data=b'not msgpack data',
+                                 headers=msgpack_headers)
+        assert response.status_code == 400
+        # Test 5
+        response = requests.post('http://127.0.0.1:8000',
+                                 data=json.dumps(test_data),
+                                 headers={'Content-Type': 'application/json',
+                                          'Content-Encoding': 'gzip'})
+        assert response.status_code == 400
+    except Exception as error:
+        tweebo_server.terminate()
+        raise error
+    else:
+        tweebo_server.terminate()
+
+
+def test_metrics():
+    '''
+    Tests that the `/metrics` endpoint exposes metrics in the Prometheus \
+    text format which count the requests, Tweets and tokens processed and \
+    record the duration of every stage of the pipeline. Also tests that \
+    the resources used are returned in the response headers.
+    '''
+
+    tweebo_server = Process(target=_start_server)
+    tweebo_server.start()
+    time.sleep(1)
+    try:
+        test_data = {'texts': tweebo_test.TEST_SENTENCES_0,
+                     'output_type': 'conll'}
+        response = requests.post('http://127.0.0.1:8000', json=test_data)
+        response.raise_for_status()
+        assert response.headers['X-Tweebo-Tweets'] == '2'
+        assert float(response.headers['X-Tweebo-CPU-User-Seconds']) > 0
+        assert int(response.headers['X-Tweebo-Max-RSS-Bytes']) > 0
+        assert int(response.headers['X-Tweebo-Bytes-Written']) > 0
+        stage_max_rss = response.headers['X-Tweebo-Stage-Max-RSS-Bytes']
+        assert [stage_rss.split('=')[0] for stage_rss in
+                stage_max_rss.split(', ')] == stages.STAGES
+        response = requests.post('http://127.0.0.1:8000',
+                                 json={'output_type': 'conll'})
+        assert response.status_code == 422
+
+        response = requests.get('http://127.0.0.1:8000/metrics')
+        response.raise_for_status()
+        assert response.headers['Content-Type'].startswith('text/plain')
+        metric_lines = response.text.splitlines()
+        assert 'tweebo_requests_total{code="200"} 1.0' in metric_lines
+        assert 'tweebo_requests_total{code="422"} 1.0' in metric_lines
+        assert 'tweebo_request_duration_seconds_count 2.0' in metric_lines
+        assert 'tweebo_tweets_total 2.0' in metric_lines
+        num_tokens = sum(len(conll.splitlines()) for conll in
+                         [tweebo_test.CONLL_0, tweebo_test.CONLL_1])
+        assert 'tweebo_tokens_total {}'.format(float(num_tokens)) in \
+            metric_lines
+        assert 'tweebo_pipelines_in_progress 0.0' in metric_lines
+        for stage in stages.STAGES:
+            stage_count = 'tweebo_stage_duration_seconds_count{{stage="{}"}}'\
+                          ' 1.0'.format(stage)
+            assert stage_count in metric_lines
+    except Exception as error:
+        tweebo_server.terminate()
+        raise error
+    else:
+        tweebo_server.terminate()
+
+
+def test_server_input_format():
+    '''
+    Tests that the API server parses pre-tagged CoNLL input the same as the \
+    raw text, see :py:func:`tweebo_test.test_process_texts_pre_tagged`, \
+    and returns 422 when the input_format is not `text` or `conll`
+    '''
+
+    tweebo_server = Process(target=_start_server)
+    tweebo_server.start()
+    time.sleep(1)
+    try:
+        test_data = {'texts': [tweebo_test.CONLL_0, ''],
+                     'output_type': 'conll', 'input_format': 'conll'}
+        response = requests.post('http://127.0.0.1:8000', json=test_data)
+        assert response.json() == [tweebo_test.CONLL_0, '']
+
+        test_data['input_format'] = 'tagged'
+        response = requests.post('http://127.0.0.1:8000', json=test_data)
+        assert response.status_code == 422
+    except Exception as error:
+        tweebo_server.terminate()
+        raise error
+    else:
+        tweebo_server.terminate()
+
+
+def test_server_priority():
+    '''
+    Tests that the API server accepts the priority lane from the \
+    `X-Tweebo-Priority` header and the `priority` field, the field taking \
+    precedence, returns 422 for a lane that does not exist and records the \
+    queue wait and latency of each lane in `/metrics`
+    '''
+
+    tweebo_server = Process(target=_start_server)
+    tweebo_server.start()
+    time.sleep(1)
+    try:
+        test_data = {'texts': tweebo_test.TEST_SENTENCES_0,
+                     'output_type': 'conll'}
+        bulk_header = {'X-Tweebo-Priority': 'bulk'}
+        response = requests.post('http://127.0.0.1:8000', json=test_data,
+                                 headers=bulk_header)
+        assert response.json() == [tweebo_test.CONLL_0, tweebo_test.CONLL_1]
+        test_data['priority'] = 'interactive'
+        response = requests.post('http://127.0.0.1:8000', json=test_data,
+                                 headers=bulk_header)
+        response.raise_for_status()
+
+        response = requests.post('http://127.0.0.1:8000', json=test_data,
+                                 headers={'X-Tweebo-Priority': 'urgent'})
+        response.raise_for_status()
+        test_data['priority'] = 'urgent'
+        response = requests.post('http://127.0.0.1:8000', json=test_data)
+        assert response.status_code == 422
+        del test_data['priority']
+        response = requests.post('http://127.0.0.1:8000', json=test_data,
+                                 headers={'X-Tweebo-Priority': 'urgent'})
+        assert response.status_code == 422
+
+        response = requests.get('http://127.0.0.1:8000/metrics')
+        metric_lines = response.text.splitlines()
+        for lane, num_requests in [('interactive', 2), ('bulk', 1)]:
+            wait_count = 'tweebo_queue_wait_seconds_count{{lane="{}"}} {}'\
+                         .format(lane, float(num_requests))
+            assert wait_count in metric_lines
+            assert 'tweebo_queued_requests{{lane="{}"}} 0.0'.format(lane) \
+                in metric_lines
+        assert 'tweebo_lane_request_duration_seconds_count{lane="bulk"} 1.0'\
+            in metric_lines
+    except Exception as error:
+        tweebo_server.terminate()
+        raise error
+    else:
+        tweebo_server.terminate()
+
+
+def test_profile_dir(monkeypatch):
+    '''
+    Tests with a stand in for :py:func:`tweebo.process_texts` that:
+    1. A request with a `profile_dir` field returns 422 without parsing.
+    2. The profile directory of the server is given to every parse.
+    '''
+
+    profile_dirs = []
+
+    def process_texts(texts, output_type='conll', profile_dir=None,
+                      **kwargs):
+        profile_dirs.append(profile_dir)
+        processed_texts = [u'' for _ in texts]
+        return processed_texts, _timing_report([], processed_texts,
+                                               output_type, time.time(), 0)
+
+    monkeypatch.setattr(server, 'process_texts', process_texts)
+    client = server.app.test_client()
+    test_data = {'texts': [u'hello'], 'output_type': 'conll',
+                 'profile_dir': '/tmp'}
+    response = client.post('/', data=json.dumps(test_data),
+                           content_type='application/json')
+    assert response.status_code == 422
+    assert profile_dirs == []
+
+    monkeypatch.setattr(server, 'profile_dir', '/var/tmp/profiles')
+    del test_data['profile_dir']
+    response = client.post('/', data=json.dumps(test_data),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert profile_dirs == ['/var/tmp/profiles']
+
+
+def test_health(monkeypatch):
+    '''
+    Tests the `/healthz` and `/readyz` endpoints with a stand in for \
+    :py:func:`tweebo.process_texts` that fails the first time it is called:
+    1. While warming up `/healthz` returns 200 and `/readyz` 503.
+    2. After the warm-up retries the failed parse `/readyz` returns 200 \
+    with the 2 attempts, no error and the pipelines of the server.
+    3. Each warm-up parse runs on a pipeline of the bulk lane of the \
+    admission controller, which is freed afterwards.
+    4. A server that skips the warm-up is ready.
+    '''
+
+    calls = []
+    bulk_running = []
+
+    def process_texts(texts, output_type='conll', **kwargs):
+        calls.append(texts)
+        bulk_running.append(server.admission_controller.running('bulk'))
+        if len(calls) == 1:
+            raise SystemError('Cold')
+        return [u'' for _ in texts], None
+
+    monkeypatch.setattr(server, 'process_texts', process_texts)
+    monkeypatch.setattr(server, 'admission_controller',
+                        admission.AdmissionController(2, 1))
+    monkeypatch.setattr(server, 'warm_up', server.WarmUp('warming'))
+    client = server.app.test_client()
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert json.loads(response.get_data())['status'] == 'alive'
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert json.loads(response.get_data())['ready'] is False
+
+    server._warm_up(server.WARM_UP_TEXTS, retry_interval=0.1)
+    assert calls == [server.WARM_UP_TEXTS, server.WARM_UP_TEXTS]
+    assert bulk_running == [1, 1]
+    assert server.admission_controller.running() == 0
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    readiness = json.loads(response.get_data())
+    assert readiness['ready'] is True
+    assert readiness['warm_up']['state'] == 'warm'
+    assert readiness['warm_up']['attempts'] == 2
+    assert readiness['warm_up']['error'] is None
+    assert readiness['pipelines']['max'] == \
+        server.admission_controller.max_pipelines
+    assert readiness['pipelines']['running'] == {'interactive': 0,
+                                                 'bulk': 0}
+
+    monkeypatch.setattr(server, 'warm_up', server.WarmUp())
+    assert client.get('/readyz').status_code == 200
+
+
+def test_request_too_large(monkeypatch):
+    '''
+    Tests with a queue of at most 2 Tweets and a stand in for \
+    :py:func:`tweebo.process_texts` that:
+    1. A request of 3 Tweets returns 413 without a `Retry-After` header, \
+    so clients do not retry it, and without parsing.
+    2. A request of 2 Tweets is parsed.
+    '''
+
+    calls = []
+
+    def process_texts(texts, output_type='conll', **kwargs):
+        calls.append(texts)
+        processed_texts = [u'' for _ in texts]
+        return processed_texts, _timing_report([], processed_texts,
+                                               output_type, time.time(), 0)
+
+    monkeypatch.setattr(server, 'process_texts', process_texts)
+    monkeypatch.setattr(server, 'admission_controller',
+                        admission.AdmissionController(1, 1,
+                                                      max_queued_tweets=2))
+    client = server.app.test_client()
+    test_data = {'texts': [u'a', u'b', u'c'], 'output_type': 'conll'}
+    response = client.post('/', data=json.dumps(test_data),
+                           content_type='application/json')
+    assert response.status_code == 413
+    assert 'Retry-After' not in response.headers
+    assert '3 Tweets' in json.loads(response.get_data())['message']
+    assert calls == []
+
+    test_data['texts'] = [u'a', u'b']
+    response = client.post('/', data=json.dumps(test_data),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert calls == [[u'a', u'b']]
+
+
+def test_fast_model(monkeypatch):
+    '''
+    Tests with a stand in for :py:func:`tweebo.process_texts` that:
+    1. Without the fast parsing model a fast request returns 501 without \
+    parsing.
+    2. A fast request that stops before parsing is parsed.
+    3. With the fast parsing model a fast request is parsed.
+    '''
+
+    calls = []
+
+    def process_texts(texts, output_type='conll', **kwargs):
+        calls.append(kwargs)
+        processed_texts = [u'' for _ in texts]
+        return processed_texts, _timing_report([], processed_texts,
+                                               output_type, time.time(), 0)
+
+    monkeypatch.setattr(server, 'process_texts', process_texts)
+    client = server.app.test_client()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        model_fp = Path(temp_dir, 'fast_parsing_model')
+        monkeypatch.setattr(stages, 'FAST_PARSING_MODEL', model_fp)
+        test_data = {'texts': [u'hello'], 'output_type': 'conll',
+                     'fast': True}
+        response = client.post('/', data=json.dumps(test_data),
+                               content_type='application/json')
+        assert response.status_code == 501
+        assert 'fast parsing model' in \
+            json.loads(response.get_data())['message']
+        assert calls == []
+
+        test_data['until'] = 'token_selection'
+        response = client.post('/', data=json.dumps(test_data),
+                               content_type='application/json')
+        assert response.status_code == 200
+        assert len(calls) == 1
+
+        model_fp.touch()
+        del test_data['until']
+        response = client.post('/', data=json.dumps(test_data),
+                               content_type='application/json')
+        assert response.status_code == 200
+        assert calls[-1]['fast'] is True
+    finally:
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,343 @@
+'''
+Tests the functions within :py:mod:`tweebo.stages` that do not require the \
+TweeboParser to be installed. The test functions within this module are the \
+following:
+1. test_run_stage - tests that a stage writes its standard output to the \
+given file and records the wall clock and CPU time it took.
+2. test_run_stage_exceptions - tests that a SystemError is raised when the \
+command of a stage fails.
+3. test_disk_usage - tests that the size of files and directories is \
+calculated correctly.
+4. test_run_stream - tests that streaming stages are piped together and \
+that a SystemError naming the stage is raised when one of them fails.
+5. test_stage_commands -- tests that the pipeline reads the input file at \
+the first stage and writes the output file at the last stage.
+6. test_cancellation -- tests that cancelling kills the processes of a \
+stage, including those the stage started, and raises PipelineCancelled.
+7. test_deadline -- tests that a cancellation with a deadline kills the \
+processes of a stage once the deadline passes and raises PipelineTimeout.
+8. test_run_pipeline_streaming -- tests that a streaming pipeline that \
+starts after the streaming stages runs its stages one after the other.
+'''
+
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from tweebo import stages
+
+BUSY_COMMAND = [sys.executable, '-c',
+                'total = sum(i for i in range(2000000)); print(total)']
+
+
+def test_run_stage():
+    '''
+    Tests :py:func:`tweebo.stages._run_stage`. We perform the following \
+    tests:
+    1. The standard output of the command is written to the stdout file.
+    2. The returned stage information contains the stage name, wall clock \
+    time, the user and system CPU time and the peak memory of the command.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        stdout_fp = Path(temp_dir, 'output')
+        stage_info = stages._run_stage('busy', BUSY_COMMAND, stdout_fp,
+                                       stages._stage_env())
+        with stdout_fp.open('r') as stdout_file:
+            assert stdout_file.read().strip() == str(sum(range(2000000)))
+        assert stage_info['stage'] == 'busy'
+        assert stage_info['wall_time'] > 0
+        assert stage_info['user_time'] > 0
+        assert stage_info['system_time'] >= 0
+        # Any Python interpreter uses more than 1MB of memory
+        assert stage_info['max_rss'] > 1024 * 1024
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_run_stage_exceptions():
+    '''
+    Tests that :py:func:`tweebo.stages._run_stage` raises a SystemError when \
+    the command returns a non-zero exit code.
+    '''
+
+    fail_command = [sys.executable, '-c', 'import sys; sys.exit(3)']
+    with pytest.raises(SystemError):
+        stages._run_stage('fail', fail_command, None, stages._stage_env())
+
+
+def test_disk_usage():
+    '''
+    Tests :py:func:`tweebo.stages._disk_usage` on a file, a directory with \
+    a sub directory and a path that does not exist.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_fp = Path(temp_dir, 'file')
+        with file_fp.open('wb') as a_file:
+            a_file.write(b'a' * 10)
+        sub_dir = Path(temp_dir, 'sub_dir')
+        sub_dir.mkdir()
+        with sub_dir.joinpath('file').open('wb') as a_file:
+            a_file.write(b'a' * 5)
+        missing_fp = Path(temp_dir, 'missing')
+        assert stages._disk_usage([file_fp]) == 10
+        assert stages._disk_usage([sub_dir, missing_fp]) == 5
+        assert stages._disk_usage([Path(temp_dir)]) == 15
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_run_stream():
+    '''
+    Tests :py:func:`tweebo.stages._run_stream`. We perform the following \
+    tests:
+    1. The output of each stage is piped to the next and the last stage's \
+    output is written to its stdout file.
+    2. Information is returned for each stage in order.
+    3. A SystemError that names the failed stage is raised when a stage \
+    fails.
+    '''
+
+    produce = [sys.executable, '-c',
+               'for i in range(1000): print(i)']
+    double = [sys.executable, '-c',
+              'import sys\nfor line in sys.stdin: print(int(line) * 2)']
+    total = [sys.executable, '-c',
+             'import sys; print(sum(int(line) for line in sys.stdin))']
+    fail = [sys.executable, '-c', 'import sys; sys.exit(3)']
+    temp_dir = tempfile.mkdtemp()
+    try:
+        stdout_fp = Path(temp_dir, 'output')
+        stage_infos = stages._run_stream([('produce', produce, None),
+                                          ('double', double, None),
+                                          ('total', total, stdout_fp)],
+                                         stages._stage_env())
+        with stdout_fp.open('r') as stdout_file:
+            assert stdout_file.read().strip() == str(sum(range(1000)) * 2)
+        assert [info['stage'] for info in stage_infos] == ['produce',
+                                                           'double', 'total']
+        for stage_info in stage_infos:
+            assert stage_info['wall_time'] > 0
+            assert stage_info['max_rss'] > 1024 * 1024
+
+        with pytest.raises(SystemError) as error:
+            stages._run_stream([('produce', produce, None),
+                                ('fail', fail, None),
+                                ('total', total, stdout_fp)],
+                               stages._stage_env())
+        assert 'fail (exit code 3)' in str(error.value)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_stage_commands():
+    '''
+    Tests :py:func:`tweebo.stages._stage_commands`. We perform the \
+    following tests:
+    1. Starting from `brown_clusters` the stage reads the input file and \
+    stopping after `token_selection` the stage writes the output file.
+    2. By default the tagger reads the input file and the parser writes \
+    the output file.
+    3. Streaming from `conversion` the stage reads the input file and the \
+    next stage reads its standard input.
+    4. In fast mode the parser uses the fast model without the posteriors.
+    5. ValueError is raised when the first or last stage is not one the \
+    pipeline can start from or stop after, the last stage is before the \
+    first or is `ptb_parsing` in fast mode.
+    '''
+
+    input_fp = Path('/input.txt')
+    output_fp = Path('/output.txt')
+    working_dir = Path('/working_dir')
+    stage_commands = stages._stage_commands(input_fp, output_fp, working_dir,
+                                            first_stage='brown_clusters',
+                                            last_stage='token_selection')
+    commands = {stage: (command, stdout_fp)
+                for stage, command, stdout_fp in stage_commands}
+    assert str(input_fp) in commands['brown_clusters'][0]
+    assert commands['token_selection'][1] == str(output_fp)
+    assert '--file_test={}'.format(output_fp) in commands['parsing'][0]
+
+    stage_commands = stages._stage_commands(input_fp, output_fp, working_dir)
+    commands = {stage: (command, stdout_fp)
+                for stage, command, stdout_fp in stage_commands}
+    assert commands['tagging'][0][-1] == str(input_fp)
+    assert commands['tagging'][1] == str(working_dir.joinpath(
+        'Tagger_output'))
+    assert '--file_prediction={}'.format(output_fp) in commands['parsing'][0]
+
+    stage_commands = stages._stage_commands(input_fp, output_fp, working_dir,
+                                            streaming=True,
+                                            first_stage='conversion')
+    commands = {stage: (command, stdout_fp)
+                for stage, command, stdout_fp in stage_commands}
+    assert commands['conversion'][0][-1] == str(input_fp)
+    assert '/dev/stdin' in commands['brown_clusters'][0]
+
+    stage_commands = stages._stage_commands(input_fp, output_fp, working_dir,
+                                            fast=True)
+    parsing_command = stage_commands[-1][1]
+    assert '--file_model={}'.format(stages.FAST_PARSING_MODEL) in \
+        parsing_command
+    assert '--use_posterior=false' in parsing_command
+
+    with pytest.raises(ValueError):
+        stages._stage_commands(input_fp, output_fp, working_dir,
+                               first_stage='parsing')
+    with pytest.raises(ValueError):
+        stages._stage_commands(input_fp, output_fp, working_dir,
+                               last_stage='tokenizing')
+    with pytest.raises(ValueError):
+        stages._stage_commands(input_fp, output_fp, working_dir,
+                               first_stage='brown_clusters',
+                               last_stage='tagging')
+    with pytest.raises(ValueError):
+        stages._stage_commands(input_fp, output_fp, working_dir,
+                               last_stage='ptb_parsing', fast=True)
+
+
+def _is_running(pid):
+    '''
+    :param pid: ID of a process
+    :type pid: int
+    :return: True if the process exists and is not a zombie.
+    :rtype: bool
+    '''
+
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat_file:
+            return stat_file.read().split()[2] not in ['Z', 'X']
+    except IOError:
+        return False
+
+
+def test_cancellation():
+    '''
+    Tests :py:class:`tweebo.stages.Cancellation`:
+    1. Cancelling a running stage, whose shell starts a process in the \
+    background, kills the stage and the background process and raises \
+    PipelineCancelled rather than SystemError.
+    2. Cancelling running streaming stages raises PipelineCancelled.
+    3. A stage started after cancelling is killed straight away.
+    '''
+
+    sleep = ['sh', '-c', 'sleep 30 & echo $!; wait']
+    produce = [sys.executable, '-c',
+               'import time\nfor i in range(30): print(i); time.sleep(1)']
+    total = [sys.executable, '-c',
+             'import sys; print(sum(int(line) for line in sys.stdin))']
+    temp_dir = tempfile.mkdtemp()
+    try:
+        stdout_fp = Path(temp_dir, 'output')
+        cancellation = stages.Cancellation()
+        threading.Timer(0.5, cancellation.cancel).start()
+        start_time = time.time()
+        with pytest.raises(stages.PipelineCancelled):
+            stages._run_stage('sleep', sleep, stdout_fp, stages._stage_env(),
+                              cancellation)
+        assert time.time() - start_time < 10
+        with stdout_fp.open('r') as stdout_file:
+            sleep_pid = int(stdout_file.read().strip())
+        if os.path.isdir('/proc'):
+            time.sleep(0.1)
+            assert not _is_running(sleep_pid)
+
+        cancellation = stages.Cancellation()
+        threading.Timer(0.5, cancellation.cancel).start()
+        start_time = time.time()
+        with pytest.raises(stages.PipelineCancelled):
+            stages._run_stream([('produce', produce, None),
+                                ('total', total, stdout_fp)],
+                               stages._stage_env(), cancellation)
+        assert time.time() - start_time < 10
+
+        start_time = time.time()
+        with pytest.raises(stages.PipelineCancelled):
+            stages._run_stage('sleep', sleep, stdout_fp, stages._stage_env(),
+                              cancellation)
+        assert time.time() - start_time < 10
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_deadline():
+    '''
+    Tests :py:meth:`tweebo.stages.Cancellation.set_deadline`:
+    1. A running stage, whose shell starts a process in the background, is \
+    killed with the background process once the deadline passes and \
+    raises PipelineTimeout.
+    2. A later deadline does not replace an earlier one.
+    3. A deadline that has passed cancels straight away.
+    4. Closing the cancellation stops it from timing out.
+    '''
+
+    sleep = ['sh', '-c', 'sleep 30 & echo $!; wait']
+    temp_dir = tempfile.mkdtemp()
+    try:
+        stdout_fp = Path(temp_dir, 'output')
+        start_time = time.time()
+        cancellation = stages.Cancellation(deadline=start_time + 0.5)
+        cancellation.set_deadline(start_time + 60)
+        assert cancellation.deadline == start_time + 0.5
+        with pytest.raises(stages.PipelineTimeout):
+            stages._run_stage('sleep', sleep, stdout_fp, stages._stage_env(),
+                              cancellation)
+        assert time.time() - start_time < 10
+        assert cancellation.cancelled and cancellation.timed_out
+        with stdout_fp.open('r') as stdout_file:
+            sleep_pid = int(stdout_file.read().strip())
+        if os.path.isdir('/proc'):
+            time.sleep(0.1)
+            assert not _is_running(sleep_pid)
+
+        cancellation = stages.Cancellation()
+        cancellation.set_deadline(time.time() - 1)
+        time.sleep(0.1)
+        with pytest.raises(stages.PipelineTimeout):
+            cancellation.check()
+
+        cancellation = stages.Cancellation(deadline=time.time() + 0.1)
+        cancellation.close()
+        time.sleep(0.3)
+        assert not cancellation.cancelled
+        cancellation.check()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_run_pipeline_streaming(monkeypatch):
+    '''
+    Tests :py:func:`tweebo.stages.run_pipeline` with stand ins for the \
+    stages. When streaming from `ptb_parsing` the ptb_parsing and parsing \
+    stages are run one after the other and nothing is streamed.
+    '''
+
+    def run_stage(stage, command, stdout_fp, env, cancellation=None):
+        return {'stage': stage}
+
+    def run_stream(stage_commands, env, cancellation=None):
+        raise AssertionError('No stages should be streamed')
+
+    monkeypatch.setattr(stages, '_run_stage', run_stage)
+    monkeypatch.setattr(stages, '_run_stream', run_stream)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_fp = Path(temp_dir, 'test')
+        input_fp.touch()
+        stage_infos = stages.run_pipeline(input_fp,
+                                          Path(temp_dir, 'output'),
+                                          streaming=True,
+                                          first_stage='ptb_parsing')
+        assert [stage_info['stage'] for stage_info in stage_infos] == \
+            ['ptb_parsing', 'parsing']
+    finally:
+        shutil.rmtree(temp_dir)
@@ -9,11 +9,40 @@ conforms to the `CoNLL format\
 <http://universaldependencies.org/format.html>`_
 3. test_process_texts_exceptions - tests that the expected exceptions that \
 should be raised do raise in the correct situtation
+4. test_process_texts_timing_report - tests the timing report that can be \
+returned with the output of process_texts.
+5. test_process_texts_n_jobs - tests that splitting the texts into shards \
+that are processed in parallel gives the same output in the same order.
+6. test_process_texts_pre_tagged - tests that Tweets that have already been \
+tokenized and POS tagged give the same output as the raw text without \
+running the tagger.
+7. test_process_texts_until -- tests that stopping the pipeline after \
+tagging or token selection gives the tokens, POS tags and unselected tokens \
+of the full parse without running the parser.
+8. test_split_trivial -- tests that Tweets where no token is selected are \
+not parsed and that their parses are merged back in order. Does not require \
+the TweeboParser to be installed.
+9. test_process_texts_isolate_errors -- tests that the texts a failing \
+pipeline fails on are found by bisecting the batch, with a stand in for the \
+pipeline so that it does not require the TweeboParser to be installed.
+10. test_process_texts_timeout -- tests that a pipeline that does not \
+finish before its timeout is killed, its files removed and \
+PipelineTimeout raised, with a stand in for the pipeline so that it does \
+not require the TweeboParser to be installed.
+11. test_process_texts_fast_model -- tests that a missing fast parsing \
+model is reported before any stage runs, with a stand in for the pipeline \
+so that it does not require the TweeboParser to be installed.
 '''
 
+import io
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
 import pytest
 
-from tweebo import tweebo
+from tweebo import stages, tweebo
 
 
 TEST_SENTENCES_0 = [u"I predict I won't win a single game I bet on. "
@@ -355,6 +384,15 @@ def test_process_texts_exceptions():
     2. TypeError: This should be raised as the texts input is not a list.
     3. TypeError: This should be raises as the texts input is a list of ints \
     not a list of Strings.
+    4. ValueError: This should be raised when n_jobs is not a positive \
+    integer or -1
+    5. ValueError: This should be raised when the input_format is not \
+    `text`, `tagged` or `conll`
+    6. TypeError: This should be raised when the input_format is `tagged` \
+    and the texts are Strings not lists of (token, tag) pairs.
+    7. ValueError: This should be raised when a tagged token contains a tab.
+    8. ValueError: This should be raised when until is not one of \
+    `tagging`, `token_selection` or `parsing`
     '''
 
     test_sentence = ["Some text to process"]
@@ -364,3 +402,396 @@ def test_process_texts_exceptions():
         tweebo.process_texts('some text to process')
     with pytest.raises(TypeError):
         tweebo.process_texts([1, 2])
+    with pytest.raises(ValueError):
+        tweebo.process_texts(test_sentence, n_jobs=0)
+    with pytest.raises(ValueError):
+        tweebo.process_texts(test_sentence, input_format='tokens')
+    with pytest.raises(TypeError):
+        tweebo.process_texts(test_sentence, input_format='tagged')
+    with pytest.raises(ValueError):
+        tweebo.process_texts([[('Some\ttext', 'N')]], input_format='tagged')
+    with pytest.raises(ValueError):
+        tweebo.process_texts(test_sentence, until='tokenizing')
+
+
+def test_process_texts_timing_report():
+    '''
+    Tests :py:func:`tweebo.process_texts` when timing_report is True. We \
+    perform the following tests:
+    1. The output is the same as when no report is returned.
+    2. The report counts the Tweets and tokens.
+    3. The report contains the wall clock and CPU time, peak memory and \
+    bytes written of every stage of the pipeline in the order they were run.
+    4. The stage_callback is called with the same stage information.
+    '''
+
+    called_stages = []
+    output, report = tweebo.process_texts(TEST_SENTENCES_2,
+                                          stage_callback=called_stages.append,
+                                          timing_report=True)
+    assert output == [CONLL_0, '', CONLL_2]
+    assert report['tweets'] == 3
+    num_tokens = len(CONLL_0.splitlines()) + len(CONLL_2.splitlines())
+    assert report['tokens'] == num_tokens
+    assert [info['stage'] for info in report['stages']] == stages.STAGES
+    assert called_stages == report['stages']
+    for stage_info in report['stages']:
+        assert stage_info['wall_time'] > 0
+        assert stage_info['user_time'] >= 0
+        assert stage_info['system_time'] >= 0
+        assert stage_info['max_rss'] > 0
+        assert stage_info['bytes_written'] > 0
+    stage_time = sum(info['wall_time'] for info in report['stages'])
+    assert report['wall_time'] >= stage_time
+    assert report['user_time'] == sum(info['user_time']
+                                      for info in report['stages'])
+    assert report['max_rss'] == max(info['max_rss']
+                                    for info in report['stages'])
+    assert report['bytes_written'] > sum(info['bytes_written']
+                                         for info in report['stages'])
+
+
+def test_process_texts_n_jobs():
+    '''
+    Tests :py:func:`tweebo.process_texts` when n_jobs is greater than 1. We \
+    perform the following tests:
+    1. 3 sentences, where the 2nd is empty, split into 2 and 3 shards give \
+    the same conll output as 1 shard.
+    2. The stanford output is indexed in input order across the shards.
+    3. More jobs than texts and -1 (one job per CPU) give the same output.
+    4. The timing report contains every stage of every shard.
+    '''
+
+    expected_return = [CONLL_0, '', CONLL_2]
+    assert expected_return == tweebo.process_texts(TEST_SENTENCES_2,
+                                                   n_jobs=2)
+    assert expected_return == tweebo.process_texts(TEST_SENTENCES_2,
+                                                   n_jobs=3)
+    assert expected_return == tweebo.process_texts(TEST_SENTENCES_2,
+                                                   n_jobs=10)
+    assert expected_return == tweebo.process_texts(TEST_SENTENCES_2,
+                                                   n_jobs=-1)
+
+    expected_return = [{'index': 0,
+                        'basicDependencies': B_DEP_0, 'tokens': TOKENS_0},
+                       {'index': 1, 'basicDependencies': [], 'tokens': []},
+                       {'index': 2,
+                        'basicDependencies': B_DEP_2, 'tokens': TOKENS_2}]
+    assert expected_return == tweebo.process_texts(TEST_SENTENCES_2,
+                                                   output_type='stanford',
+                                                   n_jobs=3)
+
+    _, report = tweebo.process_texts(TEST_SENTENCES_2, timing_report=True,
+                                     n_jobs=2)
+    assert report['tweets'] == 3
+    shard_stages = [(info['shard'], info['stage'])
+                    for info in report['stages']]
+    assert sorted(shard_stages) == sorted((shard, stage)
+                                          for shard in range(2)
+                                          for stage in stages.STAGES)
+
+
+def test_process_texts_pre_tagged():
+    '''
+    Tests :py:func:`tweebo.process_texts` when the texts have already been \
+    tokenized and POS tagged. The tokens and tags are taken from the \
+    expected output of the raw texts. We perform the following tests:
+    1. Lists of (token, tag) pairs, where the 2nd Tweet is empty, give the \
+    same conll output as the raw texts.
+    2. CoNLL Strings in the ark tagger output format and CoNLL-X give the \
+    same stanford output as the raw texts.
+    3. The tagging and conversion stages are not run.
+    '''
+
+    tagged_0 = [(token['word'], token['pos']) for token in TOKENS_0]
+    tagged_2 = [(token['word'], token['pos']) for token in TOKENS_2]
+    output = tweebo.process_texts([tagged_0, [], tagged_2],
+                                  input_format='tagged')
+    assert output == [CONLL_0, '', CONLL_2]
+
+    tagger_conll_0 = u'\n'.join(u'{}\t{}\t0.99'.format(token, tag)
+                                for token, tag in tagged_0)
+    expected_return = [{'index': 0,
+                        'basicDependencies': B_DEP_0, 'tokens': TOKENS_0},
+                       {'index': 1,
+                        'basicDependencies': B_DEP_2, 'tokens': TOKENS_2}]
+    output, report = tweebo.process_texts([tagger_conll_0, CONLL_2],
+                                          output_type='stanford',
+                                          input_format='conll',
+                                          timing_report=True)
+    assert output == expected_return
+    assert [info['stage'] for info in report['stages']] == stages.STAGES[2:]
+
+
+def test_process_texts_until():
+    '''
+    Tests :py:func:`tweebo.process_texts` when the pipeline is stopped \
+    before parsing. We perform the following tests:
+    1. Stopping after tagging gives the same tokens and POS tags as the \
+    full parse with a HEAD and relation of `_` and no basicDependencies.
+    2. Stopping after token selection also gives a HEAD of -1 to the same \
+    tokens that have a HEAD of -1 in the full parse.
+    3. The parsing stages are not run.
+    '''
+
+    def expected_conll(conll, until):
+        lines = []
+        for line in conll.split(u'\n'):
+            columns = line.split(u'\t')
+            if until == 'tagging' or columns[6] != u'-1':
+                columns[6] = u'_'
+            columns[7] = u'_'
+            lines.append(u'\t'.join(columns))
+        return u'\n'.join(lines)
+
+    test_texts = TEST_SENTENCES_2
+    for until in ['tagging', 'token_selection']:
+        output, report = tweebo.process_texts(test_texts, until=until,
+                                              timing_report=True)
+        assert output == [expected_conll(CONLL_0, until), '',
+                          expected_conll(CONLL_2, until)]
+        last_stage = stages.STAGES.index(until)
+        assert [info['stage'] for info in report['stages']] == \
+            stages.STAGES[:last_stage + 1]
+
+    output = tweebo.process_texts(test_texts, output_type='stanford',
+                                  until='tagging')
+    assert [tweet['tokens'] for tweet in output] == [TOKENS_0, [], TOKENS_2]
+    assert all(tweet['basicDependencies'] == [] for tweet in output)
+    output = tweebo.process_texts(test_texts, output_type='stanford',
+                                  until='token_selection')
+    assert output[0]['basicDependencies'] == [
+        dependency for dependency in B_DEP_0 if dependency['governor'] == -1]
+
+
+def test_split_trivial():
+    '''
+    Tests :py:func:`tweebo._split_trivial` and \
+    :py:func:`tweebo._merge_parses` on token selection output of 3 Tweets \
+    where the 2nd Tweet has no selected tokens:
+    1. Only the 1st and 3rd Tweets are written to be parsed.
+    2. The 2nd Tweet is given a HEAD of -1 for every token, the same as the \
+    parser, and is merged back between the parsed Tweets.
+    3. When every Tweet is trivial nothing needs to be parsed.
+    '''
+
+    def selection_lines(tokens):
+        return [u'{}\t{}\t_\t{}\t{}\t_\t0\t_\t_\t_\t0110\t011010\t'
+                u'0110101\t{}'.format(index, token, tag, tag, selected)
+                for index, (token, tag, selected) in enumerate(tokens, 1)]
+
+    tweets = [selection_lines([(u'I', u'O', 1), (u'win', u'V', 1)]),
+              selection_lines([(u'#win', u'#', 0), (u'@me', u'@', 0)]),
+              selection_lines([(u'RT', u'~', 0), (u'yes', u'!', 1)])]
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        selection_fp = temp_dir.joinpath('selection')
+        with selection_fp.open('w', encoding='utf-8') as selection_file:
+            for lines in tweets:
+                selection_file.write(u'\n'.join(lines) + u'\n\n')
+        parse_fp = temp_dir.joinpath('parse')
+        trivial_parses = tweebo._split_trivial(selection_fp, parse_fp)
+        assert trivial_parses[0] is None and trivial_parses[2] is None
+        assert trivial_parses[1] == [u'1\t#win\t_\t#\t#\t_\t-1\t_',
+                                     u'2\t@me\t_\t@\t@\t_\t-1\t_']
+        with parse_fp.open('r', encoding='utf-8') as parse_file:
+            assert parse_file.read() == u'\n'.join(tweets[0]) + u'\n\n' + \
+                u'\n'.join(tweets[2]) + u'\n\n'
+
+        parsed_fp = temp_dir.joinpath('parsed')
+        with parsed_fp.open('w', encoding='utf-8') as parsed_file:
+            parsed_file.write(u'1\tI\t_\tO\tO\t_\t2\t_\n'
+                              u'2\twin\t_\tV\tV\t_\t0\t_\n\n'
+                              u'1\tRT\t_\t~\t~\t_\t-1\t_\n'
+                              u'2\tyes\t_\t!\t!\t_\t0\t_\n\n')
+        result_fp = temp_dir.joinpath('result')
+        tweebo._merge_parses(trivial_parses, parsed_fp, result_fp)
+        output = tweebo._to_conll(result_fp)
+        assert len(output) == 3
+        assert output[0].startswith(u'1\tI\t_\tO\tO\t_\t2\t_\t_\t_')
+        assert output[1] == (u'1\t#win\t_\t#\t#\t_\t-1\t_\t_\t_\n'
+                             u'2\t@me\t_\t@\t@\t_\t-1\t_\t_\t_')
+        assert output[2].startswith(u'1\tRT')
+
+        with selection_fp.open('w', encoding='utf-8') as selection_file:
+            selection_file.write(u'\n'.join(tweets[1]) + u'\n\n')
+        trivial_parses = tweebo._split_trivial(selection_fp, parse_fp)
+        assert trivial_parses[0] is not None
+        with parse_fp.open('r', encoding='utf-8') as parse_file:
+            assert parse_file.read() == u''
+        tweebo._merge_parses(trivial_parses, temp_dir.joinpath('missing'),
+                             result_fp)
+        assert tweebo._to_conll(result_fp) == [output[1]]
+    finally:
+        shutil.rmtree(str(temp_dir))
+
+
+def _failing_process_file(process_fp, stage_callback=None, **kwargs):
+    '''
+    Stand in for :py:func:`tweebo.tweebo._process_file` that fails if any \
+    of the texts contain `BAD` and otherwise makes each word a token \
+    attached to the root.
+    '''
+
+    with io.open(str(process_fp), 'r', encoding='utf-8') as process_file:
+        texts = process_file.read().split(u'\n')
+    stage_info = {'stage': 'parsing', 'wall_time': 1.0, 'user_time': 1.0,
+                  'system_time': 0.0, 'max_rss': 1, 'bytes_written': 0}
+    if stage_callback is not None:
+        stage_callback(stage_info)
+    if any(u'BAD' in text for text in texts):
+        raise SystemError('The pipeline failed')
+    result_fp = '{}.predict'.format(process_fp)
+    with io.open(result_fp, 'w', encoding='utf-8') as result_file:
+        for text in texts:
+            for index, word in enumerate(text.split(), 1):
+                result_file.write(u'{}\t{}\t_\tN\tN\t_\t0\t_\n'
+                                  .format(index, word))
+            result_file.write(u'\n')
+    return [stage_info]
+
+
+def test_process_texts_isolate_errors(monkeypatch):
+    '''
+    Tests the isolate_errors option of :py:func:`tweebo.process_texts` \
+    where the pipeline fails on any batch containing `BAD`:
+    1. Without isolate_errors the whole batch fails with SystemError.
+    2. With isolate_errors the output of the texts that fail is None, the \
+    error_callback is called with their index and text and the other texts \
+    are processed.
+    3. The timing report counts every run of the pipeline but only the \
+    texts that did not fail.
+    4. The Stanford index of each text is its index in the texts when the \
+    bisected batches are sharded.
+    5. When the pipeline fails on every text, e.g. java is missing, the \
+    texts are not bisected and the error is raised after one run of the \
+    texts and one of a probe text.
+    '''
+
+    monkeypatch.setattr(tweebo, '_process_file', _failing_process_file)
+    texts = [u'a b', u'', u'BAD one', u'c', u'BAD two', u'd']
+    with pytest.raises(SystemError):
+        tweebo.process_texts(texts)
+
+    errors = []
+    output, report = tweebo.process_texts(texts, isolate_errors=True,
+                                          error_callback=errors.append,
+                                          timing_report=True)
+    assert output == [u'1\ta\t_\tN\tN\t_\t0\t_\t_\t_\n'
+                      u'2\tb\t_\tN\tN\t_\t0\t_\t_\t_', u'', None,
+                      u'1\tc\t_\tN\tN\t_\t0\t_\t_\t_', None,
+                      u'1\td\t_\tN\tN\t_\t0\t_\t_\t_']
+    assert [(error['index'], error['text']) for error in errors] == \
+        [(2, u'BAD one'), (4, u'BAD two')]
+    assert report['tweets'] == 4
+    assert len(report['stages']) > 2
+    assert report['user_time'] == len(report['stages'])
+
+    output = tweebo.process_texts(texts, output_type='stanford', n_jobs=2,
+                                  isolate_errors=True)
+    assert [None if tweet_data is None else tweet_data['index']
+            for tweet_data in output] == [0, 1, None, 3, None, 5]
+
+    runs = []
+
+    def broken_process_file(process_fp, **kwargs):
+        runs.append(process_fp)
+        raise SystemError('java: command not found')
+
+    monkeypatch.setattr(tweebo, '_process_file', broken_process_file)
+    errors = []
+    with pytest.raises(SystemError) as error:
+        tweebo.process_texts(texts, isolate_errors=True,
+                             error_callback=errors.append)
+    assert 'java' in str(error.value)
+    assert len(runs) == 2
+    assert errors == []
+
+
+def test_process_texts_timeout(monkeypatch):
+    '''
+    Tests the timeout and deadline of :py:func:`tweebo.process_texts` \
+    where the pipeline is a stage that sleeps for 30 seconds:
+    1. The pipeline is killed once the timeout passes and PipelineTimeout \
+    is raised, rather than SystemError, and the directory the texts were \
+    written to is removed.
+    2. With isolate_errors a timeout is not bisected.
+    3. A deadline that has passed times out straight away.
+    4. A given cancellation stops waiting for the timeout once the texts \
+    are processed.
+    5. ValueError is raised when the timeout is not positive.
+    '''
+
+    process_fps = []
+
+    def stuck_process_file(process_fp, cancellation=None, **kwargs):
+        process_fps.append(process_fp)
+        stages._run_stage('parsing', ['sleep', '30'],
+                          Path('{}.predict'.format(process_fp)),
+                          stages._stage_env(), cancellation)
+
+    monkeypatch.setattr(tweebo, '_process_file', stuck_process_file)
+    start_time = time.time()
+    with pytest.raises(stages.PipelineTimeout):
+        tweebo.process_texts([u'a b'], timeout=0.5)
+    assert time.time() - start_time < 10
+    assert not process_fps[0].parent.exists()
+
+    errors = []
+    start_time = time.time()
+    with pytest.raises(stages.PipelineTimeout):
+        tweebo.process_texts([u'a', u'b'], isolate_errors=True,
+                             error_callback=errors.append, timeout=0.5)
+    assert time.time() - start_time < 10
+    assert errors == []
+
+    start_time = time.time()
+    with pytest.raises(stages.PipelineTimeout):
+        tweebo.process_texts([u'a'], deadline=start_time - 1)
+    assert time.time() - start_time < 10
+
+    monkeypatch.setattr(tweebo, '_process_file', _failing_process_file)
+    cancellation = stages.Cancellation()
+    output = tweebo.process_texts([u'a'], cancellation=cancellation,
+                                  timeout=0.2)
+    assert output == [u'1\ta\t_\tN\tN\t_\t0\t_\t_\t_']
+    time.sleep(0.4)
+    assert not cancellation.cancelled
+    with pytest.raises(ValueError):
+        tweebo.process_texts([u'a'], timeout=0)
+
+
+def test_process_texts_fast_model(monkeypatch):
+    '''
+    Tests :py:func:`tweebo.process_texts` when fast:
+    1. Without the fast parsing model IOError is raised before the \
+    pipeline is run, even for texts that would not need parsing.
+    2. Stopping before parsing does not need the fast parsing model.
+    3. With the fast parsing model the texts are parsed.
+    '''
+
+    process_fps = []
+
+    def process_file(process_fp, **kwargs):
+        process_fps.append(process_fp)
+        return _failing_process_file(process_fp, **kwargs)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        model_fp = Path(temp_dir, 'fast_parsing_model')
+        monkeypatch.setattr(stages, 'FAST_PARSING_MODEL', model_fp)
+        monkeypatch.setattr(tweebo, '_process_file', process_file)
+        for texts in [[u'a b'], [u'#hashtag @mention']]:
+            with pytest.raises(IOError):
+                tweebo.process_texts(texts, fast=True)
+        assert process_fps == []
+
+        tweebo.process_texts([u'a'], fast=True, until='token_selection')
+        assert len(process_fps) == 1
+
+        model_fp.touch()
+        output = tweebo.process_texts([u'a'], fast=True)
+        assert output == [u'1\ta\t_\tN\tN\t_\t0\t_\t_\t_']
+        assert len(process_fps) == 2
+    finally:
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,132 @@
+'''
+Tests the functions and classes within :py:mod:`tweebo.unix_socket`. Only \
+empty texts, which do not run the pipeline, are parsed so none of the tests \
+require the TweeboParser to be installed. The test functions within this \
+module are the following:
+1. test_frames -- tests that frames are read as they were written and that \
+frames that are too long or cut short raise an error.
+2. test_unix_frame_server -- tests that a connection can send several \
+requests and that invalid and too long frames are answered with an error.
+3. test_unix_socket_server -- tests that the API server answers requests \
+sent over the Unix domain socket the same as HTTP requests.
+'''
+
+import os
+import shutil
+import socket
+import struct
+import tempfile
+
+import pytest
+
+from tweebo import server, unix_socket
+
+
+def test_frames():
+    '''
+    Tests :py:func:`tweebo.unix_socket.read_frame` and \
+    :py:func:`tweebo.unix_socket.write_frame`:
+    1. Frames, including an empty frame, are read in the order they were \
+    written with the same bodies.
+    2. None is returned once the other end is closed.
+    3. A frame longer than MAX_FRAME_BYTES raises ValueError.
+    4. A frame cut short raises EOFError.
+    '''
+
+    writer, reader = socket.socketpair()
+    unix_socket.write_frame(writer, b'first')
+    unix_socket.write_frame(writer, b'')
+    writer.close()
+    assert unix_socket.read_frame(reader) == b'first'
+    assert unix_socket.read_frame(reader) == b''
+    assert unix_socket.read_frame(reader) is None
+    reader.close()
+
+    writer, reader = socket.socketpair()
+    writer.sendall(struct.pack('>I', unix_socket.MAX_FRAME_BYTES + 1))
+    with pytest.raises(ValueError):
+        unix_socket.read_frame(reader)
+    writer.sendall(struct.pack('>I', 10) + b'short')
+    writer.close()
+    with pytest.raises(EOFError):
+        unix_socket.read_frame(reader)
+    reader.close()
+
+
+def _echo(message):
+    if message.get('fail'):
+        raise RuntimeError('Failed')
+    return {'status': 200, 'data': message['texts']}
+
+
+def test_unix_frame_server():
+    '''
+    Tests :py:class:`tweebo.unix_socket.UnixFrameServer` with a handler \
+    that echoes the texts:
+    1. One client connection sends several requests.
+    2. A handler that fails returns 500 and the connection is kept open.
+    3. A frame that is not MessagePack returns 400.
+    4. A frame that is too long returns 413 and the connection is closed.
+    5. The socket is removed when the server is closed.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'tweebo.sock')
+    frame_server = unix_socket.serve_in_background(path, _echo)
+    try:
+        with unix_socket.UnixSocketClient(path, timeout=5) as client:
+            assert client.parse([u'a', u'b']) == [u'a', u'b']
+            assert client.parse([u'c']) == [u'c']
+            with pytest.raises(unix_socket.SocketRequestError) as error:
+                client.parse([u'd'], fail=True)
+            assert error.value.status_code == 500
+            assert client.parse([u'e']) == [u'e']
+
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(5)
+        connection.connect(path)
+        unix_socket.write_frame(connection, b'\xc1')
+        response = unix_socket._decode(unix_socket.read_frame(connection))
+        assert response['status'] == 400
+        connection.sendall(struct.pack('>I',
+                                       unix_socket.MAX_FRAME_BYTES + 1))
+        response = unix_socket._decode(unix_socket.read_frame(connection))
+        assert response['status'] == 413
+        assert unix_socket.read_frame(connection) is None
+        connection.close()
+    finally:
+        frame_server.shutdown()
+        frame_server.server_close()
+        assert not os.path.exists(path)
+        shutil.rmtree(temp_dir)
+
+
+def test_unix_socket_server():
+    '''
+    Tests :py:func:`tweebo.server._socket_request` served over a Unix \
+    domain socket:
+    1. Empty texts are parsed in both output types.
+    2. An invalid request, or one with a field that is not part of the \
+    API, returns 422 and a request that is not a map 400.
+    '''
+
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'tweebo.sock')
+    frame_server = unix_socket.serve_in_background(path,
+                                                   server._socket_request)
+    try:
+        with unix_socket.UnixSocketClient(path, timeout=5) as client:
+            assert client.parse([u'', u' ']) == [u'', u'']
+            assert client.parse([u''], 'stanford', priority='bulk') == \
+                [{'index': 0, 'basicDependencies': [], 'tokens': []}]
+            with pytest.raises(unix_socket.SocketRequestError) as error:
+                client.parse([u''], 'xml')
+            assert error.value.status_code == 422
+            with pytest.raises(unix_socket.SocketRequestError) as error:
+                client.parse([u''], n_jobs=64)
+            assert error.value.status_code == 422
+            assert client.request([u'texts'])['status'] == 400
+    finally:
+        frame_server.shutdown()
+        frame_server.server_close()
+        shutil.rmtree(temp_dir)
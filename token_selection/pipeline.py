@@ -33,18 +33,25 @@ def print_line_withmodification(cline, tag):
     print(s)
 
 
-def main(testfile, featsfile):
-    labelset = ['0', '1', '*']
-    test = codecs.open(testfile, 'r', 'utf-8')
-    feats = set([])
-    sents = []
-    tagseqs = []
-    postagseqs = []
-    vecs1 = []
-    vecs2 = []
-    
-    contents = []
+def read_weights(featsfile):
+    weights = {}
+    feats = open(featsfile, 'r')
+    while 1:
+        line = feats.readline()
+        if not line:
+            break
+        line = line.strip()
+        f, wt = line.split(' ')
+        weights[f] = float(wt)
+    feats.close()
+    return weights
+
 
+def read_sentences(testfile):
+    # Yields each sentence as soon as it has been read, so that when the
+    # input is piped from the previous stage the tokens of early sentences
+    # are selected before the input ends
+    test = codecs.open(testfile, 'r', 'utf-8')
     sent = []
     tags = []
     postags = []
@@ -53,20 +60,13 @@ def main(testfile, featsfile):
 
     content = []
 
-
-
     while 1:
         line = test.readline()
         if not line:
             break
         line = line.strip()
         if line == "":
-            sents.append(sent)
-            tagseqs.append(tags)
-            postagseqs.append(postags)
-            vecs1.append(vec1)
-            vecs2.append(vec2)
-            contents.append(content)
+            yield sent, tags, postags, vec1, vec2, content
 
             sent = []
             tags = []
@@ -91,30 +91,24 @@ def main(testfile, featsfile):
         content.append(cline)
     test.close()
 
-    weights = {}
-    feats = open(featsfile, 'r')
-    while 1:
-        line = feats.readline()
-        if not line:
-            break
-        line = line.strip()
-        f, wt = line.split(' ')
-        weights[f] = float(wt)
-    feats.close()
+
+def main(testfile, featsfile):
+    labelset = ['0', '1', '*']
+    # The weights are read first as the test file may be a pipe
+    weights = read_weights(featsfile)
 
     acc = 0.0
     tot = 0
-    for i in range(len(sents)):
-        sent = sents[i]
-        postags = postagseqs[i]
-        vec1 = vecs1[i]
-        vec2 = vecs2[i] 
+    for sent, tagseq, postags, vec1, vec2, content in \
+            read_sentences(testfile):
         tags, f = viterbi.execute(sent, labelset, postags, vec1, vec2, weights)
         for j in range(len(tags)):
-            print_line_withmodification(contents[i][j],tags[j])
-            if tags[j] == tagseqs[i][j]:
+            print_line_withmodification(content[j],tags[j])
+            if tags[j] == tagseq[j]:
                 acc += 1
         print 
+        # The next stage can start on the sentence straight away
+        sys.stdout.flush()
         tot += len(tags)
         #print ' '.join(sent)
         #print ' '.join(tags), '\n', ' '.join(tagseqs[i])
@@ -0,0 +1,56 @@
+'''
+Parses a corpus, one text per line, in chunks that are checkpointed so that \
+the run can be resumed where it stopped see :py:mod:`tweebo.bulk`
+
+Usage: python -m tweebo INPUT_FILE OUTPUT_DIR [--chunk-size 10000] [--jobs 4]
+
+Running the same command again resumes from the manifest in OUTPUT_DIR, \
+only parsing the chunks that have not been written.
+'''
+
+import argparse
+from pathlib import Path
+import sys
+
+from bulk import parse_corpus
+
+description = 'Parses a corpus with TweeboParser in resumable chunks'
+parser = argparse.ArgumentParser(prog='python -m tweebo',
+                                 description=description)
+parser.add_argument('input_file', type=str,
+                    help='File containing one text per line')
+parser.add_argument('output_dir', type=str,
+                    help='Directory to write the parsed chunks and the '
+                         'checkpoint manifest to')
+parser.add_argument('--chunk-size', type=int, default=10000,
+                    help='Number of lines in each chunk (default: 10000)')
+parser.add_argument('--jobs', type=int, default=1,
+                    help='Number of chunks to parse in parallel (default: 1)')
+parser.add_argument('--output-type', type=str, default='conll',
+                    choices=['conll', 'stanford'])
+parser.add_argument('--isolate-errors', action='store_true',
+                    help='Find the texts the pipeline fails on by re-running '
+                         'the halves of a failed chunk, writing them to the '
+                         'chunk\'s errors file instead of failing the run')
+parser.add_argument('--quiet', action='store_true',
+                    help='Do not write the progress to standard error')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    try:
+        manifest = parse_corpus(Path(args.input_file), Path(args.output_dir),
+                                chunk_size=args.chunk_size, jobs=args.jobs,
+                                output_type=args.output_type,
+                                progress_file=None if args.quiet
+                                else sys.stderr,
+                                isolate_errors=args.isolate_errors)
+    except (ValueError, SystemError) as error:
+        sys.stderr.write('{}\n'.format(error))
+        sys.exit(1)
+    sys.stderr.write('Parsed {} chunks into {}\n'
+                     .format(len(manifest['chunks']), args.output_dir))
+    failed_texts = sum(chunk.get('failed_texts', 0)
+                       for chunk in manifest['chunks'].values())
+    if failed_texts:
+        sys.stderr.write('{} texts failed to parse, see the chunk-*.errors.'
+                         'jsonl files\n'.format(failed_texts))
@@ -0,0 +1,452 @@
+'''
+Admission control for the API server in :py:mod:`tweebo.server`. Each \
+pipeline starts a JVM for the tagger and two TurboParser processes, so \
+running too many pipelines at the same time makes every request slower. \
+The :py:class:`AdmissionController` limits the number of pipelines that \
+run at the same time, requests that arrive when all pipelines are running \
+wait in a bounded queue and are admitted in the order they arrived. When \
+the queue is full the request is rejected straight away with \
+:py:class:`QueueFull`, which the server returns as `503` with a \
+`Retry-After` header. A request given a deadline that is still waiting \
+when the deadline passes leaves the queue with :py:class:`QueueTimeout`. A \
+request that is larger than the whole queue of its lane could never be \
+queued, so it is rejected with :py:class:`RequestTooLarge`, which the \
+server returns as `413` without a `Retry-After` header.
+
+Each request belongs to a priority lane, one of `LANES`, and each lane has \
+its own queue so that interactive requests do not wait behind bulk jobs:
+1. interactive - Requests that a person is waiting on. When a pipeline \
+becomes free the interactive queue is admitted first.
+2. bulk - Batch jobs that can wait.
+
+Pipelines can be reserved for a lane, which only that lane can use, the \
+other pipelines are shared by all lanes and go to the lanes in the order \
+of `LANES`. Reserving pipelines for the interactive lane means an \
+interactive request does not wait for a bulk request to finish and \
+reserving pipelines for the bulk lane means bulk requests still make \
+progress when interactive requests keep every shared pipeline busy.
+
+The queue of each lane is bounded by any of the following:
+1. The number of requests waiting.
+2. The number of Tweets in the waiting requests.
+3. The number of tokens in the waiting requests, estimated before parsing \
+see :py:func:`estimate_tokens`
+'''
+
+from collections import deque
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+# Weight of the latest pipeline duration in the moving average used to
+# estimate how long a rejected request should wait before retrying.
+DURATION_WEIGHT = 0.2
+# In priority order, the first lane is admitted first.
+LANES = ['interactive', 'bulk']
+DEFAULT_LANE = 'interactive'
+
+
+class QueueFull(Exception):
+    '''
+    Raised when a request cannot be queued as the queue is full.
+
+    :param message: Which limit of the queue was reached.
+    :param retry_after: Estimated seconds until the request could be \
+    admitted.
+    :type message: str
+    :type retry_after: int
+    '''
+
+    def __init__(self, message, retry_after):
+        super(QueueFull, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeout(Exception):
+    '''
+    Raised when a request is still waiting in the queue at its deadline.
+    '''
+
+
+class RequestTooLarge(Exception):
+    '''
+    Raised when a request has more Tweets or tokens than the queue of a \
+    lane can hold, retrying the request would never succeed.
+    '''
+
+
+def estimate_tokens(texts, input_format='text'):
+    '''
+    :param texts: Texts of a request see :py:func:`tweebo.process_texts`
+    :param input_format: See :py:func:`tweebo.process_texts`
+    :type texts: list
+    :type input_format: str
+    :return: Estimated number of tokens in the texts. For raw text the \
+    number of white space separated words, which is less than the number \
+    of tokens when punctuation is split from words, and for tagged input \
+    the number of tokens.
+    :rtype: int
+    '''
+
+    num_tokens = 0
+    for text in texts:
+        if input_format == 'text':
+            num_tokens += len(text.split())
+        elif input_format == 'conll':
+            num_tokens += len([line for line in text.splitlines()
+                               if line.strip()])
+        else:
+            num_tokens += len(text)
+    return num_tokens
+
+
+class _Ticket(object):
+    '''
+    A request waiting in the queue, admitted is set once the request can \
+    run its pipeline.
+    '''
+
+    def __init__(self, tweets, tokens):
+        self.tweets = tweets
+        self.tokens = tokens
+        self.admitted = threading.Event()
+
+
+class _Lane(object):
+    '''
+    The queue and the running requests of a priority lane.
+    '''
+
+    def __init__(self, reserved):
+        self.reserved = reserved
+        self.running = 0
+        self.queued_tweets = 0
+        self.queued_tokens = 0
+        self.queue = deque()
+
+
+class AdmissionController(object):
+    '''
+    Limits the number of pipelines running at the same time and queues the \
+    requests that cannot run yet in the queue of their lane see \
+    :py:mod:`tweebo.admission`
+
+    :param max_pipelines: Number of pipelines that can run at the same time.
+    :param max_queued_requests: Number of requests that can wait in the \
+    queue of each lane. If None the requests are not limited.
+    :param max_queued_tweets: Number of Tweets that can wait in the queue \
+    of each lane. If None the Tweets are not limited.
+    :param max_queued_tokens: Number of estimated tokens that can wait in \
+    the queue of each lane. If None the tokens are not limited.
+    :param reserved_pipelines: Dictionary of lane to the number of \
+    pipelines that only that lane can use. If None no pipelines are \
+    reserved and the lanes only differ in the order they are admitted.
+    :type max_pipelines: int
+    :type max_queued_requests: int
+    :type max_queued_tweets: int
+    :type max_queued_tokens: int
+    :type reserved_pipelines: Dict
+    :raises ValueError: If max_pipelines is not positive, any of the \
+    queue limits or reserved pipelines are negative, a reserved lane is \
+    not in `LANES` or more pipelines are reserved than max_pipelines.
+    '''
+
+    def __init__(self, max_pipelines, max_queued_requests,
+                 max_queued_tweets=None, max_queued_tokens=None,
+                 reserved_pipelines=None):
+        if max_pipelines < 1:
+            raise ValueError('max_pipelines has to be positive not {}'
+                             .format(max_pipelines))
+        for limit in [max_queued_requests, max_queued_tweets,
+                      max_queued_tokens]:
+            if limit is not None and limit < 0:
+                raise ValueError('The queue limits cannot be negative: {}'
+                                 .format(limit))
+        reserved_pipelines = reserved_pipelines or {}
+        for lane, reserved in reserved_pipelines.items():
+            if lane not in LANES:
+                raise ValueError('Lane {} is not one of {}'
+                                 .format(lane, LANES))
+            if reserved < 0:
+                raise ValueError('The reserved pipelines of lane {} cannot '
+                                 'be negative: {}'.format(lane, reserved))
+        if sum(reserved_pipelines.values()) > max_pipelines:
+            raise ValueError('{} pipelines are reserved but there are only {}'
+                             .format(sum(reserved_pipelines.values()),
+                                     max_pipelines))
+        self.max_pipelines = max_pipelines
+        self.max_queued_requests = max_queued_requests
+        self.max_queued_tweets = max_queued_tweets
+        self.max_queued_tokens = max_queued_tokens
+        self.shared_pipelines = max_pipelines - \
+            sum(reserved_pipelines.values())
+        self._lanes = {lane: _Lane(reserved_pipelines.get(lane, 0))
+                       for lane in LANES}
+        self._lock = threading.Lock()
+        self._mean_duration = None
+
+    def _get_lanes(self, lane):
+        '''
+        :param lane: A lane or None for all lanes.
+        :type lane: str or None
+        :return: The lanes to count.
+        :rtype: list[_Lane]
+        :raises ValueError: If the lane is not in `LANES`
+        '''
+
+        if lane is None:
+            return list(self._lanes.values())
+        if lane not in self._lanes:
+            raise ValueError('Lane {} is not one of {}'.format(lane, LANES))
+        return [self._lanes[lane]]
+
+    def running(self, lane=None):
+        '''
+        :param lane: The lane to count, if None all lanes.
+        :type lane: str or None
+        :return: Number of requests running a pipeline.
+        :rtype: int
+        '''
+
+        return sum(lane_state.running
+                   for lane_state in self._get_lanes(lane))
+
+    def queued_requests(self, lane=None):
+        '''
+        :param lane: The lane to count, if None all lanes.
+        :type lane: str or None
+        :return: Number of requests waiting in the queue.
+        :rtype: int
+        '''
+
+        return sum(len(lane_state.queue)
+                   for lane_state in self._get_lanes(lane))
+
+    def queued_tweets(self, lane=None):
+        '''
+        :param lane: The lane to count, if None all lanes.
+        :type lane: str or None
+        :return: Number of Tweets waiting in the queue.
+        :rtype: int
+        '''
+
+        return sum(lane_state.queued_tweets
+                   for lane_state in self._get_lanes(lane))
+
+    def queued_tokens(self, lane=None):
+        '''
+        :param lane: The lane to count, if None all lanes.
+        :type lane: str or None
+        :return: Estimated number of tokens waiting in the queue.
+        :rtype: int
+        '''
+
+        return sum(lane_state.queued_tokens
+                   for lane_state in self._get_lanes(lane))
+
+    def _can_run(self, lane):
+        '''
+        :param lane: The lane of the request.
+        :type lane: _Lane
+        :return: True if a pipeline reserved for the lane or a shared \
+        pipeline is free.
+        :rtype: bool
+        '''
+
+        if lane.running < lane.reserved:
+            return True
+        shared_running = sum(max(0, other.running - other.reserved)
+                             for other in self._lanes.values())
+        return shared_running < self.shared_pipelines
+
+    def retry_after(self, lane=DEFAULT_LANE):
+        '''
+        :param lane: The lane of the request.
+        :type lane: str
+        :return: Estimated whole seconds until a request arriving now \
+        would be admitted, based on the average duration of the pipelines, \
+        the number of requests ahead of it in its lane and the number of \
+        pipelines the lane can use. At least 1.
+        :rtype: int
+        '''
+
+        lane_state = self._lanes[lane]
+        mean_duration = self._mean_duration or 1.0
+        pipelines = max(1, lane_state.reserved + self.shared_pipelines)
+        waves = (len(lane_state.queue) + 1) / float(pipelines)
+        return max(1, int(math.ceil(mean_duration * waves)))
+
+    def _queue_full(self, lane, tweets, tokens):
+        '''
+        :param lane: The lane of the request.
+        :param tweets: Number of Tweets in the request.
+        :param tokens: Estimated number of tokens in the request.
+        :type lane: _Lane
+        :type tweets: int
+        :type tokens: int
+        :return: The limit that queueing the request would go over or None \
+        if the request can be queued.
+        :rtype: str or None
+        '''
+
+        if self.max_queued_requests is not None and \
+                len(lane.queue) >= self.max_queued_requests:
+            return 'The queue is full with {} of at most {} requests'.format(
+                len(lane.queue), self.max_queued_requests)
+        if self.max_queued_tweets is not None and \
+                lane.queued_tweets + tweets > self.max_queued_tweets:
+            return 'The queue is full with {} of at most {} Tweets'.format(
+                lane.queued_tweets, self.max_queued_tweets)
+        if self.max_queued_tokens is not None and \
+                lane.queued_tokens + tokens > self.max_queued_tokens:
+            return 'The queue is full with {} of at most {} tokens'.format(
+                lane.queued_tokens, self.max_queued_tokens)
+        return None
+
+    def _too_large(self, tweets, tokens):
+        '''
+        :param tweets: Number of Tweets in the request.
+        :param tokens: Estimated number of tokens in the request.
+        :type tweets: int
+        :type tokens: int
+        :return: The limit that the request alone goes over or None if \
+        the request fits in an empty queue.
+        :rtype: str or None
+        '''
+
+        if self.max_queued_tweets is not None and \
+                tweets > self.max_queued_tweets:
+            return 'The request has {} Tweets but at most {} can be ' \
+                   'queued'.format(tweets, self.max_queued_tweets)
+        if self.max_queued_tokens is not None and \
+                tokens > self.max_queued_tokens:
+            return 'The request has {} tokens but at most {} can be ' \
+                   'queued'.format(tokens, self.max_queued_tokens)
+        return None
+
+    def _enqueue(self, lane_name, tweets, tokens):
+        '''
+        :param lane_name: The lane of the request.
+        :param tweets: Number of Tweets in the request.
+        :param tokens: Estimated number of tokens in the request.
+        :type lane_name: str
+        :type tweets: int
+        :type tokens: int
+        :return: A ticket that is admitted once the request can run.
+        :rtype: _Ticket
+        :raises QueueFull: If the request has to wait and the queue of its \
+        lane is full.
+        '''
+
+        ticket = _Ticket(tweets, tokens)
+        lane = self._lanes[lane_name]
+        with self._lock:
+            if not lane.queue and self._can_run(lane):
+                lane.running += 1
+                ticket.admitted.set()
+                return ticket
+            full_message = self._queue_full(lane, tweets, tokens)
+            if full_message is not None:
+                raise QueueFull('{} in the {} lane'.format(full_message,
+                                                           lane_name),
+                                self.retry_after(lane_name))
+            lane.queue.append(ticket)
+            lane.queued_tweets += tweets
+            lane.queued_tokens += tokens
+            return ticket
+
+    def _release(self, finished_lane, duration):
+        '''
+        Frees the pipeline of a finished request and admits the requests at \
+        the front of the queues, taking the lanes in priority order.
+
+        :param finished_lane: The lane of the finished request.
+        :param duration: Seconds the finished request ran for.
+        :type finished_lane: str
+        :type duration: float
+        :return: None
+        '''
+
+        with self._lock:
+            self._lanes[finished_lane].running -= 1
+            if self._mean_duration is None:
+                self._mean_duration = duration
+            else:
+                self._mean_duration += DURATION_WEIGHT * \
+                    (duration - self._mean_duration)
+            for lane_name in LANES:
+                lane = self._lanes[lane_name]
+                while lane.queue and self._can_run(lane):
+                    ticket = lane.queue.popleft()
+                    lane.queued_tweets -= ticket.tweets
+                    lane.queued_tokens -= ticket.tokens
+                    lane.running += 1
+                    ticket.admitted.set()
+
+    def _withdraw(self, lane_name, ticket):
+        '''
+        Removes a request from the queue of its lane, unless it was \
+        admitted in the meantime.
+
+        :param lane_name: The lane of the request.
+        :param ticket: The ticket of the request.
+        :type lane_name: str
+        :type ticket: _Ticket
+        :return: None
+        :raises QueueTimeout: If the request was removed from the queue.
+        '''
+
+        lane = self._lanes[lane_name]
+        with self._lock:
+            if ticket.admitted.is_set():
+                return
+            lane.queue.remove(ticket)
+            lane.queued_tweets -= ticket.tweets
+            lane.queued_tokens -= ticket.tokens
+        raise QueueTimeout('The request reached its deadline while waiting '
+                           'in the {} lane'.format(lane_name))
+
+    @contextmanager
+    def admit(self, tweets, tokens, lane=DEFAULT_LANE, deadline=None):
+        '''
+        Context manager that waits until the request can run its pipeline \
+        and frees the pipeline when the request finishes e.g.
+        `with controller.admit(len(texts), estimate_tokens(texts)):`
+
+        :param tweets: Number of Tweets in the request.
+        :param tokens: Estimated number of tokens in the request.
+        :param lane: The priority lane of the request, one of `LANES`
+        :param deadline: Optional time, in seconds since the epoch, after \
+        which the request stops waiting.
+        :type tweets: int
+        :type tokens: int
+        :type lane: str
+        :type deadline: float
+        :return: The seconds the request waited in the queue.
+        :rtype: float
+        :raises ValueError: If the lane is not in `LANES`
+        :raises RequestTooLarge: If the request has more Tweets or tokens \
+        than the queue can hold, whether or not it would have to wait.
+        :raises QueueFull: If the request has to wait and the queue of its \
+        lane is full.
+        :raises QueueTimeout: If the request is still waiting at the \
+        deadline, the request is removed from the queue.
+        '''
+
+        if lane not in self._lanes:
+            raise ValueError('Lane {} is not one of {}'.format(lane, LANES))
+        too_large_message = self._too_large(tweets, tokens)
+        if too_large_message is not None:
+            raise RequestTooLarge(too_large_message)
+        start_time = time.time()
+        ticket = self._enqueue(lane, tweets, tokens)
+        if deadline is None:
+            ticket.admitted.wait()
+        elif not ticket.admitted.wait(max(0.0, deadline - time.time())):
+            self._withdraw(lane, ticket)
+        admitted_time = time.time()
+        try:
+            yield admitted_time - start_time
+        finally:
+            self._release(lane, time.time() - admitted_time)
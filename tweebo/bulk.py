@@ -0,0 +1,343 @@
+'''
+Parses large corpora in chunks so that a run that stops part way through, \
+e.g. due to a crash, can be resumed without re-parsing the chunks that \
+finished. Used by the `python -m tweebo` command see :py:mod:`tweebo.__main__`
+
+The input file, one text per line, is read in chunks of `chunk_size` lines \
+and each chunk is parsed by :py:func:`tweebo.process_texts`. The output of \
+each chunk is written to its own file in the output directory:
+1. `chunk-<index>.jsonl` - One JSON value per line, one line per input \
+line in input order. For the `conll` output type each value is the CoNLL \
+String of the Tweet and for `stanford` it is the Tweet's dictionary, where \
+`index` is the line number of the Tweet in the input file starting at 0.
+2. `manifest.json` - The checkpoint manifest, which records the input \
+file, chunk size, output type and every chunk that has been written.
+3. `chunk-<index>.errors.jsonl` - When isolating errors, the texts of the \
+chunk that the pipeline failed on, one JSON object per line with the \
+`line` number of the text in the input file, the `text` and the `error`. \
+Their output in the chunk file is `null`. See :py:func:`tweebo.process_texts`
+
+Chunk files are written to a temporary name and renamed once complete, and \
+the manifest is rewritten the same way after every chunk, so a chunk is \
+either recorded as complete or is parsed again when the run is resumed.
+'''
+
+from collections import OrderedDict
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+
+from tweebo import process_texts
+
+MANIFEST_NAME = 'manifest.json'
+# Settings that must be the same to resume from a manifest
+RESUME_SETTINGS = ['input_size', 'chunk_size', 'output_type']
+
+
+def chunk_name(chunk_index):
+    '''
+    :param chunk_index: Index of the chunk starting at 0.
+    :type chunk_index: int
+    :return: Name of the file the chunk's output is written to.
+    :rtype: str
+    '''
+
+    return 'chunk-{:06d}.jsonl'.format(chunk_index)
+
+
+def chunk_errors_name(chunk_index):
+    '''
+    :param chunk_index: Index of the chunk starting at 0.
+    :type chunk_index: int
+    :return: Name of the file the texts of the chunk that failed are \
+    written to.
+    :rtype: str
+    '''
+
+    return 'chunk-{:06d}.errors.jsonl'.format(chunk_index)
+
+
+def count_lines(input_fp):
+    '''
+    :param input_fp: File containing one text per line.
+    :type input_fp: Path
+    :return: Number of lines in the file.
+    :rtype: int
+    '''
+
+    num_lines = 0
+    last_block = b'\n'
+    with open(str(input_fp), 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            num_lines += block.count(b'\n')
+            last_block = block
+    # The last line may not end with a new line
+    if not last_block.endswith(b'\n'):
+        num_lines += 1
+    return num_lines
+
+
+def read_chunks(input_fp, chunk_size):
+    '''
+    :param input_fp: File containing one text per line.
+    :param chunk_size: Number of lines in each chunk.
+    :type input_fp: Path
+    :type chunk_size: int
+    :return: A generator of (chunk index, line number of the first text, \
+    texts) tuples, the file is read one chunk at a time. Lines only end \
+    at a line feed, as counted by :py:func:`count_lines`, so a carriage \
+    return that is not followed by a line feed is kept in the text.
+    :rtype: Iterator[tuple[int, int, list[str]]]
+    '''
+
+    chunk_index = 0
+    first_line = 0
+    texts = []
+    with io.open(str(input_fp), 'r', encoding='utf-8',
+                 newline='\n') as input_file:
+        for line in input_file:
+            if line.endswith(u'\r\n'):
+                line = line[:-2]
+            elif line.endswith(u'\n'):
+                line = line[:-1]
+            texts.append(line)
+            if len(texts) == chunk_size:
+                yield chunk_index, first_line, texts
+                chunk_index += 1
+                first_line += len(texts)
+                texts = []
+    if texts:
+        yield chunk_index, first_line, texts
+
+
+def load_manifest(output_dir, input_fp, chunk_size, output_type):
+    '''
+    :param output_dir: Directory the chunks and manifest are written to.
+    :param input_fp: File containing one text per line.
+    :param chunk_size: Number of lines in each chunk.
+    :param output_type: Either `stanford` or `conll`
+    :type output_dir: Path
+    :type input_fp: Path
+    :type chunk_size: int
+    :type output_type: str
+    :return: The manifest in the output directory, or a new manifest with \
+    no completed chunks if the directory does not contain one.
+    :rtype: Dict
+    :raises ValueError: If the existing manifest was created with a \
+    different input file size, chunk size or output type, as its chunks \
+    would not line up with the chunks of this run.
+    '''
+
+    manifest = OrderedDict([('input', str(input_fp.absolute())),
+                            ('input_size', input_fp.stat().st_size),
+                            ('chunk_size', chunk_size),
+                            ('output_type', output_type),
+                            ('complete', False),
+                            ('chunks', OrderedDict())])
+    manifest_fp = output_dir.joinpath(MANIFEST_NAME)
+    if not manifest_fp.is_file():
+        return manifest
+    with manifest_fp.open('r', encoding='utf-8') as manifest_file:
+        existing_manifest = json.load(manifest_file,
+                                      object_pairs_hook=OrderedDict)
+    for setting in RESUME_SETTINGS:
+        if existing_manifest[setting] != manifest[setting]:
+            raise ValueError('Cannot resume from {} as its {} is {} not {}. '
+                             'Use a different output directory.'
+                             .format(manifest_fp, setting,
+                                     existing_manifest[setting],
+                                     manifest[setting]))
+    return existing_manifest
+
+
+def _write_atomic(file_path, data):
+    '''
+    Writes the data to a temporary file and renames it to file_path, so \
+    that file_path either contains all of the data or its previous content.
+
+    :param file_path: File to write to.
+    :param data: Data to write.
+    :type file_path: Path
+    :type data: unicode
+    :return: None
+    '''
+
+    temp_fp = Path('{}.tmp'.format(file_path))
+    with temp_fp.open('w', encoding='utf-8') as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.rename(str(temp_fp), str(file_path))
+
+
+def _to_json(value):
+    '''
+    :param value: Data to convert to JSON.
+    :return: The data as a JSON unicode String.
+    :rtype: unicode
+    '''
+
+    json_string = json.dumps(value, ensure_ascii=False, indent=2)
+    if isinstance(json_string, str):
+        json_string = json_string.decode('utf-8')
+    return json_string
+
+
+def _format_duration(seconds):
+    '''
+    :param seconds: Duration in seconds or None if unknown.
+    :type seconds: float or None
+    :return: The duration formatted as `H:MM:SS` or `?` if unknown.
+    :rtype: str
+    '''
+
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def parse_corpus(input_fp, output_dir, chunk_size=10000, jobs=1,
+                 output_type='conll', progress_file=sys.stderr,
+                 isolate_errors=False):
+    '''
+    Parses the input file in chunks, resuming from the manifest in the \
+    output directory if there is one.
+
+    :param input_fp: File containing one text per line.
+    :param output_dir: Directory to write the chunks and manifest to, \
+    created if it does not exist.
+    :param chunk_size: Number of lines in each chunk.
+    :param jobs: Number of chunks to parse in parallel.
+    :param output_type: Either `stanford` or `conll`
+    :param progress_file: File to write the progress, throughput and \
+    estimated time remaining to after each chunk. If None no progress is \
+    written.
+    :param isolate_errors: Whether to find the texts of a chunk that the \
+    pipeline fails on, writing them to the chunk's errors file, rather \
+    than failing the whole chunk see :py:func:`tweebo.process_texts`
+    :type input_fp: Path
+    :type output_dir: Path
+    :type chunk_size: int
+    :type jobs: int
+    :type output_type: str
+    :type progress_file: file
+    :type isolate_errors: bool
+    :return: The manifest of the completed run, each chunk records the \
+    number of `failed_texts` and the `errors_file` they were written to, \
+    None if no texts failed.
+    :rtype: Dict
+    :raises ValueError: If chunk_size or jobs are not positive, or the \
+    manifest cannot be resumed from see :py:func:`load_manifest`
+    :raises SystemError: If any chunk fails to parse. The chunks that \
+    finished are recorded in the manifest so the run can be resumed.
+    '''
+
+    if chunk_size < 1 or jobs < 1:
+        raise ValueError('chunk_size and jobs have to be positive not {} and '
+                         '{}'.format(chunk_size, jobs))
+    output_type = output_type.lower()
+    if not output_dir.is_dir():
+        output_dir.mkdir(parents=True)
+    manifest = load_manifest(output_dir, input_fp, chunk_size, output_type)
+    manifest_fp = output_dir.joinpath(MANIFEST_NAME)
+    num_lines = count_lines(input_fp)
+    num_chunks = (num_lines + chunk_size - 1) // chunk_size
+    lock = threading.Lock()
+    # Limits the chunks read into memory to those being parsed
+    free_workers = threading.Semaphore(jobs)
+    errors = []
+    progress = {'texts': sum(chunk['texts']
+                             for chunk in manifest['chunks'].values()),
+                'session_texts': 0, 'start_time': time.time()}
+
+    def report_progress():
+        elapsed = time.time() - progress['start_time']
+        rate = progress['session_texts'] / elapsed if elapsed else 0.0
+        eta = (num_lines - progress['texts']) / rate if rate else None
+        progress_file.write('{}/{} chunks, {}/{} Tweets, {:.1f} Tweets/s, '
+                            'ETA {}\n'.format(len(manifest['chunks']),
+                                              num_chunks, progress['texts'],
+                                              num_lines, rate,
+                                              _format_duration(eta)))
+        progress_file.flush()
+
+    def parse_chunk(chunk_index, first_line, texts):
+        try:
+            start_time = time.time()
+            chunk_errors = []
+            output = process_texts(texts, output_type=output_type,
+                                   isolate_errors=isolate_errors,
+                                   error_callback=chunk_errors.append)
+            lines = []
+            for line_number, tweet_output in enumerate(output, first_line):
+                if output_type == 'stanford' and tweet_output is not None:
+                    tweet_output['index'] = line_number
+                lines.append(json.dumps(tweet_output))
+            name = chunk_name(chunk_index)
+            errors_name = None
+            if chunk_errors:
+                errors_name = chunk_errors_name(chunk_index)
+                error_lines = [json.dumps(OrderedDict([
+                    ('line', first_line + chunk_error['index']),
+                    ('text', chunk_error['text']),
+                    ('error', chunk_error['error'])]))
+                    for chunk_error in chunk_errors]
+                _write_atomic(output_dir.joinpath(errors_name),
+                              u''.join(u'{}\n'.format(line)
+                                       for line in error_lines))
+            elif output_dir.joinpath(chunk_errors_name(chunk_index)).exists():
+                # Left by an earlier run that stopped before the manifest
+                output_dir.joinpath(chunk_errors_name(chunk_index)).unlink()
+            _write_atomic(output_dir.joinpath(name),
+                          u''.join(u'{}\n'.format(line) for line in lines))
+            with lock:
+                manifest['chunks'][str(chunk_index)] = OrderedDict([
+                    ('file', name), ('first_line', first_line),
+                    ('texts', len(texts)),
+                    ('seconds', time.time() - start_time),
+                    ('failed_texts', len(chunk_errors)),
+                    ('errors_file', errors_name)])
+                _write_atomic(manifest_fp, _to_json(manifest))
+                progress['texts'] += len(texts)
+                progress['session_texts'] += len(texts)
+                if progress_file is not None:
+                    report_progress()
+        except Exception as error:
+            with lock:
+                errors.append('Chunk {} (lines {} to {}): {}'.format(
+                    chunk_index, first_line, first_line + len(texts) - 1,
+                    repr(error)))
+        finally:
+            free_workers.release()
+
+    threads = []
+    for chunk_index, first_line, texts in read_chunks(input_fp, chunk_size):
+        if str(chunk_index) in manifest['chunks']:
+            continue
+        free_workers.acquire()
+        with lock:
+            if errors:
+                free_workers.release()
+                break
+        thread = threading.Thread(target=parse_chunk,
+                                  args=(chunk_index, first_line, texts))
+        thread.daemon = True
+        thread.start()
+        threads = [old_thread for old_thread in threads
+                   if old_thread.is_alive()] + [thread]
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise SystemError('{} chunks failed to parse, rerun to resume from '
+                          'the {} chunks that finished:\n{}'
+                          .format(len(errors), len(manifest['chunks']),
+                                  '\n'.join(errors)))
+    manifest['complete'] = True
+    _write_atomic(manifest_fp, _to_json(manifest))
+    return manifest
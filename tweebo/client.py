@@ -0,0 +1,276 @@
+'''
+Python client for the API server in :py:mod:`tweebo.server`.
+
+The :py:class:`TweeboClient` takes care of what every caller of the server \
+would otherwise write themselves:
+1. Connection pooling - Requests are sent through a `requests.Session` \
+which keeps the connections to the server alive between requests.
+2. Batching - Large inputs are split into contiguous batches of at most \
+`batch_size` Tweets and `batch_tokens` estimated tokens. Each request \
+starts a new pipeline on the server so larger batches are cheaper per \
+Tweet, but an input is split into at least `concurrency` batches so that \
+every concurrent request has work.
+3. Concurrency - At most `concurrency` batches are sent at the same time \
+and the results are reassembled in the order of the input.
+4. Retries - Requests that fail with a connection error, `503` or any \
+other `5xx` status are retried up to `max_retries` times. For a `503` with \
+a `Retry-After` header, which the server sends when its queue is full see \
+:py:mod:`tweebo.admission`, the client waits as long as the header says, \
+otherwise it waits an exponentially increasing time with jitter.
+
+Example:
+
+    with TweeboClient('http://127.0.0.1:8000') as client:
+        conll_parses = client.parse(texts)
+'''
+
+import math
+from multiprocessing.pool import ThreadPool
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from admission import estimate_tokens
+
+# The server returns 503 with a Retry-After header when its queue is full
+RETRY_STATUS_CODES = frozenset([500, 502, 503, 504])
+PRIORITY_HEADER = 'X-Tweebo-Priority'
+
+
+def batch_bounds(texts, concurrency=1, batch_size=100, batch_tokens=None,
+                 input_format='text'):
+    '''
+    :param texts: Texts to split into batches.
+    :param concurrency: Number of batches that are sent at the same time, \
+    the texts are split into at least this many batches when there are \
+    enough texts.
+    :param batch_size: Maximum number of texts in a batch.
+    :param batch_tokens: Maximum number of estimated tokens in a batch see \
+    :py:func:`tweebo.admission.estimate_tokens`. A text with more tokens \
+    than this is put in a batch by itself. If None the tokens are not \
+    limited.
+    :param input_format: Format of the texts see \
+    :py:func:`tweebo.process_texts`
+    :type texts: list
+    :type concurrency: int
+    :type batch_size: int
+    :type batch_tokens: int
+    :type input_format: str
+    :return: The (start, end) index of each batch in the texts, the \
+    batches are contiguous and in order.
+    :rtype: list[tuple[int, int]]
+    :raises ValueError: If concurrency, batch_size or batch_tokens are not \
+    positive.
+    '''
+
+    for name, value in [('concurrency', concurrency),
+                        ('batch_size', batch_size),
+                        ('batch_tokens', batch_tokens)]:
+        if value is not None and value < 1:
+            raise ValueError('{} has to be positive not {}'
+                             .format(name, value))
+    if not texts:
+        return []
+    batch_size = min(batch_size,
+                     int(math.ceil(len(texts) / float(concurrency))))
+    bounds = []
+    start = 0
+    num_tokens = 0
+    for index, text in enumerate(texts):
+        text_tokens = 0
+        if batch_tokens is not None:
+            text_tokens = estimate_tokens([text], input_format)
+        batch_full = index - start >= batch_size or \
+            (batch_tokens is not None and
+             num_tokens + text_tokens > batch_tokens)
+        if index > start and batch_full:
+            bounds.append((start, index))
+            start = index
+            num_tokens = 0
+        num_tokens += text_tokens
+    bounds.append((start, len(texts)))
+    return bounds
+
+
+def retry_delay(attempt, response=None, backoff=0.5, max_backoff=30.0):
+    '''
+    :param attempt: Number of times the request has been retried before, \
+    starting at 0.
+    :param response: The failed response or None if the request failed to \
+    connect.
+    :param backoff: Seconds waited before the first retry, which doubles \
+    with every retry.
+    :param max_backoff: Most seconds waited before a retry unless the \
+    server asks for longer with `Retry-After`
+    :type attempt: int
+    :type response: requests.Response or None
+    :type backoff: float
+    :type max_backoff: float
+    :return: Seconds to wait before retrying. The `Retry-After` seconds of \
+    a `503` response, otherwise the exponential backoff with jitter.
+    :rtype: float
+    '''
+
+    if response is not None and response.status_code == 503:
+        try:
+            return max(0.0, float(response.headers['Retry-After']))
+        except (KeyError, ValueError):
+            pass
+    delay = min(max_backoff, backoff * (2 ** attempt))
+    return random.uniform(delay / 2.0, delay)
+
+
+class TweeboClient(object):
+    '''
+    Client for the API server see :py:mod:`tweebo.client`
+
+    :param url: URL of the API server.
+    :param concurrency: Number of requests sent at the same time, which is \
+    also the number of connections kept alive.
+    :param batch_size: Maximum number of Tweets in a request.
+    :param batch_tokens: Maximum number of estimated tokens in a request. \
+    If None the tokens are not limited.
+    :param max_retries: Number of times a failed request is retried.
+    :param backoff: Seconds waited before the first retry of a request \
+    that was not given a `Retry-After`, doubling with every retry.
+    :param max_backoff: Most seconds waited before a retry that was not \
+    given a `Retry-After`
+    :param timeout: Timeout of each request see `requests.request`. If \
+    None the requests do not time out.
+    :param priority: Priority lane of the requests, `interactive` or \
+    `bulk` see :py:mod:`tweebo.admission`. If None the server default is \
+    used.
+    :type url: str
+    :type concurrency: int
+    :type batch_size: int
+    :type batch_tokens: int
+    :type max_retries: int
+    :type backoff: float
+    :type max_backoff: float
+    :type timeout: float or tuple
+    :type priority: str
+    :raises ValueError: If concurrency or batch_size are not positive or \
+    max_retries is negative.
+    '''
+
+    def __init__(self, url='http://127.0.0.1:8000', concurrency=2,
+                 batch_size=100, batch_tokens=None, max_retries=5,
+                 backoff=0.5, max_backoff=30.0, timeout=None, priority=None):
+        if concurrency < 1:
+            raise ValueError('concurrency has to be positive not {}'
+                             .format(concurrency))
+        if batch_size < 1:
+            raise ValueError('batch_size has to be positive not {}'
+                             .format(batch_size))
+        if max_retries < 0:
+            raise ValueError('max_retries cannot be negative: {}'
+                             .format(max_retries))
+        self.url = url
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if priority is not None:
+            self.session.headers[PRIORITY_HEADER] = priority
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the connections to the server.
+
+        :return: None
+        '''
+
+        self.session.close()
+
+    def _post(self, request_data):
+        '''
+        :param request_data: The JSON body of the request.
+        :type request_data: Dict
+        :return: The processed texts returned by the server.
+        :rtype: list
+        :raises requests.HTTPError: If the server returns an error that is \
+        not retried or every retry fails.
+        :raises requests.ConnectionError: If the server cannot be connected \
+        to after every retry.
+        '''
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.session.post(self.url, json=request_data,
+                                             timeout=self.timeout)
+            except requests.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or \
+                   attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+            time.sleep(retry_delay(attempt, response, self.backoff,
+                                   self.max_backoff))
+            attempt += 1
+
+    def parse(self, texts, output_type='conll', **options):
+        '''
+        Parses the texts on the server in concurrent batches.
+
+        :param texts: Texts to parse, see :py:func:`tweebo.process_texts` \
+        for the formats of the texts.
+        :param output_type: Either `conll` or `stanford`
+        :param options: Other fields of the request e.g. `input_format`, \
+        `until` or `fast` see :py:func:`tweebo.process_texts`
+        :type texts: list
+        :type output_type: str
+        :return: The processed texts in the same order as the texts, the \
+        `index` of the Stanford format is the index in the texts.
+        :rtype: list
+        :raises requests.HTTPError: If the server returns an error for any \
+        of the batches that is not retried or every retry fails.
+        :raises requests.ConnectionError: If the server cannot be connected \
+        to after every retry.
+        '''
+
+        bounds = batch_bounds(texts, self.concurrency, self.batch_size,
+                              self.batch_tokens,
+                              options.get('input_format', 'text'))
+
+        def parse_batch(batch):
+            start, end = batch
+            request_data = dict(options, texts=texts[start:end],
+                                output_type=output_type)
+            processed_texts = self._post(request_data)
+            # The server indexes the Stanford sentences from 0 in every batch
+            if output_type.lower() == 'stanford':
+                for sentence in processed_texts:
+                    sentence['index'] += start
+            return processed_texts
+
+        if not bounds:
+            return []
+        if len(bounds) == 1:
+            return parse_batch(bounds[0])
+        pool = ThreadPool(min(self.concurrency, len(bounds)))
+        try:
+            batch_results = pool.map(parse_batch, bounds)
+        finally:
+            pool.close()
+            pool.join()
+        return [processed_text for batch_result in batch_results
+                for processed_text in batch_result]
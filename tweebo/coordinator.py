@@ -0,0 +1,544 @@
+'''
+Coordinator that spreads the requests of the API server in \
+:py:mod:`tweebo.server` across several TweeboParser servers, for when one \
+host is not enough. The coordinator accepts the same requests as the API \
+server and:
+1. Routes each Tweet to a backend server by consistent hashing of its text \
+see :py:class:`HashRing`, so the same text always goes to the same backend \
+and adding or removing a backend only moves the Tweets of that backend. \
+The Tweets of a request are sent as one batch per backend, in parallel.
+2. Tracks the health of each backend see :py:class:`Backend`. A backend \
+that fails `max_failures` times in a row, by not being reachable, not \
+responding before the deadline of the request or returning `500` or \
+`502`, is skipped for `cooldown` seconds after which \
+one request is let through to check whether it has recovered. The Tweets \
+of a backend that is unhealthy, or that fails or is busy (`503`), go to \
+the next backend on the ring.
+3. Hedges slow batches. A batch that has not returned after `hedge_after` \
+seconds is also sent to the next backend on the ring and the first \
+response is used.
+4. Merges the outputs of the batches in the order of the request, the \
+`index` of the Stanford format being the index in the request.
+
+The timeout of a request see :py:mod:`tweebo.server` is passed on to the \
+backends as the time left of the request. The health of each backend is \
+returned from `/backends`
+
+Example of running the coordinator in front of two servers:
+
+    python tweebo/coordinator.py --backend http://10.0.0.1:8000 \
+        --backend http://10.0.0.2:8000 --hedge-after 5
+'''
+
+import argparse
+import bisect
+from collections import deque, OrderedDict
+import hashlib
+import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from Queue import Empty, Queue
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from flask_restful import Resource, Api, abort
+import requests
+from requests.adapters import HTTPAdapter
+from waitress import serve
+
+from server import PRIORITY_HEADER, TIMEOUT_HEADER, RequestError
+from server import _make_output_response, _request_data, _validate_request
+
+# Statuses after which a batch is sent to the next backend. 504 is not as the
+# deadline of the request has passed.
+FAILOVER_STATUS_CODES = frozenset([500, 502, 503])
+# Statuses that count as a failure of the backend, a 503 means the backend is
+# busy rather than broken.
+FAILURE_STATUS_CODES = frozenset([500, 502])
+
+
+class BackendError(Exception):
+    '''
+    Raised when a batch could not be processed by any backend.
+
+    :param message: Why the batch failed.
+    :param status_code: Status code to return to the client, the status \
+    of the backend or `502` if the backend could not be reached.
+    :type message: str
+    :type status_code: int
+    '''
+
+    def __init__(self, message, status_code):
+        super(BackendError, self).__init__(message)
+        self.status_code = status_code
+
+
+def _hash(key):
+    '''
+    :param key: Text or name to place on the ring.
+    :type key: str or unicode
+    :return: Position of the key on the ring.
+    :rtype: int
+    '''
+
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    '''
+    Consistent hash ring where each name is placed at `replicas` points so \
+    that the keys are spread evenly between the names.
+
+    :param names: Names to place on the ring e.g. backend URLs.
+    :param replicas: Number of points of each name on the ring.
+    :type names: list[str]
+    :type replicas: int
+    :raises ValueError: If there are no names or replicas is not positive.
+    '''
+
+    def __init__(self, names, replicas=100):
+        if not names:
+            raise ValueError('A hash ring needs at least one name')
+        if replicas < 1:
+            raise ValueError('replicas has to be positive not {}'
+                             .format(replicas))
+        self.names = list(names)
+        points = sorted((_hash(u'{}#{}'.format(name, replica)), name)
+                        for name in self.names
+                        for replica in range(replicas))
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._names = [name for _, name in points]
+
+    def preference(self, key):
+        '''
+        :param key: Key to look up e.g. the text of a Tweet.
+        :type key: str or unicode
+        :return: Every name in the order they are met going round the ring \
+        from the key, the first name being the one the key belongs to.
+        :rtype: list[str]
+        '''
+
+        start = bisect.bisect(self._hashes, _hash(key))
+        names = []
+        for offset in range(len(self._names)):
+            name = self._names[(start + offset) % len(self._names)]
+            if name not in names:
+                names.append(name)
+                if len(names) == len(self.names):
+                    break
+        return names
+
+
+class Backend(object):
+    '''
+    Health of a backend server, which is unhealthy after `max_failures` \
+    failures in a row.
+
+    :param url: URL of the backend API server.
+    :param max_failures: Number of failures in a row after which the \
+    backend is not sent requests.
+    :param cooldown: Seconds an unhealthy backend is not sent requests for \
+    before one request is let through to check whether it has recovered.
+    :type url: str
+    :type max_failures: int
+    :type cooldown: float
+    '''
+
+    def __init__(self, url, max_failures=3, cooldown=10.0):
+        self.url = url
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self._retry_time = 0.0
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        '''
+        :return: True if the backend has failed fewer than max_failures \
+        times in a row.
+        :rtype: bool
+        '''
+
+        return self.failures < self.max_failures
+
+    def available(self):
+        '''
+        :return: True if the backend is healthy, or if it is unhealthy and \
+        its cooldown has passed, in which case the next cooldown starts so \
+        that only one request checks the backend.
+        :rtype: bool
+        '''
+
+        with self._lock:
+            if self.failures < self.max_failures:
+                return True
+            now = time.time()
+            if now < self._retry_time:
+                return False
+            self._retry_time = now + self.cooldown
+            return True
+
+    def record(self, success):
+        '''
+        :param success: Whether the backend processed a request.
+        :type success: bool
+        :return: None
+        '''
+
+        with self._lock:
+            if success:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures == self.max_failures:
+                self._retry_time = time.time() + self.cooldown
+                logging.warning('Backend {} failed {} times in a row, not '
+                                'sending it requests for {} seconds'
+                                .format(self.url, self.failures,
+                                        self.cooldown))
+
+    def status(self):
+        '''
+        :return: The `url` of the backend, whether it is `healthy` and the \
+        number of `failures` in a row.
+        :rtype: Dict
+        '''
+
+        return {'url': self.url, 'healthy': self.healthy(),
+                'failures': self.failures}
+
+
+class Coordinator(object):
+    '''
+    Splits requests across backend servers see :py:mod:`tweebo.coordinator`
+
+    :param backend_urls: URLs of the backend API servers.
+    :param hedge_after: Seconds after which a batch that has not returned \
+    is also sent to the next backend. If None batches are not hedged.
+    :param replicas: Number of points of each backend on the hash ring.
+    :param max_failures: Number of failures in a row after which a backend \
+    is unhealthy.
+    :param cooldown: Seconds an unhealthy backend is skipped for.
+    :type backend_urls: list[str]
+    :type hedge_after: float
+    :type replicas: int
+    :type max_failures: int
+    :type cooldown: float
+    :raises ValueError: If there are no backends or the backends are not \
+    unique, or hedge_after or max_failures are not positive.
+    '''
+
+    def __init__(self, backend_urls, hedge_after=None, replicas=100,
+                 max_failures=3, cooldown=10.0):
+        if not backend_urls:
+            raise ValueError('The coordinator needs at least one backend')
+        if len(set(backend_urls)) != len(backend_urls):
+            raise ValueError('The backends are not unique: {}'
+                             .format(backend_urls))
+        if hedge_after is not None and hedge_after <= 0:
+            raise ValueError('hedge_after has to be positive not {}'
+                             .format(hedge_after))
+        if max_failures < 1:
+            raise ValueError('max_failures has to be positive not {}'
+                             .format(max_failures))
+        self.backends = OrderedDict((url, Backend(url, max_failures,
+                                                  cooldown))
+                                    for url in backend_urls)
+        self.ring = HashRing(backend_urls, replicas)
+        self.hedge_after = hedge_after
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(backend_urls))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def shards(self, texts):
+        '''
+        :param texts: Texts of a request.
+        :type texts: list
+        :return: For each backend that has texts, the indexes of its texts \
+        and the backends to send them to in order, starting with the first \
+        available backend of the texts' preference and then the healthy \
+        backends after it, or every backend if none is available. Only the \
+        backends up to the first available one are checked, so the one \
+        request that checks an unhealthy backend see \
+        :py:meth:`Backend.available` is only used when texts are sent to it.
+        :rtype: OrderedDict[str, tuple[list[int], list[str]]]
+        '''
+
+        available = {}
+
+        def is_available(url):
+            if url not in available:
+                available[url] = self.backends[url].available()
+            return available[url]
+
+        shards = OrderedDict()
+        for index, text in enumerate(texts):
+            preference = self.ring.preference(text)
+            first = next((url for url in preference if is_available(url)),
+                         None)
+            if first is None:
+                candidates = preference
+            else:
+                candidates = [first] + [
+                    url for url in preference[preference.index(first) + 1:]
+                    if available.get(url) or self.backends[url].healthy()]
+            shards.setdefault(candidates[0], ([], candidates))[0].append(index)
+        return shards
+
+    def _attempt(self, url, request_data, headers, deadline, results):
+        '''
+        Sends a batch to a backend and puts a tuple of the URL, the output \
+        and the error, one of which is None, on the results queue.
+
+        :param url: URL of the backend.
+        :param request_data: The JSON body of the request.
+        :param headers: Headers of the request.
+        :param deadline: Time, in seconds since the epoch, the request has \
+        to finish by or None.
+        :param results: Queue the outcome is put on.
+        :type url: str
+        :type request_data: Dict
+        :type headers: Dict
+        :type deadline: float
+        :type results: Queue
+        :return: None
+        '''
+
+        headers = dict(headers)
+        timeout = None
+        if deadline is not None:
+            time_left = deadline - time.time()
+            if time_left <= 0:
+                results.put((url, None, BackendError(
+                    'The request reached its deadline', 504)))
+                return
+            headers[TIMEOUT_HEADER] = '{:.3f}'.format(time_left)
+            # Gives the backend time to return its own 504
+            timeout = time_left + 1
+        try:
+            response = self.session.post(url, json=request_data,
+                                         headers=headers, timeout=timeout)
+        except requests.Timeout:
+            self.backends[url].record(False)
+            results.put((url, None, BackendError(
+                'Backend {} did not respond before the deadline'
+                .format(url), 504)))
+            return
+        except requests.RequestException as error:
+            self.backends[url].record(False)
+            results.put((url, None, BackendError(
+                'Could not connect to backend {}: {}'.format(url, error),
+                502)))
+            return
+        self.backends[url].record(response.status_code not in
+                                  FAILURE_STATUS_CODES)
+        if response.status_code == 200:
+            results.put((url, response.json(), None))
+            return
+        try:
+            message = response.json()['message']
+        except (ValueError, KeyError, TypeError):
+            message = response.text
+        results.put((url, None, BackendError(
+            'Backend {} returned {}: {}'.format(url, response.status_code,
+                                                message),
+            response.status_code)))
+
+    def _fetch(self, candidates, request_data, headers, deadline):
+        '''
+        Sends a batch to the first backend, and to the next backends when \
+        it fails or is slower than `hedge_after`
+
+        :param candidates: Backends to send the batch to in order.
+        :param request_data: The JSON body of the request.
+        :param headers: Headers of the request.
+        :param deadline: Time, in seconds since the epoch, the request has \
+        to finish by or None.
+        :type candidates: list[str]
+        :type request_data: Dict
+        :type headers: Dict
+        :type deadline: float
+        :return: The output of the first backend to process the batch.
+        :rtype: list
+        :raises BackendError: If every backend tried failed, or a backend \
+        returned an error that another backend would also return e.g. \
+        `422`
+        '''
+
+        results = Queue()
+        untried = deque(candidates)
+
+        def start_next():
+            thread = threading.Thread(target=self._attempt,
+                                      args=(untried.popleft(), request_data,
+                                            headers, deadline, results))
+            thread.daemon = True
+            thread.start()
+
+        start_next()
+        pending = 1
+        error = None
+        while pending:
+            try:
+                if self.hedge_after is not None and untried:
+                    url, output, error = results.get(timeout=self.hedge_after)
+                else:
+                    url, output, error = results.get()
+            except Empty:
+                start_next()
+                pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                return output
+            if error.status_code not in FAILOVER_STATUS_CODES:
+                raise error
+            # A hedged request may still succeed
+            if not pending and untried:
+                start_next()
+                pending += 1
+        raise error
+
+    def parse(self, request_data, headers=None, deadline=None):
+        '''
+        :param request_data: Validated body of the request see \
+        :py:mod:`tweebo.server`
+        :param headers: Headers to send to the backends e.g. the priority.
+        :param deadline: Optional time, in seconds since the epoch, the \
+        request has to finish by.
+        :type request_data: Dict
+        :type headers: Dict
+        :type deadline: float
+        :return: The processed texts in the order of the request.
+        :rtype: list
+        :raises BackendError: If a batch could not be processed by any \
+        backend.
+        '''
+
+        texts = request_data['texts']
+        shards = self.shards(texts)
+
+        def fetch_shard(shard):
+            indexes, candidates = shard
+            shard_data = dict(request_data,
+                              texts=[texts[index] for index in indexes])
+            try:
+                return self._fetch(candidates, shard_data, headers or {},
+                                   deadline), None
+            except BackendError as error:
+                return None, error
+
+        if len(shards) > 1:
+            # The backends do the work so threads are enough to send the
+            # batches in parallel.
+            pool = ThreadPool(len(shards))
+            try:
+                shard_results = pool.map(fetch_shard, shards.values())
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            shard_results = [fetch_shard(shard) for shard in shards.values()]
+        processed_texts = [None] * len(texts)
+        for (indexes, _), (output, error) in zip(shards.values(),
+                                                 shard_results):
+            if error is not None:
+                raise error
+            for index, processed_text in zip(indexes, output):
+                processed_texts[index] = processed_text
+        if request_data['output_type'].lower() == 'stanford':
+            for index, tweet_data in enumerate(processed_texts):
+                tweet_data['index'] = index
+        return processed_texts
+
+
+app = Flask(__name__)
+api = Api(app)
+# Replaced when the coordinator is started from the command line
+coordinator = None
+max_request_timeout = None
+
+
+class Coordinate(Resource):
+    def post(self):
+        start_time = time.time()
+        try:
+            input_data = _request_data()
+        except ValueError as error:
+            abort(400, message='{}'.format(error))
+        try:
+            input_data, lane, timeout = _validate_request(
+                input_data, request.headers.get(PRIORITY_HEADER),
+                request.headers.get(TIMEOUT_HEADER), max_request_timeout)
+        except RequestError as error:
+            abort(error.status_code, message='{}'.format(error))
+        deadline = None
+        if timeout is not None:
+            deadline = start_time + timeout
+        # The backends only take the fields given to process_texts, the
+        # lane and the time left are sent as headers.
+        headers = {PRIORITY_HEADER: lane}
+        try:
+            processed_texts = coordinator.parse(input_data, headers, deadline)
+        except BackendError as error:
+            abort(error.status_code, message='{}'.format(error))
+        return _make_output_response(processed_texts)
+
+
+class Backends(Resource):
+    def get(self):
+        return jsonify([backend.status()
+                        for backend in coordinator.backends.values()])
+
+
+api.add_resource(Coordinate, '/')
+api.add_resource(Backends, '/backends')
+
+description = 'Starts a coordinator that spreads requests across several '\
+              'TweeboParser API servers'
+parser = argparse.ArgumentParser(prog='TweeboParser Coordinator',
+                                 description=description)
+parser.add_argument('-b', '--backend', action='append', required=True,
+                    help='URL of a backend API server, given once for each '
+                         'server')
+parser.add_argument('-t', '--threads', type=int,
+                    default=multiprocessing.cpu_count() * 4,
+                    help='The number of threads the coordinator will use '
+                         '(default: 4 times the number of CPUs)')
+parser.add_argument('-p', '--port', type=int, default=8080,
+                    help='Port number to run the coordinator from '
+                         '(default: 8080)')
+parser.add_argument('--hostname', type=str, default='0.0.0.0',
+                    help='Hostname/IP address on which the coordinator '
+                         'listens to (default: 0.0.0.0)')
+parser.add_argument('--hedge-after', type=float,
+                    help='Seconds after which a batch that has not returned '
+                         'is also sent to the next backend (default: no '
+                         'hedging)')
+parser.add_argument('--max-failures', type=int, default=3,
+                    help='Failures in a row after which a backend is '
+                         'skipped (default: 3)')
+parser.add_argument('--cooldown', type=float, default=10.0,
+                    help='Seconds an unhealthy backend is skipped for '
+                         'before it is checked again (default: 10)')
+parser.add_argument('--request-timeout', type=float,
+                    help='The most seconds a request can take before 504 '
+                         'is returned, passed on to the backends. Requests '
+                         'can ask for a shorter timeout (default: no limit)')
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.INFO)
+
+    args = parser.parse_args()
+    coordinator = Coordinator(args.backend, hedge_after=args.hedge_after,
+                              max_failures=args.max_failures,
+                              cooldown=args.cooldown)
+    max_request_timeout = args.request_timeout
+    logging.info('Coordinating {} on: {}:{}'
+                 .format(args.backend, args.hostname, args.port))
+    serve(app, host=args.hostname, port=args.port, threads=args.threads)
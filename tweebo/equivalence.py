@@ -0,0 +1,375 @@
+'''
+Differential equivalence harness, which checks that an execution mode of the \
+TweeboParser produces the same parses as the reference run.sh script.
+
+The same corpus is run through the reference and each alternative mode and \
+the CoNLL outputs are compared token by token on the following fields:
+1. form - The token, a divergence means the text was tokenized differently.
+2. pos - POS tag.
+3. head - Index of the HEAD token.
+4. relation - Dependency relation e.g. `MWE`
+5. selection - Whether the token was selected to be part of the \
+dependency tree, unselected tokens have a HEAD of -1.
+
+For each mode the divergence rate of each field is reported with examples \
+of the tokens that diverged. A mode is gated as:
+1. exact - No token diverged on any field.
+2. within tolerance - The divergence rate of every field is at most the \
+tolerance.
+3. diverged - Otherwise.
+
+The execution modes are registered in `MODES`, each is a function that \
+takes the input file, one text per line, and the file to write the CoNLL \
+output to. The modes in `APPROXIMATE_MODES` trade accuracy for speed so are \
+not expected to be exact and are only compared when asked for, with a \
+tolerance e.g. `--modes fast --tolerance head:0.1`
+
+Usage: python -m tweebo.equivalence --corpus tests/test_data/tweets.txt \
+--modes stages process_texts sharded
+'''
+
+import argparse
+from collections import OrderedDict
+from functools import partial
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from stages import ROOT_DIR, run_pipeline
+from tweebo import process_texts
+
+FIELDS = ['form', 'pos', 'head', 'relation', 'selection']
+EXACT = 'exact'
+WITHIN_TOLERANCE = 'within tolerance'
+DIVERGED = 'diverged'
+
+
+def _run_reference(input_fp, output_fp, run_args=()):
+    '''
+    Runs the run.sh script, which writes its output to the input file path \
+    with `.predict` appended, and copies the output to output_fp.
+
+    :param input_fp: File containing raw text, one text per line.
+    :param output_fp: File the CoNLL output will be written to.
+    :param run_args: Options to run.sh e.g. `['--stream']`
+    :type input_fp: Path
+    :type output_fp: Path
+    :type run_args: list[str]
+    :return: None
+    :raises SystemError: If the run.sh script fails.
+    '''
+
+    run_file = ROOT_DIR.joinpath('run.sh')
+    command = ['bash', str(run_file)] + list(run_args) + [str(input_fp)]
+    with open(os.devnull, 'wb') as null_file:
+        if subprocess.call(command, stdout=null_file):
+            raise SystemError('Could not run the Tweebo run script')
+    shutil.move('{}.predict'.format(input_fp), str(output_fp))
+
+
+def _run_stages(input_fp, output_fp, **kwargs):
+    '''
+    Runs the pipeline through :py:func:`tweebo.stages.run_pipeline`
+
+    :param input_fp: File containing raw text, one text per line.
+    :param output_fp: File the CoNLL output will be written to.
+    :param kwargs: Keyword arguments to \
+    :py:func:`tweebo.stages.run_pipeline`
+    :type input_fp: Path
+    :type output_fp: Path
+    :return: None
+    '''
+
+    run_pipeline(input_fp, output_fp, **kwargs)
+
+
+def _run_process_texts(input_fp, output_fp, **kwargs):
+    '''
+    Runs the pipeline through :py:func:`tweebo.process_texts` with the \
+    `conll` output type.
+
+    :param input_fp: File containing raw text, one text per line.
+    :param output_fp: File the CoNLL output will be written to.
+    :param kwargs: Keyword arguments to :py:func:`tweebo.process_texts`
+    :type input_fp: Path
+    :type output_fp: Path
+    :return: None
+    '''
+
+    with input_fp.open('r', encoding='utf-8') as input_file:
+        texts = [line.rstrip(u'\n') for line in input_file]
+    with output_fp.open('w', encoding='utf-8') as output_file:
+        for conll_string in process_texts(texts, output_type='conll',
+                                          **kwargs):
+            output_file.write(u'{}\n\n'.format(conll_string))
+
+
+MODES = OrderedDict([('reference', _run_reference),
+                     ('run_sh_stream', partial(_run_reference,
+                                               run_args=['--stream'])),
+                     ('stages', _run_stages),
+                     ('stages_stream', partial(_run_stages, streaming=True)),
+                     ('process_texts', _run_process_texts),
+                     ('sharded', partial(_run_process_texts, n_jobs=2)),
+                     ('fast', partial(_run_process_texts, fast=True))])
+APPROXIMATE_MODES = ['fast']
+
+
+def read_parses(conll_fp):
+    '''
+    :param conll_fp: CoNLL formatted file where each Tweet is seperated by \
+    an empty line.
+    :type conll_fp: Path
+    :return: A list of Tweets where each Tweet is a list of tokens and each \
+    token is a dictionary of the `FIELDS` to their values.
+    :rtype: list[list[Dict]]
+    '''
+
+    tweets = []
+    tokens = []
+    with conll_fp.open('r', encoding='utf-8') as conll_file:
+        for line in conll_file:
+            line = line.strip()
+            if not line:
+                if tokens:
+                    tweets.append(tokens)
+                tokens = []
+                continue
+            line_data = line.split('\t')
+            head = int(line_data[6])
+            tokens.append({'form': line_data[1], 'pos': line_data[4],
+                           'head': head, 'relation': line_data[7],
+                           'selection': head != -1})
+    if tokens:
+        tweets.append(tokens)
+    return tweets
+
+
+def compare(reference_parses, test_parses, num_examples=10):
+    '''
+    :param reference_parses: Parses of the reference see \
+    :py:func:`read_parses`
+    :param test_parses: Parses of the mode being tested.
+    :param num_examples: Maximum number of examples of divergent tokens to \
+    return for each field.
+    :type reference_parses: list[list[Dict]]
+    :type test_parses: list[list[Dict]]
+    :type num_examples: int
+    :return: A dictionary containing the following keys:
+    1. tweets - Number of Tweets compared.
+    2. tokens - Number of tokens compared.
+    3. diverged_tweets - Number of Tweets where at least one token diverged.
+    4. divergences - Dictionary of field to the number of tokens that \
+    diverged on that field.
+    5. rates - Dictionary of field to the fraction of tokens that \
+    diverged on that field.
+    6. examples - Dictionary of field to a list of examples, each \
+    containing the tweet and token index, the reference and test token and \
+    the value of the field in the reference and test.
+    Tokens missing from either side, e.g. because the Tweet was tokenized \
+    differently, diverge on every field.
+    :rtype: Dict
+    '''
+
+    num_tweets = max(len(reference_parses), len(test_parses))
+    num_tokens = 0
+    diverged_tweets = 0
+    divergences = OrderedDict((field, 0) for field in FIELDS)
+    examples = OrderedDict((field, []) for field in FIELDS)
+    for tweet_index in range(num_tweets):
+        reference_tokens = reference_parses[tweet_index] \
+            if tweet_index < len(reference_parses) else []
+        test_tokens = test_parses[tweet_index] \
+            if tweet_index < len(test_parses) else []
+        tweet_length = max(len(reference_tokens), len(test_tokens))
+        num_tokens += tweet_length
+        tweet_diverged = False
+        for token_index in range(tweet_length):
+            reference_token = reference_tokens[token_index] \
+                if token_index < len(reference_tokens) else None
+            test_token = test_tokens[token_index] \
+                if token_index < len(test_tokens) else None
+            for field in FIELDS:
+                reference_value = None if reference_token is None \
+                    else reference_token[field]
+                test_value = None if test_token is None else test_token[field]
+                if reference_token is not None and test_token is not None \
+                   and reference_value == test_value:
+                    continue
+                tweet_diverged = True
+                divergences[field] += 1
+                if len(examples[field]) < num_examples:
+                    examples[field].append(OrderedDict([
+                        ('tweet', tweet_index), ('token', token_index + 1),
+                        ('reference_form', None if reference_token is None
+                         else reference_token['form']),
+                        ('test_form', None if test_token is None
+                         else test_token['form']),
+                        ('reference', reference_value),
+                        ('test', test_value)]))
+        if tweet_diverged:
+            diverged_tweets += 1
+    rates = OrderedDict((field, count / float(num_tokens) if num_tokens
+                         else 0.0)
+                        for field, count in divergences.items())
+    return OrderedDict([('tweets', num_tweets), ('tokens', num_tokens),
+                        ('diverged_tweets', diverged_tweets),
+                        ('divergences', divergences), ('rates', rates),
+                        ('examples', examples)])
+
+
+def gate(comparison, tolerance=0.0):
+    '''
+    :param comparison: Output of :py:func:`compare`
+    :param tolerance: Maximum divergence rate allowed for each field, or a \
+    dictionary of field to the maximum rate where fields not given must not \
+    diverge.
+    :type comparison: Dict
+    :type tolerance: float or Dict
+    :return: `exact` if no tokens diverged, `within tolerance` if the \
+    divergence rate of every field is within the tolerance else `diverged`
+    :rtype: str
+    '''
+
+    if not any(comparison['divergences'].values()):
+        return EXACT
+    if not isinstance(tolerance, dict):
+        tolerance = {field: tolerance for field in FIELDS}
+    for field, rate in comparison['rates'].items():
+        if rate > tolerance.get(field, 0.0):
+            return DIVERGED
+    return WITHIN_TOLERANCE
+
+
+def run_modes(corpus_fp, modes, reference_fp=None, tolerance=0.0,
+              num_examples=10):
+    '''
+    Runs the corpus through the reference, unless the reference output is \
+    given, and each of the modes and compares each mode to the reference.
+
+    :param corpus_fp: File containing raw text, one text per line. Empty \
+    lines are skipped.
+    :param modes: Names of the modes to test see `MODES`
+    :param reference_fp: Optional CoNLL output of the reference on the \
+    corpus e.g. `tests/test_data/tweets.txt.predict`. If None the \
+    reference is run.
+    :param tolerance: See :py:func:`gate`
+    :param num_examples: See :py:func:`compare`
+    :type corpus_fp: Path
+    :type modes: list[str]
+    :type reference_fp: Path
+    :type tolerance: float or Dict
+    :type num_examples: int
+    :return: Dictionary of mode name to the comparison returned by \
+    :py:func:`compare` with the additional key `gate` see :py:func:`gate`
+    :rtype: Dict
+    :raises ValueError: If a mode is not in `MODES`
+    '''
+
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError('Mode {} is not one of {}'
+                             .format(mode, list(MODES)))
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        input_fp = temp_dir.joinpath('corpus.txt')
+        with corpus_fp.open('r', encoding='utf-8') as corpus_file:
+            texts = [line.strip() for line in corpus_file if line.strip()]
+        with input_fp.open('w', encoding='utf-8') as input_file:
+            input_file.write(u'\n'.join(texts))
+        if reference_fp is None:
+            reference_fp = temp_dir.joinpath('reference.conll')
+            MODES['reference'](input_fp, reference_fp)
+        reference_parses = read_parses(reference_fp)
+        results = OrderedDict()
+        for mode in modes:
+            output_fp = temp_dir.joinpath('{}.conll'.format(mode))
+            MODES[mode](input_fp, output_fp)
+            comparison = compare(reference_parses, read_parses(output_fp),
+                                 num_examples)
+            comparison['gate'] = gate(comparison, tolerance)
+            results[mode] = comparison
+        return results
+    finally:
+        shutil.rmtree(str(temp_dir))
+
+
+def _parse_tolerance(tolerance):
+    '''
+    :param tolerance: A rate for all fields e.g. `0.01` or rates per field \
+    e.g. `head:0.01,relation:0.02`
+    :type tolerance: str
+    :return: The tolerance see :py:func:`gate`
+    :rtype: float or Dict
+    :raises argparse.ArgumentTypeError: If the tolerance is not correctly \
+    formatted
+    '''
+
+    try:
+        if ':' not in tolerance:
+            return float(tolerance)
+        field_tolerance = {}
+        for field_rate in tolerance.split(','):
+            field, rate = field_rate.split(':')
+            if field not in FIELDS:
+                raise ValueError('Unknown field {}'.format(field))
+            field_tolerance[field] = float(rate)
+        return field_tolerance
+    except ValueError as error:
+        raise argparse.ArgumentTypeError('Tolerance should be a rate e.g. '
+                                         '0.01 or rates per field e.g. '
+                                         'head:0.01,relation:0.02 not {}: {}'
+                                         .format(tolerance, error))
+
+
+description = 'Compares the output of TweeboParser execution modes to the '\
+              'reference run.sh script token by token'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--corpus', type=str, required=True,
+                    help='File containing raw text, one text per line')
+parser.add_argument('--modes', nargs='+', choices=list(MODES),
+                    default=[mode for mode in MODES if mode != 'reference'
+                             and mode not in APPROXIMATE_MODES],
+                    help='Modes to compare to the reference (default: all '
+                         'but the approximate modes)')
+parser.add_argument('--reference-output', type=str,
+                    help='CoNLL output of run.sh on the corpus. If not given '
+                         'run.sh is run')
+parser.add_argument('--tolerance', type=_parse_tolerance, default=0.0,
+                    help='Maximum divergence rate for a mode to be within '
+                         'tolerance, either one rate e.g. 0.01 or rates per '
+                         'field e.g. head:0.01,relation:0.02 (default: 0)')
+parser.add_argument('--examples', type=int, default=5,
+                    help='Examples of divergent tokens to report per field '
+                         '(default: 5)')
+parser.add_argument('--output', type=str,
+                    help='JSON file to also write the results to')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    reference_output = None
+    if args.reference_output is not None:
+        reference_output = Path(args.reference_output)
+    mode_results = run_modes(Path(args.corpus), args.modes, reference_output,
+                             args.tolerance, args.examples)
+    for mode, comparison in mode_results.items():
+        print('{}: {} ({} of {} Tweets and {} tokens diverged)'.format(
+            mode, comparison['gate'], comparison['diverged_tweets'],
+            comparison['tweets'], comparison['tokens']))
+        for field in FIELDS:
+            print('  {:<10}{:>8}{:>10.4%}'.format(
+                field, comparison['divergences'][field],
+                comparison['rates'][field]))
+            for example in comparison['examples'][field]:
+                print('    Tweet {tweet} token {token} ({reference_form}/'
+                      '{test_form}): {reference} != {test}'.format(**example))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(mode_results, output_file, indent=2)
+    if any(comparison['gate'] == DIVERGED
+           for comparison in mode_results.values()):
+        sys.exit(1)
@@ -0,0 +1,181 @@
+'''
+Measures the accuracy of the parsing stages on the Tweebank test split, \
+which is used to find the accuracy cost of the fast parsing mode see \
+:py:mod:`tweebo.stages`
+
+The test split contains the gold tokens, POS tags, Brown Clusters and token \
+selections in the format that the token_selection stage writes, so only the \
+parsing stages are run and the accuracy is that of the parser alone. The \
+attachments, the (token, HEAD) pairs of the selected tokens, of the parse \
+are compared to the gold attachments giving:
+1. precision - Fraction of the parsed attachments that are in the gold.
+2. recall - Fraction of the gold attachments that are in the parse.
+3. f1 - Harmonic mean of the precision and recall, the attachment F1 that \
+the TweeboParser paper reports.
+
+The parsing modes that can be evaluated are registered in `MODES`, each is \
+a dictionary of keyword arguments to :py:func:`tweebo.stages.run_pipeline`
+
+Usage: python -m tweebo.evaluate --modes full fast --markdown
+'''
+
+import argparse
+from collections import OrderedDict
+import json
+from pathlib import Path
+import shutil
+import tempfile
+
+from equivalence import read_parses
+from stages import ROOT_DIR, run_pipeline
+
+TEST_FP = ROOT_DIR.joinpath('Tweebank', 'Train_Test_Splited', 'test')
+MODES = OrderedDict([('full', {}), ('fast', {'fast': True})])
+
+
+def attachments(parses):
+    '''
+    :param parses: Parses see :py:func:`tweebo.equivalence.read_parses`
+    :type parses: list[list[Dict]]
+    :return: The (Tweet index, token index, HEAD index) of every selected \
+    token. Tokens that are not selected have a negative HEAD, -1 in the \
+    parser output and -3 in Tweebank.
+    :rtype: set[tuple[int, int, int]]
+    '''
+
+    return {(tweet_index, token_index, token['head'])
+            for tweet_index, tweet in enumerate(parses)
+            for token_index, token in enumerate(tweet, 1)
+            if token['head'] >= 0}
+
+
+def score(gold_parses, test_parses):
+    '''
+    :param gold_parses: Gold parses see \
+    :py:func:`tweebo.equivalence.read_parses`
+    :param test_parses: Parses to score.
+    :type gold_parses: list[list[Dict]]
+    :type test_parses: list[list[Dict]]
+    :return: A dictionary containing the following keys:
+    1. gold_attachments - Number of gold attachments.
+    2. test_attachments - Number of attachments in the parses.
+    3. correct - Number of attachments in both.
+    4. precision - correct / test_attachments
+    5. recall - correct / gold_attachments
+    6. f1 - Harmonic mean of the precision and recall.
+    :rtype: Dict
+    '''
+
+    gold_attachments = attachments(gold_parses)
+    test_attachments = attachments(test_parses)
+    correct = len(gold_attachments & test_attachments)
+    precision = correct / float(len(test_attachments)) \
+        if test_attachments else 0.0
+    recall = correct / float(len(gold_attachments)) \
+        if gold_attachments else 0.0
+    f1 = 2 * precision * recall / (precision + recall) \
+        if precision + recall else 0.0
+    return OrderedDict([('gold_attachments', len(gold_attachments)),
+                        ('test_attachments', len(test_attachments)),
+                        ('correct', correct), ('precision', precision),
+                        ('recall', recall), ('f1', f1)])
+
+
+def evaluate(modes, test_fp=TEST_FP):
+    '''
+    Parses the test split with each mode and scores the parses against \
+    the gold.
+
+    :param modes: Names of the modes to evaluate see `MODES`
+    :param test_fp: CoNLL file of the gold test split with the columns \
+    that the token_selection stage writes.
+    :type modes: list[str]
+    :type test_fp: Path
+    :return: Dictionary of mode name to the score returned by \
+    :py:func:`score` with the additional key `parse_time`, the wall clock \
+    time in seconds of the parsing stages.
+    :rtype: Dict
+    :raises ValueError: If a mode is not in `MODES`
+    :raises SystemError: If any of the parsing stages fail.
+    '''
+
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError('Mode {} is not one of {}'
+                             .format(mode, list(MODES)))
+    gold_parses = read_parses(test_fp)
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        results = OrderedDict()
+        for mode in modes:
+            output_fp = temp_dir.joinpath('{}.conll'.format(mode))
+            stage_infos = run_pipeline(test_fp, output_fp,
+                                       first_stage='ptb_parsing',
+                                       **MODES[mode])
+            results[mode] = score(gold_parses, read_parses(output_fp))
+            results[mode]['parse_time'] = sum(info['wall_time']
+                                              for info in stage_infos)
+        return results
+    finally:
+        shutil.rmtree(str(temp_dir))
+
+
+def markdown_table(results):
+    '''
+    :param results: Results returned by :py:func:`evaluate`
+    :type results: Dict
+    :return: Markdown table of the results, as recorded in the README, with \
+    the F1 and parse time of each mode relative to the first mode.
+    :rtype: str
+    '''
+
+    lines = ['| Mode | Precision | Recall | F1 | F1 difference | '
+             'Parse time | Speed up |',
+             '| --- | --- | --- | --- | --- | --- | --- |']
+    first_result = None
+    for mode, result in results.items():
+        if first_result is None:
+            first_result = result
+        speed_up = first_result['parse_time'] / result['parse_time'] \
+            if result['parse_time'] else 0.0
+        lines.append('| {} | {:.2%} | {:.2%} | {:.2%} | {:+.2%} | {:.1f}s | '
+                     '{:.2f}x |'.format(mode, result['precision'],
+                                        result['recall'], result['f1'],
+                                        result['f1'] - first_result['f1'],
+                                        result['parse_time'], speed_up))
+    return '\n'.join(lines)
+
+
+description = 'Measures the attachment precision, recall and F1 of the '\
+              'parsing modes on the Tweebank test split'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument('--modes', nargs='+', choices=list(MODES),
+                    default=list(MODES),
+                    help='Modes to evaluate (default: all)')
+parser.add_argument('--test-file', type=str, default=str(TEST_FP),
+                    help='Gold test split (default: {})'.format(TEST_FP))
+parser.add_argument('--output', type=str,
+                    help='JSON file to also write the results to')
+parser.add_argument('--markdown', action='store_true',
+                    help='Also print the results as the Markdown table '
+                         'recorded in the README')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    mode_results = evaluate(args.modes, Path(args.test_file))
+    first_f1 = None
+    for mode, result in mode_results.items():
+        difference = ''
+        if first_f1 is None:
+            first_f1 = result['f1']
+        else:
+            difference = ' ({:+.2%} F1)'.format(result['f1'] - first_f1)
+        print('{}: precision {:.2%} recall {:.2%} F1 {:.2%}{} parsed in '
+              '{:.1f}s'.format(mode, result['precision'], result['recall'],
+                               result['f1'], difference,
+                               result['parse_time']))
+    if args.markdown:
+        print(markdown_table(mode_results))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(mode_results, output_file, indent=2)
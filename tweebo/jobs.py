@@ -0,0 +1,270 @@
+'''
+Runs :py:func:`tweebo.process_texts` in the background so that applications \
+built around an event loop, or that parse many batches at the same time, do \
+not block while the pipeline runs.
+
+The :py:class:`JobRunner` runs at most `max_concurrency` batches at the same \
+time, further batches wait in the order they were submitted. Each batch is \
+a :py:class:`Job` that can be:
+1. Waited on, :py:meth:`Job.wait` and :py:meth:`Job.result`
+2. Polled, :py:meth:`Job.done`
+3. Given callbacks that are called when it finishes, \
+:py:meth:`Job.add_done_callback`. The callbacks are called from the thread \
+that ran the job, so an event loop should hand the result back to its own \
+thread e.g. with Tornado's `IOLoop.add_callback`.
+4. Cancelled, :py:meth:`Job.cancel`. A job that is waiting is never run \
+and a job that is running has the processes of its pipeline killed see \
+:py:class:`tweebo.stages.Cancellation`
+
+A job submitted with a `timeout` or `deadline` see \
+:py:func:`tweebo.process_texts` that does not finish in time raises \
+:py:class:`tweebo.stages.PipelineTimeout` from :py:meth:`Job.result`, the \
+time spent waiting to run counts towards a deadline but not a timeout.
+
+Example:
+
+    with JobRunner(max_concurrency=4) as runner:
+        jobs = [runner.submit(batch, output_type='stanford')
+                for batch in batches]
+        parses = [job.result() for job in jobs]
+'''
+
+from multiprocessing.pool import ThreadPool
+import threading
+
+from stages import Cancellation, PipelineCancelled, PipelineTimeout
+from tweebo import process_texts
+
+PENDING = 'pending'
+RUNNING = 'running'
+CANCELLED = 'cancelled'
+FINISHED = 'finished'
+
+
+class Job(object):
+    '''
+    A batch of texts submitted to a :py:class:`JobRunner`
+
+    :param texts: Texts to process see :py:func:`tweebo.process_texts`
+    :param options: Keyword arguments to :py:func:`tweebo.process_texts`
+    :type texts: list
+    :type options: Dict
+    '''
+
+    def __init__(self, texts, options):
+        self.texts = texts
+        self.options = options
+        self.state = PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._cancellation = Cancellation()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        '''
+        Cancels the job. A pending job is cancelled straight away, a running \
+        job once the processes of its pipeline have been killed.
+
+        :return: False if the job has already finished, otherwise True.
+        :rtype: bool
+        '''
+
+        with self._lock:
+            if self.state == FINISHED:
+                return False
+            if self.state == CANCELLED:
+                return True
+            self._cancellation.cancel()
+            if self.state == RUNNING:
+                return True
+            self.state = CANCELLED
+        self._finish(CANCELLED)
+        return True
+
+    def cancelled(self):
+        '''
+        :return: True if the job was cancelled.
+        :rtype: bool
+        '''
+
+        return self.state == CANCELLED
+
+    def done(self):
+        '''
+        :return: True if the job has finished or was cancelled.
+        :rtype: bool
+        '''
+
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        '''
+        :param timeout: Most seconds to wait for, if None waits until the \
+        job is done.
+        :type timeout: float
+        :return: True if the job is done.
+        :rtype: bool
+        '''
+
+        # Waiting without a timeout cannot be interrupted by Ctrl-C
+        # in Python 2
+        while timeout is None and not self._finished.is_set():
+            self._finished.wait(1)
+        return self._finished.wait(timeout)
+
+    def result(self):
+        '''
+        Waits until the job is done.
+
+        :return: The output of :py:func:`tweebo.process_texts`
+        :raises PipelineCancelled: If the job was cancelled.
+        :raises Exception: Any exception raised by \
+        :py:func:`tweebo.process_texts`
+        '''
+
+        self.wait()
+        if self.state == CANCELLED:
+            raise PipelineCancelled('The job was cancelled')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def add_done_callback(self, callback):
+        '''
+        :param callback: Function called with the job once it is done. \
+        Called straight away if the job is already done.
+        :type callback: Callable[[Job], None]
+        :return: None
+        '''
+
+        with self._lock:
+            if not self._finished.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, state, result=None, exception=None):
+        '''
+        :param state: Either `FINISHED` or `CANCELLED`
+        :param result: Output of :py:func:`tweebo.process_texts`
+        :param exception: Exception raised by :py:func:`tweebo.process_texts`
+        :type state: str
+        :type result: list
+        :type exception: Exception
+        :return: None
+        '''
+
+        with self._lock:
+            self.state = state
+            self._result = result
+            self._exception = exception
+            self._finished.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+    def _run(self):
+        '''
+        Runs the job unless it was cancelled while pending.
+
+        :return: None
+        '''
+
+        with self._lock:
+            if self.state != PENDING:
+                return
+            self.state = RUNNING
+        try:
+            result = process_texts(self.texts,
+                                   cancellation=self._cancellation,
+                                   **self.options)
+        except PipelineTimeout as error:
+            # Timing out is an error of the job rather than a cancellation
+            self._finish(FINISHED, exception=error)
+        except PipelineCancelled:
+            self._finish(CANCELLED)
+        except Exception as error:
+            self._finish(FINISHED, exception=error)
+        else:
+            # A deadline that passed after the texts were processed does
+            # not cancel the job
+            if self._cancellation.cancelled and \
+               not self._cancellation.timed_out:
+                self._finish(CANCELLED)
+            else:
+                self._finish(FINISHED, result=result)
+
+
+class JobRunner(object):
+    '''
+    Runs jobs in background threads see :py:mod:`tweebo.jobs`
+
+    :param max_concurrency: Number of jobs that can run at the same time, \
+    each running job runs its own pipeline processes.
+    :type max_concurrency: int
+    :raises ValueError: If max_concurrency is not positive.
+    '''
+
+    def __init__(self, max_concurrency=1):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency has to be positive not {}'
+                             .format(max_concurrency))
+        self.max_concurrency = max_concurrency
+        self._jobs = []
+        self._shut_down = False
+        self._lock = threading.Lock()
+        # The pipeline runs in child processes so threads are enough to run
+        # the jobs in parallel.
+        self._pool = ThreadPool(max_concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel_jobs=exc_type is not None)
+
+    def submit(self, texts, **options):
+        '''
+        :param texts: Texts to process see :py:func:`tweebo.process_texts`
+        :param options: Keyword arguments to \
+        :py:func:`tweebo.process_texts` e.g. `output_type`
+        :type texts: list
+        :return: The job, which runs once fewer than max_concurrency jobs \
+        are running and the jobs submitted before it have started.
+        :rtype: Job
+        :raises ValueError: If the runner has been shut down.
+        '''
+
+        job = Job(texts, options)
+        with self._lock:
+            if self._shut_down:
+                raise ValueError('Cannot submit jobs to a JobRunner that has '
+                                 'been shut down')
+            self._pool.apply_async(job._run)
+            self._jobs = [submitted_job for submitted_job in self._jobs
+                          if not submitted_job.done()]
+            self._jobs.append(job)
+        return job
+
+    def shutdown(self, cancel_jobs=False):
+        '''
+        Stops accepting jobs and waits for the submitted jobs to finish.
+
+        :param cancel_jobs: Whether to cancel the submitted jobs instead of \
+        waiting for them to run.
+        :type cancel_jobs: bool
+        :return: None
+        '''
+
+        with self._lock:
+            self._shut_down = True
+            self._pool.close()
+            jobs = self._jobs
+            self._jobs = []
+        if cancel_jobs:
+            for job in jobs:
+                job.cancel()
+        self._pool.join()
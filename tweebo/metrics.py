@@ -0,0 +1,123 @@
+'''
+`Prometheus <https://prometheus.io/>`_ metrics for the API server in \
+:py:mod:`tweebo.server`, exposed in the text exposition format at the \
+`/metrics` endpoint.
+
+Tweets and tokens per second are exposed as the counters \
+`tweebo_tweets_total` and `tweebo_tokens_total` which should be queried with \
+the Prometheus `rate` function e.g. `rate(tweebo_tweets_total[1m])`. \
+Tweets per core-second can be found by dividing the rate of \
+`tweebo_tweets_total` by the rate of `tweebo_stage_cpu_seconds_total` \
+summed over all stages and modes.
+
+The queue metrics and `tweebo_lane_request_duration_seconds` are labelled \
+with the priority lane of the requests see :py:mod:`tweebo.admission`
+
+When the server runs several worker processes, see :py:mod:`tweebo.prefork`, \
+each process only counts its own requests. Setting the \
+`prometheus_multiproc_dir` environment variable to an empty directory \
+before the server starts makes the processes share their metrics through \
+files in that directory, so that `/metrics` covers every worker. The gauges \
+are then summed over the live workers, apart from \
+`tweebo_stage_max_rss_bytes` which is the maximum.
+'''
+
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import multiprocess
+
+MULTIPROCESS = 'prometheus_multiproc_dir' in os.environ
+
+# Parsing a batch takes seconds rather than milliseconds as the tagger
+# starts a JVM and the parser loads its models on every request.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   120.0, 300.0, float('inf'))
+
+REQUESTS = Counter('tweebo_requests_total',
+                   'Number of parse requests by HTTP status code.', ['code'])
+REQUEST_LATENCY = Histogram('tweebo_request_duration_seconds',
+                            'Latency of parse requests.',
+                            buckets=LATENCY_BUCKETS)
+TWEETS = Counter('tweebo_tweets_total', 'Number of Tweets parsed.')
+TOKENS = Counter('tweebo_tokens_total', 'Number of tokens parsed.')
+PIPELINES_IN_PROGRESS = Gauge('tweebo_pipelines_in_progress',
+                              'Number of TweeboParser pipelines running.',
+                              multiprocess_mode='livesum')
+QUEUED_REQUESTS = Gauge('tweebo_queued_requests',
+                        'Number of requests waiting for a pipeline in each '
+                        'priority lane.', ['lane'],
+                        multiprocess_mode='livesum')
+QUEUED_TWEETS = Gauge('tweebo_queued_tweets',
+                      'Number of Tweets in the requests waiting for a '
+                      'pipeline in each priority lane.', ['lane'],
+                      multiprocess_mode='livesum')
+QUEUED_TOKENS = Gauge('tweebo_queued_tokens',
+                      'Estimated number of tokens in the requests waiting '
+                      'for a pipeline in each priority lane.', ['lane'],
+                      multiprocess_mode='livesum')
+QUEUE_WAIT = Histogram('tweebo_queue_wait_seconds',
+                       'Time requests waited for a pipeline in each '
+                       'priority lane.', ['lane'], buckets=LATENCY_BUCKETS)
+LANE_REQUEST_LATENCY = Histogram('tweebo_lane_request_duration_seconds',
+                                 'Latency of parse requests in each '
+                                 'priority lane.', ['lane'],
+                                 buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram('tweebo_stage_duration_seconds',
+                          'Duration of each stage of the TweeboParser '
+                          'pipeline.', ['stage'], buckets=LATENCY_BUCKETS)
+STAGE_CPU = Counter('tweebo_stage_cpu_seconds_total',
+                    'CPU time used by the processes of each stage of the '
+                    'TweeboParser pipeline.', ['stage', 'mode'])
+STAGE_MAX_RSS = Gauge('tweebo_stage_max_rss_bytes',
+                      'Peak resident set size of the largest process of the '
+                      'last run of each stage of the TweeboParser pipeline.',
+                      ['stage'], multiprocess_mode='max')
+
+
+def observe_stage(stage_info):
+    '''
+    Records the duration, CPU time and peak memory of a pipeline stage. \
+    Used as the `stage_callback` of :py:func:`tweebo.process_texts`
+
+    :param stage_info: Information about the stage see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :type stage_info: Dict
+    :return: None
+    '''
+
+    stage = stage_info['stage']
+    STAGE_LATENCY.labels(stage).observe(stage_info['wall_time'])
+    STAGE_CPU.labels(stage, 'user').inc(stage_info['user_time'])
+    STAGE_CPU.labels(stage, 'system').inc(stage_info['system_time'])
+    STAGE_MAX_RSS.labels(stage).set(stage_info['max_rss'])
+
+
+def registry():
+    '''
+    :return: The registry to expose at `/metrics`, which collects the \
+    metrics of every worker process in multiprocess mode.
+    :rtype: prometheus_client.CollectorRegistry
+    '''
+
+    if not MULTIPROCESS:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def mark_process_dead(pid):
+    '''
+    Removes the gauges of a worker process that has exited from the \
+    metrics in multiprocess mode. Used as the `worker_exit` of \
+    :py:class:`tweebo.prefork.PreforkServer`
+
+    :param pid: Process ID of the worker.
+    :type pid: int
+    :return: None
+    '''
+
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
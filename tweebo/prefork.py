@@ -0,0 +1,321 @@
+'''
+Pre-forking server mode for the API server in :py:mod:`tweebo.server`, \
+started with `--workers`. The supervisor process binds the listening socket \
+and forks the workers, each of which serves the WSGI app with its own \
+waitress threads on the shared socket. This spreads the Python side of \
+requests, e.g. decoding, validation and encoding, across several GILs and \
+a worker that crashes only takes down its own requests.
+
+The supervisor:
+1. Restarts workers that die, waiting longer between restarts of a worker \
+that keeps dying soon after it starts, up to `MAX_RESTART_DELAY` seconds.
+2. On SIGTERM or SIGINT sends SIGTERM to the workers, waits \
+`graceful_timeout` seconds for them to exit and then kills any that are \
+left.
+
+A worker that receives SIGTERM, or whose supervisor has gone, stops \
+accepting connections, closes its idle keep-alive connections and waits \
+for its in-flight requests to finish and be sent, up to `graceful_timeout` \
+seconds, before it exits.
+
+Example:
+
+    PreforkServer(app, '0.0.0.0', 8000, workers=4, threads=8).run()
+'''
+
+import asyncore
+import errno
+import logging
+import os
+import signal
+import socket
+import time
+
+from waitress.server import TcpWSGIServer
+
+# A worker that dies within this many seconds of starting is restarted
+# after a delay that doubles each time, up to MAX_RESTART_DELAY seconds.
+MIN_WORKER_LIFETIME = 5.0
+MAX_RESTART_DELAY = 30.0
+# Seconds between the checks of the supervisor for dead workers
+SUPERVISE_INTERVAL = 0.5
+# Seconds the supervisor waits after killing the workers that did not drain
+KILL_TIMEOUT = 5.0
+
+
+class _InheritedSocketServer(TcpWSGIServer):
+    '''
+    Waitress server that accepts connections on a socket the supervisor has \
+    already bound.
+    '''
+
+    def bind_server_socket(self):
+        pass
+
+
+def _in_flight(channel):
+    '''
+    :param channel: A connection of a waitress server.
+    :type channel: waitress.channel.HTTPChannel
+    :return: Whether the connection is receiving, processing or sending a \
+    request.
+    :rtype: bool
+    '''
+
+    return bool(channel.requests or channel.request is not None or
+                channel.any_outbuf_has_data())
+
+
+def _drain(server, timeout):
+    '''
+    Stops the server accepting connections and runs it until its in-flight \
+    requests have been sent, closing the idle connections.
+
+    :param server: The server of the worker.
+    :param timeout: Most seconds to wait for the requests.
+    :type server: _InheritedSocketServer
+    :type timeout: float
+    :return: The number of connections still in flight after the timeout.
+    :rtype: int
+    '''
+
+    # Only this worker's copy of the listening socket is closed
+    server.close()
+    deadline = time.time() + timeout
+    while True:
+        busy = 0
+        for channel in list(server.active_channels.values()):
+            if _in_flight(channel):
+                busy += 1
+            else:
+                channel.will_close = True
+        if not busy or time.time() >= deadline:
+            break
+        asyncore.loop(timeout=0.1, map=server._map,
+                      use_poll=server.adj.asyncore_use_poll, count=1)
+    # Sends the closes of the idle connections
+    asyncore.loop(timeout=0, map=server._map,
+                  use_poll=server.adj.asyncore_use_poll, count=1)
+    server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+    return busy
+
+
+def _serve_worker(app, listen_socket, supervisor_pid, graceful_timeout,
+                  adjustments):
+    '''
+    Serves the app on the listening socket until SIGTERM is received or the \
+    supervisor has gone, then drains the in-flight requests.
+
+    :param app: WSGI app to serve.
+    :param listen_socket: Socket bound and listened on by the supervisor.
+    :param supervisor_pid: Process ID of the supervisor.
+    :param graceful_timeout: Most seconds to wait for in-flight requests.
+    :param adjustments: Waitress settings e.g. `threads`
+    :type app: Callable
+    :type listen_socket: socket.socket
+    :type supervisor_pid: int
+    :type graceful_timeout: float
+    :type adjustments: Dict
+    :return: None
+    '''
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(1))
+    # Ctrl-C reaches every process in the group, the supervisor stops the
+    # workers with SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = _InheritedSocketServer(app, _sock=listen_socket, **adjustments)
+    while not stopping and os.getppid() == supervisor_pid:
+        asyncore.loop(timeout=server.adj.asyncore_loop_timeout,
+                      map=server._map, use_poll=server.adj.asyncore_use_poll,
+                      count=1)
+    logging.info('Worker {} draining'.format(os.getpid()))
+    left = _drain(server, graceful_timeout)
+    if left:
+        logging.warning('Worker {} stopped with {} requests in flight'
+                        .format(os.getpid(), left))
+
+
+class PreforkServer(object):
+    '''
+    Supervisor of worker processes that serve a WSGI app on a shared \
+    listening socket see :py:mod:`tweebo.prefork`
+
+    :param app: WSGI app to serve.
+    :param host: Hostname or IP address to listen on.
+    :param port: Port to listen on, 0 picks a free port.
+    :param workers: Number of worker processes.
+    :param graceful_timeout: Most seconds the workers wait for in-flight \
+    requests when the server stops.
+    :param post_fork: Called in each worker after it is forked, with the \
+    number of the worker from 0 to workers - 1, before it serves requests.
+    :param worker_exit: Called in the supervisor with the process ID of \
+    each worker that has exited.
+    :param adjustments: Waitress settings of each worker e.g. `threads`
+    :type app: Callable
+    :type host: str
+    :type port: int
+    :type workers: int
+    :type graceful_timeout: float
+    :type post_fork: Callable[[int], None]
+    :type worker_exit: Callable[[int], None]
+    :raises ValueError: If workers is less than 1.
+    '''
+
+    def __init__(self, app, host, port, workers, graceful_timeout=30.0,
+                 post_fork=None, worker_exit=None, **adjustments):
+        if workers < 1:
+            raise ValueError('workers should be at least 1 not {}'
+                             .format(workers))
+        self.app = app
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.post_fork = post_fork
+        self.worker_exit = worker_exit
+        self.adjustments = adjustments
+        family, socktype, proto, _, address = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_STREAM)[0]
+        self.socket = socket.socket(family, socktype, proto)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(address)
+        self.socket.listen(adjustments.get('backlog', 1024))
+        self.host, self.port = self.socket.getsockname()[:2]
+        # Worker number of each running worker process
+        self._pids = {}
+        self._started = {}
+        self._restart_delay = {}
+        self._restart_at = {}
+        self._stopping = False
+
+    def _spawn(self, number):
+        '''
+        Forks worker number, the worker process exits once it stops serving.
+
+        :param number: Number of the worker.
+        :type number: int
+        :return: None
+        '''
+
+        supervisor_pid = os.getpid()
+        pid = os.fork()
+        if pid:
+            self._pids[pid] = number
+            self._started[number] = time.time()
+            logging.info('Started worker {} (pid {})'.format(number, pid))
+            return
+        exit_code = 0
+        try:
+            if self.post_fork is not None:
+                self.post_fork(number)
+            _serve_worker(self.app, self.socket, supervisor_pid,
+                          self.graceful_timeout, self.adjustments)
+        except BaseException:
+            logging.exception('Worker {} failed'.format(number))
+            exit_code = 1
+        finally:
+            # Does not return into the supervisor's code
+            os._exit(exit_code)
+
+    def _reap(self):
+        '''
+        Waits for the workers that have exited and schedules their restarts.
+
+        :return: None
+        '''
+
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                if error.errno == errno.ECHILD:
+                    self._pids.clear()
+                    return
+                raise
+            if not pid:
+                return
+            number = self._pids.pop(pid, None)
+            if number is None:
+                continue
+            if self.worker_exit is not None:
+                self.worker_exit(pid)
+            if self._stopping:
+                continue
+            if os.WIFSIGNALED(status):
+                reason = 'killed by signal {}'.format(os.WTERMSIG(status))
+            else:
+                reason = 'exit code {}'.format(os.WEXITSTATUS(status))
+            delay = 0
+            if time.time() - self._started[number] < MIN_WORKER_LIFETIME:
+                delay = min(MAX_RESTART_DELAY,
+                            max(0.5, 2 * self._restart_delay.get(number, 0)))
+            self._restart_delay[number] = delay
+            self._restart_at[number] = time.time() + delay
+            logging.warning('Worker {} (pid {}) died, {}, restarting in '
+                            '{:.1f}s'.format(number, pid, reason, delay))
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        '''
+        Starts the workers and supervises them until SIGTERM or SIGINT is \
+        received, then stops them gracefully.
+
+        :return: None
+        '''
+
+        previous_handlers = {signum: signal.signal(signum, self._stop)
+                             for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for number in range(self.workers):
+                self._spawn(number)
+            while not self._stopping:
+                self._reap()
+                running = set(self._pids.values())
+                for number, restart_at in list(self._restart_at.items()):
+                    if self._stopping or number in running or \
+                       time.time() < restart_at:
+                        continue
+                    del self._restart_at[number]
+                    self._spawn(number)
+                time.sleep(SUPERVISE_INTERVAL)
+        finally:
+            self._stopping = True
+            self._shutdown()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def _signal_workers(self, signum):
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signum)
+            except OSError as error:
+                if error.errno != errno.ESRCH:
+                    raise
+
+    def _shutdown(self):
+        '''
+        Sends SIGTERM to the workers and kills those that have not exited \
+        after the graceful timeout.
+
+        :return: None
+        '''
+
+        logging.info('Stopping {} workers'.format(len(self._pids)))
+        self.socket.close()
+        self._signal_workers(signal.SIGTERM)
+        # The workers can take up to a second to notice the signal
+        deadline = time.time() + self.graceful_timeout + 1
+        while self._pids and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        if self._pids:
+            logging.warning('Killing {} workers that did not stop in time'
+                            .format(len(self._pids)))
+            self._signal_workers(signal.SIGKILL)
+            deadline = time.time() + KILL_TIMEOUT
+            while self._pids and time.time() < deadline:
+                self._reap()
+                time.sleep(0.1)
@@ -0,0 +1,179 @@
+'''
+Profiles the Python stages of the TweeboParser pipeline. When a profile \
+directory is given, through the `profile_dir` argument of \
+:py:func:`tweebo.process_texts` or the `TWEEBO_PROFILE_DIR` environment \
+variable, the following is written to it for each Python stage:
+1. `<run>.<stage>.prof` - cProfile output which can be read by `pstats` and \
+flame graph tools e.g. `flameprof <run>.<stage>.prof > <stage>.svg`
+2. `<run>.<stage>.allocations.txt` - The lines that allocated the most \
+memory according to tracemalloc. tracemalloc requires Python 3.4 or later, \
+on earlier versions only the peak resident set size is reported.
+
+The Python stages are `conversion`, `brown_clusters` and `token_selection`, \
+which are run in their own processes, and `to_conll`/`to_stanford` the \
+conversion of the parse to the output format which is run in process.
+
+This module is also the script that the Python stage processes are run \
+with when profiling:
+python profiling.py PROFILE_DIR RUN STAGE SCRIPT [SCRIPT_ARGS...]
+'''
+
+import cProfile
+import os
+import resource
+import runpy
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PROFILE_DIR_ENV = 'TWEEBO_PROFILE_DIR'
+NUM_TOP_ALLOCATIONS = 25
+
+
+def get_profile_dir(profile_dir=None):
+    '''
+    :param profile_dir: Directory to write profiles to.
+    :type profile_dir: str or None
+    :return: The profile_dir or if None the value of the `TWEEBO_PROFILE_DIR` \
+    environment variable or None if that is not set either.
+    :rtype: str or None
+    '''
+
+    if profile_dir is not None:
+        return str(profile_dir)
+    return os.environ.get(PROFILE_DIR_ENV) or None
+
+
+def new_run_name():
+    '''
+    :return: A name which identifies the profiles of one run of the \
+    pipeline, so that runs do not overwrite each others profiles.
+    :rtype: str
+    '''
+
+    return '{}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid(),
+                             int((time.time() % 1) * 1000000))
+
+
+def profile_command(profile_dir, run_name, stage, command):
+    '''
+    :param profile_dir: Directory to write the profile to.
+    :param run_name: Name of the pipeline run see :py:func:`new_run_name`
+    :param stage: Name of the stage the command belongs too.
+    :param command: Command that runs a Python script e.g. \
+    `['python', 'script.py', 'arg']`
+    :type profile_dir: str
+    :type run_name: str
+    :type stage: str
+    :type command: list[str]
+    :return: The command changed so that the script is profiled.
+    :rtype: list[str]
+    '''
+
+    return [command[0], os.path.abspath(__file__), profile_dir, run_name,
+            stage] + command[1:]
+
+
+def _write_profile(profile_dir, run_name, stage, profile, snapshot):
+    '''
+    :param profile_dir: Directory to write the profile to.
+    :param run_name: Name of the pipeline run see :py:func:`new_run_name`
+    :param stage: Name of the stage that was profiled
+    :param profile: cProfile profile of the stage
+    :param snapshot: tracemalloc snapshot or None if tracemalloc is not \
+    available
+    :type profile_dir: str
+    :type run_name: str
+    :type stage: str
+    :type profile: cProfile.Profile
+    :type snapshot: tracemalloc.Snapshot or None
+    :return: None
+    '''
+
+    if not os.path.isdir(profile_dir):
+        try:
+            os.makedirs(profile_dir)
+        except OSError:
+            # Another stage may have created it at the same time
+            if not os.path.isdir(profile_dir):
+                raise
+    file_prefix = os.path.join(profile_dir, '{}.{}'.format(run_name, stage))
+    profile.dump_stats('{}.prof'.format(file_prefix))
+    with open('{}.allocations.txt'.format(file_prefix), 'w') as alloc_file:
+        if snapshot is None:
+            alloc_file.write('tracemalloc is not available in Python {}\n'
+                             .format(sys.version.split()[0]))
+        else:
+            _, peak = tracemalloc.get_traced_memory()
+            alloc_file.write('Peak traced memory: {} KiB\n'
+                             .format(peak // 1024))
+            alloc_file.write('Top {} allocations by line:\n'
+                             .format(NUM_TOP_ALLOCATIONS))
+            statistics = snapshot.statistics('lineno')
+            for statistic in statistics[:NUM_TOP_ALLOCATIONS]:
+                alloc_file.write('{}\n'.format(statistic))
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        alloc_file.write('Peak resident set size of the process: {} '
+                         '(KiB on Linux, bytes on macOS)\n'.format(max_rss))
+
+
+def profile_call(profile_dir, run_name, stage, func, *args, **kwargs):
+    '''
+    Calls the function under cProfile and tracemalloc writing the profiles \
+    to the profile directory.
+
+    :param profile_dir: Directory to write the profile to.
+    :param run_name: Name of the pipeline run see :py:func:`new_run_name`
+    :param stage: Name of the stage the function call represents.
+    :param func: Function to profile
+    :param args: Arguments to the function
+    :param kwargs: Keyword arguments to the function
+    :type profile_dir: str
+    :type run_name: str
+    :type stage: str
+    :type func: Callable
+    :return: The return of the function
+    '''
+
+    started_tracing = False
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        snapshot = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+        _write_profile(profile_dir, run_name, stage, profile, snapshot)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def _run_script(script_fp):
+    '''
+    Runs the script as if it was run from the command line with the \
+    arguments in `sys.argv`
+    '''
+
+    try:
+        runpy.run_path(script_fp, run_name='__main__')
+    finally:
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 5:
+        sys.stderr.write('Usage: python profiling.py PROFILE_DIR RUN STAGE '
+                         'SCRIPT [SCRIPT_ARGS...]\n')
+        sys.exit(2)
+    profile_dir, run_name, stage, script_fp = sys.argv[1:5]
+    # Make the script believe it was run directly
+    sys.argv = sys.argv[4:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script_fp))
+    profile_call(profile_dir, run_name, stage, _run_script, script_fp)
@@ -1,22 +1,288 @@
 # encoding: utf-8
 '''
 Flask API for the TweeboParser.
+
+Requests and responses are JSON by default. A client can instead send \
+`MessagePack <https://msgpack.org/>`_ by setting the `Content-Type` header \
+to `application/msgpack` and receive it by setting the `Accept` header to \
+`application/msgpack`. Request bodies can be gzip compressed \
+(`Content-Encoding: gzip`) and responses are gzip compressed when the \
+client sends `Accept-Encoding: gzip` and the response is large enough for \
+compression to be worth it.
+
+Prometheus metrics about the requests and the pipeline stages are exposed \
+at `/metrics` see :py:mod:`tweebo.metrics`
+
+The resources used to parse the texts of a request are logged and returned \
+in the `X-Tweebo-*` response headers see :py:func:`_resource_headers`
+
+The number of pipelines that run at the same time is limited, requests that \
+arrive when every pipeline is running wait in a bounded queue and when the \
+queue is full are rejected with `503` and a `Retry-After` header. A \
+request with more Tweets or tokens than the queue can hold is rejected \
+with `413` and no `Retry-After` header, as retrying it would not help see \
+:py:mod:`tweebo.admission`
+
+Texts that have already been tokenized and POS tagged can be sent as CoNLL \
+Strings by setting `input_format` to `conll`, which skips the tagger see \
+:py:func:`tweebo.process_texts`
+
+Setting `until` to `tagging` or `token_selection` stops the pipeline after \
+that stage and returns the tokens and POS tags, and for `token_selection` \
+the tokens that were not selected, without parsing the texts. Setting \
+`fast` to true parses the texts in a single pass, an experimental mode \
+that is faster but less accurate by an amount that has not been measured. \
+A server without the fast parsing model returns `501` for such requests.
+
+Each request is queued in a priority lane, `interactive` (the default) or \
+`bulk`, set by the `X-Tweebo-Priority` header or the `priority` field, the \
+field taking precedence. Interactive requests are admitted before bulk \
+requests and pipelines can be reserved for each lane see \
+:py:mod:`tweebo.admission`
+
+Each request can be given a timeout in seconds, set by the \
+`X-Tweebo-Timeout` header or the `timeout` field, the field taking \
+precedence, and the server can be started with a maximum timeout that \
+applies to every request. The timeout starts when the request arrives so \
+it includes the time spent waiting in the queue. A request that does not \
+finish in time has the processes of its pipeline killed and is returned \
+`504` see :py:class:`tweebo.stages.Cancellation`
+
+Clients on the same host can send the same requests over a Unix domain \
+socket, which avoids the TCP and HTTP overhead, when the server is started \
+with `--unix-socket` see :py:mod:`tweebo.unix_socket`
+
+When started from the command line the server parses a few texts in the \
+background before it is ready, which pays the cold costs of the pipeline, \
+e.g. reading the models from disk, before the first request. `/healthz` \
+returns `200` while the process is able to answer requests and `/readyz` \
+returns `200` once the warm-up parse has succeeded and `503` until then, \
+both with the state of the warm-up and the pipelines see \
+:py:class:`WarmUp`
+
+With `--workers` the server pre-forks that many worker processes that \
+share the listening socket, each with its own threads, admission \
+controller and share of the pipelines. Workers that die are restarted and \
+stopping the server lets in-flight requests finish see \
+:py:mod:`tweebo.prefork`
 '''
 
 import argparse
+import gzip
+import io
+import json
 import logging
 import multiprocessing
+import os
+import threading
+import time
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, make_response
 from flask_restful import Resource, Api, abort
 from marshmallow import Schema, fields, ValidationError
+import msgpack
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from waitress import serve
 
-from tweebo import process_texts
+from admission import AdmissionController, QueueFull, QueueTimeout
+from admission import RequestTooLarge
+from admission import estimate_tokens
+from admission import DEFAULT_LANE, LANES
+import metrics
+from prefork import PreforkServer
+from stages import PipelineTimeout, check_fast_parsing_model
+from tweebo import UNTIL_STAGES, process_texts
+import unix_socket
 
 
 app = Flask(__name__)
 api = Api(app)
+# Replaced when the server is started from the command line
+admission_controller = AdmissionController(multiprocessing.cpu_count(),
+                                           multiprocessing.cpu_count())
+PRIORITY_HEADER = 'X-Tweebo-Priority'
+TIMEOUT_HEADER = 'X-Tweebo-Timeout'
+# Most seconds a request can take, replaced when the server is started from
+# the command line. If None requests only time out when they ask to.
+max_request_timeout = None
+# Directory the Python stages of every request are profiled to, set by the
+# operator with --profile-dir. If None the TWEEBO_PROFILE_DIR environment
+# variable is used. Requests cannot turn profiling on themselves.
+profile_dir = None
+
+
+def _watch_queue(lane):
+    '''
+    Sets the queue gauges of the lane to read the queue of the current \
+    admission controller.
+
+    :param lane: One of the lanes in :py:data:`tweebo.admission.LANES`
+    :type lane: str
+    :return: None
+    '''
+
+    metrics.QUEUED_REQUESTS.labels(lane).set_function(
+        lambda: admission_controller.queued_requests(lane))
+    metrics.QUEUED_TWEETS.labels(lane).set_function(
+        lambda: admission_controller.queued_tweets(lane))
+    metrics.QUEUED_TOKENS.labels(lane).set_function(
+        lambda: admission_controller.queued_tokens(lane))
+
+
+for queue_lane in LANES:
+    _watch_queue(queue_lane)
+
+# Seconds between updates of the queue gauges of each worker process in
+# multiprocess mode, where the gauges are read from files rather than
+# calling the admission controller.
+QUEUE_GAUGE_INTERVAL = 1.0
+
+
+def _update_queue_gauges():
+    '''
+    Sets the queue gauges of every lane from the current admission \
+    controller every `QUEUE_GAUGE_INTERVAL` seconds, forever.
+
+    :return: None
+    '''
+
+    while True:
+        for lane in LANES:
+            metrics.QUEUED_REQUESTS.labels(lane).set(
+                admission_controller.queued_requests(lane))
+            metrics.QUEUED_TWEETS.labels(lane).set(
+                admission_controller.queued_tweets(lane))
+            metrics.QUEUED_TOKENS.labels(lane).set(
+                admission_controller.queued_tokens(lane))
+        time.sleep(QUEUE_GAUGE_INTERVAL)
+
+
+def _start_worker(number):
+    '''
+    Prepares a worker process forked by \
+    :py:class:`tweebo.prefork.PreforkServer`
+
+    :param number: Number of the worker.
+    :type number: int
+    :return: None
+    '''
+
+    if metrics.MULTIPROCESS:
+        thread = threading.Thread(target=_update_queue_gauges)
+        thread.daemon = True
+        thread.start()
+    if warm_up.state == 'warming':
+        _start_warm_up(warm_up_texts)
+
+# Texts parsed to warm up the pipeline when no warm-up file is given
+WARM_UP_TEXTS = [u'Warming up the TweeboParser before the first request :)',
+                 u'@tweebo good morning, ready to parse some tweets #nlp']
+# Seconds between attempts to warm up the pipeline after a failure
+WARM_UP_RETRY_INTERVAL = 30.0
+# The warm-up waits for a pipeline like a batch job so that it does not take
+# a pipeline reserved for interactive requests.
+WARM_UP_LANE = 'bulk'
+
+
+class WarmUp(object):
+    '''
+    State of the warm-up parse of the server, which is one of the following:
+    1. `skipped` - The server does not warm up, so it is always ready.
+    2. `warming` - The warm-up parse is running.
+    3. `failed` - The last warm-up parse failed and will be retried after \
+    `WARM_UP_RETRY_INTERVAL` seconds.
+    4. `warm` - A warm-up parse succeeded.
+
+    :param state: The starting state.
+    :type state: str
+    '''
+
+    def __init__(self, state='skipped'):
+        self.state = state
+        self.attempts = 0
+        self.seconds = None
+        self.error = None
+
+    def ready(self):
+        '''
+        :return: Whether the server is ready to parse requests.
+        :rtype: bool
+        '''
+
+        return self.state in ('skipped', 'warm')
+
+    def status(self):
+        '''
+        :return: The state, the number of attempts, the seconds the \
+        successful warm-up parse took and the error of the last failed \
+        attempt.
+        :rtype: Dict
+        '''
+
+        return {'state': self.state, 'attempts': self.attempts,
+                'seconds': self.seconds, 'error': self.error}
+
+
+# Replaced when the server is started from the command line
+warm_up = WarmUp()
+warm_up_texts = WARM_UP_TEXTS
+
+
+def _warm_up(texts, retry_interval=WARM_UP_RETRY_INTERVAL):
+    '''
+    Parses the texts until the parse succeeds, recording the attempts in \
+    the current :py:class:`WarmUp`. Each attempt waits for a pipeline in \
+    the `WARM_UP_LANE` of the admission controller, so the warm-up counts \
+    towards the pipeline limit, and times out after the maximum request \
+    timeout, if there is one.
+
+    :param texts: Texts to parse.
+    :param retry_interval: Seconds to wait after a failed attempt.
+    :type texts: list[str]
+    :type retry_interval: float
+    :return: None
+    '''
+
+    while True:
+        warm_up.state = 'warming'
+        warm_up.attempts += 1
+        start_time = time.time()
+        deadline = None
+        if max_request_timeout is not None:
+            deadline = start_time + max_request_timeout
+        try:
+            with admission_controller.admit(len(texts),
+                                            estimate_tokens(texts),
+                                            WARM_UP_LANE, deadline):
+                with metrics.PIPELINES_IN_PROGRESS.track_inprogress():
+                    process_texts(texts, output_type='conll',
+                                  deadline=deadline)
+        except Exception as error:
+            warm_up.error = repr(error)
+            warm_up.state = 'failed'
+            logging.warning('Warm-up parse {} failed, retrying in {}s: {}'
+                            .format(warm_up.attempts, retry_interval,
+                                    warm_up.error))
+            time.sleep(retry_interval)
+            continue
+        warm_up.seconds = time.time() - start_time
+        warm_up.error = None
+        warm_up.state = 'warm'
+        logging.info('Warmed up by parsing {} texts in {:.3f}s'
+                     .format(len(texts), warm_up.seconds))
+        return
+
+
+def _start_warm_up(texts):
+    '''
+    :param texts: Texts to parse see :py:func:`_warm_up`
+    :type texts: list[str]
+    :return: None
+    '''
+
+    thread = threading.Thread(target=_warm_up, args=(texts,))
+    thread.daemon = True
+    thread.start()
 
 
 class InputSchema(Schema):
@@ -26,8 +292,33 @@ class InputSchema(Schema):
             raise ValidationError('output_type should be one of these '
                                   'values {}'.format(output_types_allowed))
 
+    def valid_input_formats(input_format):
+        input_formats_allowed = ['text', 'conll']
+        if input_format not in input_formats_allowed:
+            raise ValidationError('input_format should be one of these '
+                                  'values {}'.format(input_formats_allowed))
+
+    def valid_until_stages(until):
+        if until not in UNTIL_STAGES:
+            raise ValidationError('until should be one of these values {}'
+                                  .format(UNTIL_STAGES))
+
+    def valid_timeouts(timeout):
+        if timeout <= 0:
+            raise ValidationError('timeout should be positive')
+
+    def valid_priorities(priority):
+        if priority not in LANES:
+            raise ValidationError('priority should be one of these values {}'
+                                  .format(LANES))
+
     output_type = fields.String(required=True, validate=valid_output_types)
     texts = fields.List(fields.String(), required=True)
+    input_format = fields.String(validate=valid_input_formats)
+    until = fields.String(validate=valid_until_stages)
+    fast = fields.Boolean()
+    priority = fields.String(validate=valid_priorities)
+    timeout = fields.Float(validate=valid_timeouts)
 
 
 class ConllSchema(Schema):
@@ -39,37 +330,453 @@ class StanfordSchema(Schema):
 
 
 input_schema = InputSchema()
+# The fields of a request that are given to process_texts. The other fields
+# of InputSchema, priority and timeout, are used by the server. Nothing
+# else in the body reaches process_texts, so a request cannot e.g. start
+# more pipelines with n_jobs.
+PROCESS_FIELDS = ('texts', 'output_type', 'input_format', 'until', 'fast')
 conll_schema = ConllSchema()
 stanford_schema = StanfordSchema()
 
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ['application/msgpack', 'application/x-msgpack']
+# Responses smaller than this are not worth the CPU time to gzip.
+GZIP_MIN_SIZE = 1024
+GZIP_COMPRESS_LEVEL = 6
+
+
+def _gzip_compress(data):
+    '''
+    :param data: Bytes to compress
+    :type data: bytes
+    :return: The data gzip compressed
+    :rtype: bytes
+    '''
+
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb',
+                       compresslevel=GZIP_COMPRESS_LEVEL) as gzip_file:
+        gzip_file.write(data)
+    return compressed.getvalue()
+
+
+def _gzip_decompress(data):
+    '''
+    :param data: gzip compressed bytes
+    :type data: bytes
+    :return: The data decompressed
+    :rtype: bytes
+    '''
+
+    with gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb') as gzip_file:
+        return gzip_file.read()
+
+
+def _request_data():
+    '''
+    Decodes the body of the current request based on its `Content-Encoding` \
+    and `Content-Type` headers.
+
+    :return: The decoded request body or None if the request has no body or \
+    the `Content-Type` is neither JSON nor MessagePack.
+    :raises ValueError: If the body cannot be decompressed or decoded.
+    '''
+
+    mimetype = request.mimetype
+    if mimetype != JSON_MIMETYPE and mimetype not in MSGPACK_MIMETYPES:
+        return None
+    body = request.get_data()
+    if not body:
+        return None
+    content_encoding = request.headers.get('Content-Encoding', '')
+    if content_encoding.strip().lower() == 'gzip':
+        try:
+            body = _gzip_decompress(body)
+        except (IOError, EOFError) as error:
+            raise ValueError('Could not gzip decompress the request body: '
+                             '{}'.format(repr(error)))
+    elif content_encoding.strip().lower() not in ('', 'identity'):
+        raise ValueError('Unsupported Content-Encoding: {}'
+                         .format(content_encoding))
+    try:
+        if mimetype in MSGPACK_MIMETYPES:
+            return msgpack.unpackb(body, raw=False)
+        return json.loads(body.decode('utf-8'))
+    except Exception as error:
+        raise ValueError('Could not decode the {} request body: {}'
+                         .format(mimetype, repr(error)))
+
+
+def _make_output_response(data):
+    '''
+    Encodes the data in the format the client prefers based on the `Accept` \
+    header, JSON being the default, and gzip compresses it if the client \
+    accepts gzip and the encoded data is at least `GZIP_MIN_SIZE` bytes.
+
+    :param data: Processed texts to return to the client.
+    :type data: list
+    :return: The response to send to the client.
+    :rtype: flask.Response
+    '''
+
+    mimetype = request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE] + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+    if mimetype in MSGPACK_MIMETYPES:
+        response = make_response(msgpack.packb(data, use_bin_type=True))
+        response.mimetype = mimetype
+    else:
+        response = jsonify(data)
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] and \
+       response.content_length >= GZIP_MIN_SIZE:
+        response.set_data(_gzip_compress(response.get_data()))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _resource_headers(report):
+    '''
+    :param report: Timing report from :py:func:`tweebo.process_texts`
+    :type report: Dict
+    :return: Response headers that contain the resources used to process \
+    the request:
+    1. X-Tweebo-Tweets - Number of Tweets parsed.
+    2. X-Tweebo-Tokens - Number of tokens parsed.
+    3. X-Tweebo-Wall-Seconds - Wall clock time to parse the Tweets.
+    4. X-Tweebo-CPU-User-Seconds - CPU time spent in user mode by the \
+    processes of the pipeline.
+    5. X-Tweebo-CPU-System-Seconds - CPU time spent in kernel mode by the \
+    processes of the pipeline.
+    6. X-Tweebo-Max-RSS-Bytes - Peak resident set size of the largest \
+    process of the pipeline.
+    7. X-Tweebo-Stage-Max-RSS-Bytes - Peak resident set size of each stage \
+    e.g. `tagging=231424000, conversion=8421376, ...`
+    8. X-Tweebo-Bytes-Written - Bytes written to temporary files.
+    :rtype: Dict
+    '''
+
+    stage_max_rss = ', '.join('{}={}'.format(info['stage'], info['max_rss'])
+                              for info in report['stages'])
+    return {'X-Tweebo-Tweets': str(report['tweets']),
+            'X-Tweebo-Tokens': str(report['tokens']),
+            'X-Tweebo-Wall-Seconds': '{:.3f}'.format(report['wall_time']),
+            'X-Tweebo-CPU-User-Seconds': '{:.3f}'.format(report['user_time']),
+            'X-Tweebo-CPU-System-Seconds': '{:.3f}'
+                                           .format(report['system_time']),
+            'X-Tweebo-Max-RSS-Bytes': str(report['max_rss']),
+            'X-Tweebo-Stage-Max-RSS-Bytes': stage_max_rss,
+            'X-Tweebo-Bytes-Written': str(report['bytes_written'])}
+
+
+class RequestError(Exception):
+    '''
+    Raised when a parse request cannot be processed.
+
+    :param message: Why the request failed.
+    :param status_code: HTTP status code of the failure.
+    :param retry_after: Seconds the client should wait before retrying, \
+    only when the queue is full.
+    :type message: str
+    :type status_code: int
+    :type retry_after: int
+    '''
+
+    def __init__(self, message, status_code, retry_after=None):
+        super(RequestError, self).__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _request_timeout(input_data, header_timeout=None, max_timeout=None):
+    '''
+    Removes the `timeout` field from the input data, the field taking \
+    precedence over the `X-Tweebo-Timeout` header.
+
+    :param input_data: The validated request body.
+    :param header_timeout: Value of the `X-Tweebo-Timeout` header or None \
+    if the request does not have the header.
+    :param max_timeout: Most seconds a request can take. If None requests \
+    only time out when they ask to.
+    :type input_data: Dict
+    :type header_timeout: str
+    :type max_timeout: float
+    :return: Seconds the request has to finish within or None if it does \
+    not time out.
+    :rtype: float
+    :raises RequestError: If the header is not a positive number.
+    '''
+
+    timeout = input_data.pop('timeout', None)
+    if timeout is None and header_timeout is not None:
+        try:
+            timeout = float(header_timeout)
+        except ValueError:
+            timeout = 0
+        # Also rejects nan
+        if not timeout > 0:
+            raise RequestError('The {} header should be a positive number '
+                               'of seconds'.format(TIMEOUT_HEADER), 422)
+    if max_timeout is not None:
+        timeout = min(timeout or max_timeout, max_timeout)
+    return timeout
+
+
+def _validate_request(input_data, header_priority=None, header_timeout=None,
+                      max_timeout=None):
+    '''
+    :param input_data: The decoded body of a parse request.
+    :param header_priority: Value of the `X-Tweebo-Priority` header or None.
+    :param header_timeout: Value of the `X-Tweebo-Timeout` header or None.
+    :param max_timeout: Most seconds a request can take see \
+    :py:func:`_request_timeout`
+    :type input_data: Dict
+    :type header_priority: str
+    :type header_timeout: str
+    :type max_timeout: float
+    :return: A tuple of: 1. The deserialised fields of the body that are \
+    given to :py:func:`tweebo.process_texts`, see `PROCESS_FIELDS`, 2. the \
+    priority lane of the request, 3. the seconds the request has to finish \
+    within or None.
+    :rtype: tuple[Dict, str, float]
+    :raises RequestError: If the request is not valid or has fields that \
+    are not in :py:class:`InputSchema`
+    '''
+
+    if not input_data:
+        raise RequestError('No input data. Expect output_type and texts '
+                           'inputs', 400)
+    if not isinstance(input_data, dict):
+        raise RequestError('Expected the request to be a map not {}'
+                           .format(type(input_data)), 400)
+    unknown_fields = sorted(set(input_data) - set(input_schema.fields))
+    if unknown_fields:
+        raise RequestError('Unknown fields {}, the fields can only be {}'
+                           .format(unknown_fields,
+                                   sorted(input_schema.fields)), 422)
+    input_val_errors = input_schema.validate(input_data)
+    if input_val_errors:
+        raise RequestError('{}'.format(input_val_errors), 422)
+    # Deserialises the fields e.g. a fast value of `"false"` to False
+    input_data.update(input_schema.load(input_data).data)
+    lane = input_data.pop('priority', None) or \
+        (header_priority or DEFAULT_LANE).strip()
+    if lane not in LANES:
+        raise RequestError('The {} header should be one of these values {}'
+                           .format(PRIORITY_HEADER, LANES), 422)
+    timeout = _request_timeout(input_data, header_timeout, max_timeout)
+    process_options = {field: input_data[field] for field in PROCESS_FIELDS
+                       if field in input_data}
+    return process_options, lane, timeout
+
+
+def _process_request(input_data, lane, timeout, start_time):
+    '''
+    Waits for a pipeline and parses the texts of a validated request.
+
+    :param input_data: Deserialised body see :py:func:`_validate_request`
+    :param lane: Priority lane of the request.
+    :param timeout: Seconds the request has to finish within or None.
+    :param start_time: Time the request arrived, which the timeout starts \
+    from.
+    :type input_data: Dict
+    :type lane: str
+    :type timeout: float
+    :type start_time: float
+    :return: The processed texts and the timing report see \
+    :py:func:`tweebo.process_texts`
+    :rtype: tuple[list, Dict]
+    :raises RequestError: If the request is fast but the server does not \
+    have the fast parsing model, the request is larger than the queue, the \
+    queue is full, the request timed out or the texts could not be \
+    processed.
+    '''
+
+    if input_data.get('fast') and \
+            input_data.get('until', 'parsing') == 'parsing':
+        try:
+            check_fast_parsing_model()
+        except IOError:
+            raise RequestError('Fast parsing is not available on this '
+                               'server as its fast parsing model has not '
+                               'been trained', 501)
+    deadline = None
+    if timeout is not None:
+        deadline = start_time + timeout
+    texts = input_data['texts']
+    num_tokens = estimate_tokens(texts,
+                                 input_data.get('input_format', 'text'))
+    try:
+        with admission_controller.admit(len(texts), num_tokens, lane,
+                                        deadline) as wait:
+            metrics.QUEUE_WAIT.labels(lane).observe(wait)
+            try:
+                with metrics.PIPELINES_IN_PROGRESS.track_inprogress():
+                    processed_texts, report = process_texts(
+                        stage_callback=metrics.observe_stage,
+                        timing_report=True, deadline=deadline,
+                        profile_dir=profile_dir, **input_data)
+            except PipelineTimeout as error:
+                raise RequestError('{} ({} second timeout)'
+                                   .format(error, timeout), 504)
+            except Exception as exception:
+                raise RequestError('Error: {}'.format(repr(exception)), 415)
+    except QueueTimeout as error:
+        raise RequestError('{} ({} second timeout)'.format(error, timeout),
+                           504)
+    except RequestTooLarge as error:
+        raise RequestError('{}, split the texts into smaller requests'
+                           .format(error), 413)
+    except QueueFull as error:
+        raise RequestError('{}, retry after {} seconds'
+                           .format(error, error.retry_after), 503,
+                           error.retry_after)
+    output_type = input_data['output_type'].lower()
+    process_val_errors = None
+    if output_type == 'conll':
+        process_val_errors = conll_schema.validate({'data': processed_texts})
+    else:
+        process_val_errors = stanford_schema.validate({'data':
+                                                      processed_texts})
+    if process_val_errors:
+        raise RequestError('{}'.format(process_val_errors), 422)
+    metrics.TWEETS.inc(report['tweets'])
+    metrics.TOKENS.inc(report['tokens'])
+    logging.info('Parsed {} Tweets ({} tokens) in {:.3f}s, CPU user {:.3f}s '
+                 'system {:.3f}s, peak RSS {} bytes, {} bytes written'
+                 .format(report['tweets'], report['tokens'],
+                         report['wall_time'], report['user_time'],
+                         report['system_time'], report['max_rss'],
+                         report['bytes_written']))
+    return processed_texts, report
+
+
+def _error_response(error):
+    '''
+    :param error: Why the request failed.
+    :type error: RequestError
+    :return: The response to send to the client, with a `Retry-After` \
+    header when the queue is full.
+    :rtype: flask.Response
+    '''
+
+    response = jsonify({'message': '{}'.format(error)})
+    response.status_code = error.status_code
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _socket_request(message):
+    '''
+    Parses the texts of a request sent over the Unix domain socket see \
+    :py:mod:`tweebo.unix_socket`
+
+    :param message: The decoded request.
+    :type message: Dict
+    :return: The response, containing the `status` and either the `data` \
+    or the error `message` and when the queue is full `retry_after`
+    :rtype: Dict
+    '''
+
+    start_time = time.time()
+    lane = None
+    try:
+        input_data, lane, timeout = _validate_request(
+            message, max_timeout=max_request_timeout)
+        processed_texts, _ = _process_request(input_data, lane, timeout,
+                                              start_time)
+        response = {'status': 200, 'data': processed_texts}
+    except RequestError as error:
+        response = {'status': error.status_code,
+                    'message': '{}'.format(error)}
+        if error.retry_after is not None:
+            response['retry_after'] = error.retry_after
+    metrics.REQUESTS.labels(response['status']).inc()
+    latency = time.time() - start_time
+    metrics.REQUEST_LATENCY.observe(latency)
+    if lane is not None:
+        metrics.LANE_REQUEST_LATENCY.labels(lane).observe(latency)
+    return response
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start_time = time.time()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    if request.endpoint == 'tweeboparser':
+        metrics.REQUESTS.labels(response.status_code).inc()
+        latency = time.time() - g.request_start_time
+        metrics.REQUEST_LATENCY.observe(latency)
+        if 'lane' in g:
+            metrics.LANE_REQUEST_LATENCY.labels(g.lane).observe(latency)
+    return response
+
 
 class TweeboParser(Resource):
     def post(self):
-        input_data = request.get_json()
-        if not input_data:
-            abort(400,
-                  message='No input data. Expect output_type and texts inputs')
-        input_val_errors = input_schema.validate(request.get_json())
-        if input_val_errors:
-            abort(422, message='{}'.format(input_val_errors))
         try:
-            processed_texts = process_texts(**input_data)
-        except Exception as exception:
-            abort(415, message='Error: {}'.format(repr(exception)))
-        output_type = input_data['output_type'].lower()
-        process_val_errors = None
-        if output_type == 'conll':
-            process_val_errors = conll_schema.validate({'data':
-                                                        processed_texts})
-        else:
-            process_val_errors = stanford_schema.validate({'data':
-                                                          processed_texts})
-        if process_val_errors:
-            abort(422, message='{}'.format(process_val_errors))
-        return jsonify(processed_texts)
+            input_data = _request_data()
+        except ValueError as error:
+            abort(400, message='{}'.format(error))
+        try:
+            input_data, lane, timeout = _validate_request(
+                input_data, request.headers.get(PRIORITY_HEADER),
+                request.headers.get(TIMEOUT_HEADER), max_request_timeout)
+            g.lane = lane
+            processed_texts, report = _process_request(
+                input_data, lane, timeout, g.request_start_time)
+        except RequestError as error:
+            return _error_response(error)
+        response = _make_output_response(processed_texts)
+        response.headers.extend(_resource_headers(report))
+        return response
+
+
+class Metrics(Resource):
+    def get(self):
+        response = make_response(generate_latest(metrics.registry()))
+        response.headers['Content-Type'] = CONTENT_TYPE_LATEST
+        return response
+
+
+def _pipeline_status():
+    '''
+    :return: The maximum number of pipelines of this process and the \
+    requests running and queued in each lane.
+    :rtype: Dict
+    '''
+
+    return {'max': admission_controller.max_pipelines,
+            'running': {lane: admission_controller.running(lane)
+                        for lane in LANES},
+            'queued_requests': {lane: admission_controller.queued_requests(
+                lane) for lane in LANES}}
+
+
+class Health(Resource):
+    def get(self):
+        return jsonify({'status': 'alive', 'pid': os.getpid()})
+
+
+class Readiness(Resource):
+    def get(self):
+        ready = warm_up.ready()
+        response = jsonify({'ready': ready, 'pid': os.getpid(),
+                            'warm_up': warm_up.status(),
+                            'pipelines': _pipeline_status()})
+        if not ready:
+            response.status_code = 503
+        return response
 
 
 api.add_resource(TweeboParser, '/')
+api.add_resource(Metrics, '/metrics')
+api.add_resource(Health, '/healthz')
+api.add_resource(Readiness, '/readyz')
 
 description = 'Starts the API server for TweeboParser'
 parser = argparse.ArgumentParser(prog='TweeboParser Server',
@@ -85,13 +792,122 @@ hostname_help = 'Hostname/IP address on which the server listen to '\
                 '(default: 0.0.0.0)'
 parser.add_argument('--hostname', type=str,
                     help=hostname_help, default='0.0.0.0')
+parser.add_argument('--max-pipelines', type=int,
+                    default=max(1, multiprocessing.cpu_count() // 2),
+                    help='The number of pipelines that can run at the same '
+                         'time (default: half the number of CPUs)')
+parser.add_argument('--max-queued-requests', type=int,
+                    help='The number of requests that can wait for a '
+                         'pipeline in each priority lane, each waiting '
+                         'request uses a thread (default: threads minus max '
+                         'pipelines shared between the lanes)')
+parser.add_argument('--max-queued-tweets', type=int,
+                    help='The number of Tweets that can wait for a pipeline '
+                         'in each priority lane (default: no limit)')
+parser.add_argument('--max-queued-tokens', type=int,
+                    help='The estimated number of tokens that can wait for a '
+                         'pipeline in each priority lane (default: no limit)')
+parser.add_argument('--interactive-pipelines', type=int,
+                    help='The number of pipelines reserved for interactive '
+                         'requests (default: 1 if max pipelines is at least '
+                         '2 else 0)')
+parser.add_argument('--bulk-pipelines', type=int,
+                    help='The number of pipelines reserved for bulk requests, '
+                         'which keeps bulk requests progressing when '
+                         'interactive requests use every other pipeline '
+                         '(default: 1 if max pipelines is at least 2 else 0)')
+parser.add_argument('--request-timeout', type=float,
+                    help='The most seconds a request can take, including '
+                         'waiting in the queue, before its pipeline is '
+                         'killed and 504 is returned. Requests can ask for '
+                         'a shorter timeout (default: no limit)')
+parser.add_argument('--unix-socket', type=str,
+                    help='Path of a Unix domain socket to also serve '
+                         'requests from, for clients on the same host '
+                         '(default: not served)')
+parser.add_argument('--profile-dir', type=str,
+                    help='Directory to write cProfile and tracemalloc '
+                         'profiles of the Python stages of every request to '
+                         '(default: the TWEEBO_PROFILE_DIR environment '
+                         'variable, if not set nothing is profiled)')
+parser.add_argument('-w', '--workers', type=int, default=1,
+                    help='The number of worker processes that share the '
+                         'port, each with the given number of threads and '
+                         'an equal share, at least 1, of the max pipelines. '
+                         'Workers that die are restarted (default: 1, '
+                         'requests are served by this process)')
+parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                    help='With more than 1 worker, the most seconds the '
+                         'workers wait for in-flight requests to finish '
+                         'when the server is stopped (default: 30)')
+parser.add_argument('--warm-up-file', type=str,
+                    help='File of texts, one per line, parsed at startup '
+                         'before the server is ready (default: a couple of '
+                         'built in Tweets)')
+parser.add_argument('--no-warm-up', action='store_true',
+                    help='Do not parse any texts at startup, the server is '
+                         'ready as soon as it starts')
 
 if __name__ == '__main__':
     logging.basicConfig(format='%(levelname)s: %(message)s',
                         level=logging.INFO)
 
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers should be at least 1')
+    if args.workers > 1 and args.unix_socket is not None:
+        parser.error('--unix-socket can only be used with 1 worker')
+    # The pipelines and queue limits of each worker
+    max_pipelines = max(1, args.max_pipelines // args.workers)
+    max_queued_requests = args.max_queued_requests
+    if max_queued_requests is None:
+        max_queued_requests = max(0, args.threads - max_pipelines) // \
+            len(LANES)
+    default_reserved = 1 if max_pipelines >= len(LANES) else 0
+    reserved_pipelines = {'interactive': args.interactive_pipelines,
+                          'bulk': args.bulk_pipelines}
+    for lane, reserved in reserved_pipelines.items():
+        if reserved is None:
+            reserved_pipelines[lane] = default_reserved
+    max_request_timeout = args.request_timeout
+    profile_dir = args.profile_dir
+    warm_up_texts = WARM_UP_TEXTS
+    if args.warm_up_file is not None:
+        with io.open(args.warm_up_file, 'r', encoding='utf-8') as texts:
+            warm_up_texts = [text.strip() for text in texts if text.strip()]
+    if not args.no_warm_up and warm_up_texts:
+        warm_up = WarmUp('warming')
+    admission_controller = AdmissionController(max_pipelines,
+                                               max_queued_requests,
+                                               args.max_queued_tweets,
+                                               args.max_queued_tokens,
+                                               reserved_pipelines)
     logging.info('Serving on: {}:{}'.format(args.hostname, args.port))
     logging.info('Number of threads allocated: {}'.format(args.threads))
-    serve(app, host=args.hostname, port=args.port,
-          threads=args.threads)
+    logging.info('Running at most {} pipelines, reserving {}, with {} '
+                 'queued requests per lane{}'
+                 .format(max_pipelines, reserved_pipelines,
+                         max_queued_requests,
+                         ' in each of {} workers'.format(args.workers)
+                         if args.workers > 1 else ''))
+    if args.workers > 1:
+        PreforkServer(app, args.hostname, args.port, args.workers,
+                      graceful_timeout=args.graceful_timeout,
+                      post_fork=_start_worker,
+                      worker_exit=metrics.mark_process_dead,
+                      threads=args.threads).run()
+    else:
+        if warm_up.state == 'warming':
+            _start_warm_up(warm_up_texts)
+        unix_server = None
+        if args.unix_socket is not None:
+            unix_server = unix_socket.serve_in_background(args.unix_socket,
+                                                          _socket_request)
+            logging.info('Serving on Unix socket: {}'.format(args.unix_socket))
+        try:
+            serve(app, host=args.hostname, port=args.port,
+                  threads=args.threads)
+        finally:
+            if unix_server is not None:
+                unix_server.shutdown()
+                unix_server.server_close()
@@ -0,0 +1,676 @@
+'''
+Runs the TweeboParser pipeline one stage at a time. The stages and the \
+commands they run are the same as those in the run.sh script, but running \
+them from Python allows information about each stage to be recorded e.g. \
+how long each stage took.
+
+The stages in the order they are run:
+1. tagging - Tokenizes and POS tags the raw text using the ark Twitter POS \
+tagger.
+2. conversion - Converts the tagger output into the CoNLL format.
+3. brown_clusters - Appends the Brown Clusters of each token.
+4. token_selection - Appends whether each token is selected to be part of \
+the dependency tree.
+5. ptb_parsing - Parses with the PTB model to get the posteriors used as \
+features in the next stage.
+6. parsing - Parses using the posteriors from the PTB model as features.
+
+In the experimental fast mode the ptb_parsing stage is not run and the \
+parsing stage uses a model trained without the PTB posterior features, \
+`fast_parsing_model`, so TurboParser runs once rather than twice, at a \
+cost in accuracy that has not been measured. The model is not one of the \
+pretrained models, it is trained by `scripts/train_fast_parsing_model.sh` \
+see :py:mod:`tweebo.evaluate` for how to measure its accuracy.
+
+In streaming mode the first 4 stages, which read their input once from \
+start to end, are connected by pipes and no intermediate files are \
+written, only the output of token_selection is written as both parsing \
+stages read it. The conversion, brown_clusters and token_selection scripts \
+write each Tweet as soon as they have read it, so the later stages work \
+on the early Tweets while the earlier stages are still reading. The \
+parsing stages are then run one after the other as TurboParser reads its \
+input file more than once.
+
+A running pipeline can be cancelled from another thread with a \
+:py:class:`Cancellation`, which kills the processes of the running stages \
+and makes the pipeline raise :py:class:`PipelineCancelled`. A \
+:py:class:`Cancellation` with a deadline cancels the pipeline once the \
+deadline passes, which raises :py:class:`PipelineTimeout` instead.
+'''
+
+import os
+from pathlib import Path
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import profiling
+
+ROOT_DIR = Path(__file__).absolute().parent.joinpath('..').resolve()
+SCRIPT_DIR = ROOT_DIR.joinpath('scripts')
+TAGGER_DIR = ROOT_DIR.joinpath('ark-tweet-nlp-0.3.2')
+PARSER_DIR = ROOT_DIR.joinpath('TBParser')
+TOKENSEL_DIR = ROOT_DIR.joinpath('token_selection')
+MODEL_DIR = ROOT_DIR.joinpath('pretrained_models')
+FAST_PARSING_MODEL = MODEL_DIR.joinpath('fast_parsing_model')
+
+STAGES = ['tagging', 'conversion', 'brown_clusters', 'token_selection',
+          'ptb_parsing', 'parsing']
+# Stages that run Python scripts, these are the stages that can be profiled
+# see :py:mod:`tweebo.profiling`
+PYTHON_STAGES = ['conversion', 'brown_clusters', 'token_selection']
+# Stages that are connected by pipes in streaming mode
+STREAM_STAGES = ['tagging', 'conversion', 'brown_clusters', 'token_selection']
+# The intermediate file each stage after tagging reads, the pipeline can be
+# started at any of these stages by giving it that file as its input.
+STAGE_INPUTS = {'conversion': 'Tagger_output', 'brown_clusters': 'tagger.out',
+                'token_selection': 'tag.br.out', 'ptb_parsing': 'test'}
+# The intermediate file each stage before parsing writes, the pipeline can be
+# stopped after any of these stages by writing that file to the output file.
+STAGE_OUTPUTS = {'tagging': 'Tagger_output', 'conversion': 'tagger.out',
+                 'brown_clusters': 'tag.br.out', 'token_selection': 'test',
+                 'ptb_parsing': 'ptb_single_predict_test'}
+# ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+MAX_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+class PipelineCancelled(Exception):
+    '''
+    Raised by a pipeline that was cancelled see :py:class:`Cancellation`
+    '''
+
+
+class PipelineTimeout(PipelineCancelled):
+    '''
+    Raised by a pipeline that was cancelled as it did not finish before its \
+    deadline see :py:meth:`Cancellation.set_deadline`
+    '''
+
+
+def _kill_group(process):
+    '''
+    Kills the process and every process it started, which are in the \
+    process group of the process see :py:func:`_process_group`
+
+    :param process: A process started in its own process group.
+    :type process: subprocess.Popen
+    :return: None
+    '''
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # The process group has already exited
+        pass
+
+
+class Cancellation(object):
+    '''
+    Cancels the pipelines it is passed to from another thread see \
+    :py:func:`run_pipeline`. Once cancelled the processes of the running \
+    stages are killed, no more stages are started and the pipelines raise \
+    :py:class:`PipelineCancelled`
+
+    Each stage of a cancellable pipeline runs in its own process group so \
+    that the processes the stage starts are killed with it e.g. the JVM \
+    started by the tagger's shell script.
+
+    :param deadline: Optional time, in seconds since the epoch, to cancel \
+    at see :py:meth:`set_deadline`
+    :type deadline: float
+    '''
+
+    def __init__(self, deadline=None):
+        self.cancelled = False
+        self.timed_out = False
+        self.deadline = None
+        self._processes = set()
+        self._timer = None
+        self._lock = threading.Lock()
+        if deadline is not None:
+            self.set_deadline(deadline)
+
+    def set_deadline(self, deadline):
+        '''
+        Cancels at the deadline, unless there is already an earlier one, \
+        after which the pipelines raise :py:class:`PipelineTimeout`
+
+        :param deadline: Time, in seconds since the epoch, to cancel at. \
+        If it has passed the pipelines are cancelled straight away.
+        :type deadline: float
+        :return: None
+        '''
+
+        with self._lock:
+            if self.deadline is not None and self.deadline <= deadline:
+                return
+            self.deadline = deadline
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(max(0.0, deadline - time.time()),
+                                          self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def close(self):
+        '''
+        Stops waiting for the deadline, called once the pipelines have \
+        finished.
+
+        :return: None
+        '''
+
+        with self._lock:
+            self.deadline = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _expire(self):
+        '''
+        Cancels as the deadline has passed.
+
+        :return: None
+        '''
+
+        with self._lock:
+            if not self.cancelled:
+                self.timed_out = True
+        self.cancel()
+
+    def cancel(self):
+        '''
+        Kills the processes of the running stages and stops any more \
+        stages from starting.
+
+        :return: None
+        '''
+
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            _kill_group(process)
+
+    def check(self):
+        '''
+        :return: None
+        :raises PipelineTimeout: If cancelled as the deadline passed.
+        :raises PipelineCancelled: If cancelled.
+        '''
+
+        if self.timed_out:
+            raise PipelineTimeout('The Tweebo pipeline did not finish '
+                                  'before its deadline')
+        if self.cancelled:
+            raise PipelineCancelled('The Tweebo pipeline was cancelled')
+
+    def add(self, process):
+        '''
+        Adds a process of a running stage, which is killed straight away if \
+        already cancelled.
+
+        :param process: A process started in its own process group.
+        :type process: subprocess.Popen
+        :return: None
+        '''
+
+        with self._lock:
+            self._processes.add(process)
+            if self.cancelled:
+                _kill_group(process)
+
+    def discard(self, process):
+        '''
+        :param process: A process that has finished.
+        :type process: subprocess.Popen
+        :return: None
+        '''
+
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _process_group(cancellation):
+    '''
+    :param cancellation: The cancellation of the pipeline or None.
+    :type cancellation: Cancellation or None
+    :return: The `preexec_fn` that starts a stage in its own process group \
+    if the pipeline can be cancelled, otherwise None so that the stages \
+    stay in the process group of the caller and receive its signals e.g. \
+    Ctrl-C.
+    :rtype: Callable or None
+    '''
+
+    if cancellation is None:
+        return None
+    return os.setpgrp
+
+
+def _stage_commands(input_fp, output_fp, working_dir, streaming=False,
+                    first_stage='tagging', last_stage='parsing',
+                    fast=False):
+    '''
+    :param input_fp: File containing raw text, one text per line, or if \
+    first_stage is not `tagging` the file that the first stage reads see \
+    `STAGE_INPUTS`
+    :param output_fp: File the dependency parse, or if last_stage is not \
+    `parsing` the output of the last stage, will be written too.
+    :param working_dir: Directory to store the intermediate files.
+    :param streaming: Whether the `STREAM_STAGES` read their input from \
+    the standard input rather than from the previous stage's file.
+    :param first_stage: Stage to start the pipeline from.
+    :param last_stage: Stage to stop the pipeline after.
+    :param fast: Whether the parsing stage uses the `FAST_PARSING_MODEL` \
+    without the posteriors of the ptb_parsing stage.
+    :type input_fp: Path
+    :type output_fp: Path
+    :type working_dir: Path
+    :type streaming: bool
+    :type first_stage: str
+    :type last_stage: str
+    :type fast: bool
+    :return: A list of tuples, one for each stage in `STAGES` order, each \
+    containing: 1. stage name, 2. command to run, 3. file the standard \
+    output of the command is written to or None if the output is not \
+    needed. The stages before first_stage and after last_stage should not \
+    be run, nor should the ptb_parsing stage when fast.
+    :rtype: list[tuple[str, list[str], Path]]
+    :raises ValueError: If the pipeline cannot be started from first_stage, \
+    cannot be stopped after last_stage, last_stage is before first_stage \
+    or last_stage is `ptb_parsing` when fast.
+    '''
+
+    if first_stage != 'tagging' and first_stage not in STAGE_INPUTS:
+        raise ValueError('The pipeline can only be started from one of {} '
+                         'not {}'.format(['tagging'] + sorted(STAGE_INPUTS),
+                                         first_stage))
+    if last_stage not in STAGES:
+        raise ValueError('The pipeline can only be stopped after one of {} '
+                         'not {}'.format(STAGES, last_stage))
+    if STAGES.index(last_stage) < STAGES.index(first_stage):
+        raise ValueError('The last stage {} is before the first stage {}'
+                         .format(last_stage, first_stage))
+    if fast and last_stage == 'ptb_parsing':
+        raise ValueError('The ptb_parsing stage is not run in fast mode')
+
+    def work_fp(name):
+        if name == STAGE_OUTPUTS.get(last_stage):
+            return str(output_fp)
+        if name == STAGE_INPUTS.get(first_stage):
+            return str(input_fp)
+        if streaming and name in ['Tagger_output', 'tagger.out',
+                                  'tag.br.out']:
+            return '/dev/stdin'
+        return str(working_dir.joinpath(name))
+
+    test_fp = work_fp('test')
+    score_dir = work_fp('test_score')
+    turbo_parser = str(PARSER_DIR.joinpath('TurboParser'))
+    posterior_options = ['--output_posterior=false', '--use_posterior=true',
+                         '--posterior_dir={}'.format(score_dir)]
+    parsing_model = MODEL_DIR.joinpath('parsing_model')
+    if fast:
+        posterior_options = ['--output_posterior=false',
+                             '--use_posterior=false']
+        parsing_model = FAST_PARSING_MODEL
+    return [('tagging',
+             [str(TAGGER_DIR.joinpath('runTagger.sh')),
+              '--model', str(MODEL_DIR.joinpath('tagging_model')),
+              '--output-format', 'conll', str(input_fp)],
+             work_fp('Tagger_output')),
+            ('conversion',
+             ['python', str(SCRIPT_DIR.joinpath(
+                 'ConvertFromTaggingResToConll.py')),
+              work_fp('Tagger_output')],
+             work_fp('tagger.out')),
+            ('brown_clusters',
+             ['python', str(SCRIPT_DIR.joinpath(
+                 'AugumentBrownClusteringFeature46.py')),
+              str(MODEL_DIR.joinpath('twitter_brown_clustering_full')),
+              work_fp('tagger.out'), 'N'],
+             work_fp('tag.br.out')),
+            ('token_selection',
+             ['python', str(TOKENSEL_DIR.joinpath('pipeline.py')),
+              work_fp('tag.br.out'),
+              str(MODEL_DIR.joinpath('tokensel_weights'))],
+             test_fp),
+            ('ptb_parsing',
+             [turbo_parser, '--test',
+              '--file_model={}'.format(MODEL_DIR.joinpath(
+                  'ptb_parsing_model')),
+              '--file_test={}'.format(test_fp),
+              '--file_prediction={}'.format(
+                  work_fp('ptb_single_predict_test')),
+              '--output_posterior=true', '--use_posterior=false',
+              '--posterior_dir={}'.format(score_dir)],
+             None),
+            ('parsing',
+             [turbo_parser, '--test',
+              '--file_model={}'.format(parsing_model),
+              '--file_test={}'.format(test_fp),
+              '--file_prediction={}'.format(output_fp)] + posterior_options,
+             None)]
+
+
+def _stage_env():
+    '''
+    :return: The environment the stages are run in, which is the current \
+    environment with the TurboParser dependencies added to the \
+    LD_LIBRARY_PATH as done in run.sh
+    :rtype: Dict
+    '''
+
+    env = dict(os.environ)
+    library_dir = str(PARSER_DIR.joinpath('deps', 'local', 'lib'))
+    env['LD_LIBRARY_PATH'] = '{}:{}:'.format(env.get('LD_LIBRARY_PATH', ''),
+                                             library_dir)
+    return env
+
+
+def _disk_usage(paths):
+    '''
+    :param paths: Files and directories
+    :type paths: list[Path]
+    :return: Total size in bytes of the files and the files within the \
+    directories. Paths that do not exist have a size of 0.
+    :rtype: int
+    '''
+
+    total_size = 0
+    for path in paths:
+        path = str(path)
+        if os.path.isfile(path):
+            total_size += os.path.getsize(path)
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                if os.path.isfile(file_path):
+                    total_size += os.path.getsize(file_path)
+    return total_size
+
+
+def _wait(process):
+    '''
+    Waits for the process to finish.
+
+    :param process: A running process
+    :type process: subprocess.Popen
+    :return: A tuple of: 1. The exit code of the process, negative if the \
+    process was killed by a signal, 2. resource usage of the process and of \
+    all of its children see :py:func:`os.wait4`
+    :rtype: tuple[int, resource.struct_rusage]
+    '''
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, rusage
+
+
+def _run_stage(stage, command, stdout_fp, env, cancellation=None):
+    '''
+    :param stage: Name of the stage
+    :param command: Command the stage runs
+    :param stdout_fp: File to write the standard output of the command to. \
+    If None the standard output is not redirected.
+    :param env: Environment to run the command in.
+    :param cancellation: Optional cancellation that kills the command.
+    :type stage: str
+    :type command: list[str]
+    :type stdout_fp: Path or None
+    :type env: Dict
+    :type cancellation: Cancellation
+    :return: Information about the stage that was run, a dictionary \
+    containing the following keys:
+    1. stage - Name of the stage
+    2. wall_time - Wall clock time in seconds the stage took.
+    3. user_time - CPU time in seconds spent in user mode by the stage and \
+    all of the processes it started.
+    4. system_time - CPU time in seconds spent in kernel mode by the stage \
+    and all of the processes it started.
+    5. max_rss - Peak resident set size in bytes of the largest process \
+    the stage ran.
+    :rtype: Dict
+    :raises SystemError: If the command returns a non-zero exit code.
+    :raises PipelineCancelled: If cancelled while the command was running.
+    '''
+
+    start_time = time.time()
+    stdout_file = None
+    process = None
+    try:
+        if stdout_fp is not None:
+            stdout_file = open(str(stdout_fp), 'wb')
+        # close_fds stops other pipelines' pipes leaking into this process
+        process = subprocess.Popen(command, stdout=stdout_file,
+                                   cwd=str(PARSER_DIR), env=env,
+                                   close_fds=True,
+                                   preexec_fn=_process_group(cancellation))
+        if cancellation is not None:
+            cancellation.add(process)
+        return_code, rusage = _wait(process)
+    finally:
+        if stdout_file is not None:
+            stdout_file.close()
+        if cancellation is not None and process is not None:
+            cancellation.discard(process)
+    if cancellation is not None:
+        cancellation.check()
+    if return_code:
+        raise SystemError('The {} stage of the Tweebo pipeline failed with '
+                          'exit code {}. Command: {}'
+                          .format(stage, return_code, ' '.join(command)))
+    return {'stage': stage, 'wall_time': time.time() - start_time,
+            'user_time': rusage.ru_utime, 'system_time': rusage.ru_stime,
+            'max_rss': rusage.ru_maxrss * MAX_RSS_UNIT}
+
+
+def _run_stream(stage_commands, env, cancellation=None):
+    '''
+    Runs the stages at the same time with the standard output of each stage \
+    piped to the standard input of the next.
+
+    :param stage_commands: The (stage, command, stdout file) tuples of the \
+    stages see :py:func:`_stage_commands`. Only the stdout file of the last \
+    stage is used, the output of the other stages is piped.
+    :param env: Environment to run the commands in.
+    :param cancellation: Optional cancellation that kills the commands.
+    :type stage_commands: list[tuple[str, list[str], Path]]
+    :type env: Dict
+    :type cancellation: Cancellation
+    :return: Information about each stage see :py:func:`_run_stage`, where \
+    the wall_time of a stage is the time from when the stages started until \
+    the stage finished.
+    :rtype: list[Dict]
+    :raises SystemError: If any of the commands return a non-zero exit \
+    code. Stages before a failed stage may be killed by SIGPIPE.
+    :raises PipelineCancelled: If cancelled while the commands were running.
+    '''
+
+    start_time = time.time()
+    processes = []
+    stdout_fp = stage_commands[-1][2]
+    try:
+        with open(str(stdout_fp), 'wb') as stdout_file:
+            stage_stdin = None
+            for index, (stage, command, _) in enumerate(stage_commands):
+                stage_stdout = subprocess.PIPE
+                if index == len(stage_commands) - 1:
+                    stage_stdout = stdout_file
+                process = subprocess.Popen(
+                    command, stdin=stage_stdin, stdout=stage_stdout,
+                    cwd=str(PARSER_DIR), env=env, close_fds=True,
+                    preexec_fn=_process_group(cancellation))
+                if cancellation is not None:
+                    cancellation.add(process)
+                # Only the next stage should hold the pipe open so that the
+                # previous stage gets SIGPIPE if the next stage fails.
+                if stage_stdin is not None:
+                    stage_stdin.close()
+                stage_stdin = process.stdout
+                processes.append((stage, command, process))
+        stage_infos = []
+        failures = []
+        # Each stage finishes after the stage before it as it reads the
+        # previous stage's output until it ends.
+        for stage, command, process in processes:
+            return_code, rusage = _wait(process)
+            if return_code:
+                failures.append('{} (exit code {}): {}'
+                                .format(stage, return_code,
+                                        ' '.join(command)))
+            stage_infos.append({'stage': stage,
+                                'wall_time': time.time() - start_time,
+                                'user_time': rusage.ru_utime,
+                                'system_time': rusage.ru_stime,
+                                'max_rss': rusage.ru_maxrss * MAX_RSS_UNIT})
+    finally:
+        for _, _, process in processes:
+            if process.returncode is None:
+                process.kill()
+                _wait(process)
+            if cancellation is not None:
+                cancellation.discard(process)
+    if cancellation is not None:
+        cancellation.check()
+    if failures:
+        raise SystemError('The streaming stages of the Tweebo pipeline '
+                          'failed:\n{}'.format('\n'.join(failures)))
+    return stage_infos
+
+
+def check_fast_parsing_model():
+    '''
+    :return: None
+    :raises IOError: If the `FAST_PARSING_MODEL` has not been trained.
+    '''
+
+    if not FAST_PARSING_MODEL.exists():
+        raise IOError('The fast parsing model {} does not exist, train it '
+                      'with scripts/train_fast_parsing_model.sh'
+                      .format(FAST_PARSING_MODEL))
+
+
+def run_pipeline(input_fp, output_fp, stage_callback=None, profile_dir=None,
+                 profile_run=None, streaming=False, first_stage='tagging',
+                 last_stage='parsing', fast=False, cancellation=None):
+    '''
+    Runs the same pipeline as run.sh on the input file writing the CoNLL \
+    formatted dependency parse to the output file.
+
+    :param input_fp: File containing raw text, one text per line.
+    :param output_fp: File the dependency parse will be written too.
+    :param stage_callback: Optional function that is called after each \
+    stage has finished with the stage information returned by \
+    :py:func:`_run_stage`
+    :param profile_dir: Directory to write profiles of the Python stages \
+    to. If None the `TWEEBO_PROFILE_DIR` environment variable is used and \
+    if that is not set the stages are not profiled. See \
+    :py:mod:`tweebo.profiling`
+    :param profile_run: Name to identify the profiles of this run. If None \
+    a new name is created.
+    :param streaming: Whether to connect the `STREAM_STAGES` by pipes, see \
+    :py:func:`_run_stream`. The stage_callback is called for these stages \
+    once they have all finished.
+    :param first_stage: Stage to start the pipeline from, where input_fp \
+    is the file that the stage reads see `STAGE_INPUTS` e.g. for \
+    `brown_clusters` the tagged Tweets in the CoNLL format written by the \
+    conversion stage.
+    :param last_stage: Stage to stop the pipeline after, where output_fp \
+    is the file that the stage writes see `STAGE_OUTPUTS` e.g. for \
+    `token_selection` the tagged Tweets in the CoNLL format with whether \
+    each token is selected in the last column.
+    :param fast: Whether to skip the ptb_parsing stage and parse with the \
+    `FAST_PARSING_MODEL`, which does not use the PTB posteriors as features.
+    :param cancellation: Optional cancellation to cancel the pipeline from \
+    another thread see :py:class:`Cancellation`
+    :type input_fp: Path
+    :type output_fp: Path
+    :type stage_callback: Callable[[Dict], None]
+    :type profile_dir: str
+    :type profile_run: str
+    :type streaming: bool
+    :type first_stage: str
+    :type last_stage: str
+    :type fast: bool
+    :type cancellation: Cancellation
+    :return: List of the stage information for each stage run see \
+    :py:func:`_run_stage`, with the additional key `bytes_written` which is \
+    the number of bytes the stage wrote to the temporary working directory \
+    and output file. When streaming the bytes written by the streaming \
+    stages are attributed to the last of them.
+    :rtype: list[Dict]
+    :raises SystemError: If any of the stages fail.
+    :raises ValueError: If the pipeline cannot be started from first_stage \
+    or stopped after last_stage see :py:func:`_stage_commands`
+    :raises IOError: If fast and the `FAST_PARSING_MODEL` has not been \
+    trained.
+    :raises PipelineCancelled: If cancelled before the pipeline finished.
+    '''
+
+    if fast and last_stage == 'parsing':
+        check_fast_parsing_model()
+
+    # The parser stages are run from within the parser directory
+    input_fp = Path(str(input_fp)).absolute()
+    output_fp = Path(str(output_fp)).absolute()
+    profile_dir = profiling.get_profile_dir(profile_dir)
+    if profile_dir is not None and profile_run is None:
+        profile_run = profiling.new_run_name()
+    working_dir = Path(tempfile.mkdtemp())
+    try:
+        working_dir.joinpath('test_score').mkdir()
+        env = _stage_env()
+        all_stage_commands = _stage_commands(input_fp, output_fp, working_dir,
+                                             streaming=streaming,
+                                             first_stage=first_stage,
+                                             last_stage=last_stage, fast=fast)
+        stage_commands = []
+        for stage, command, stdout_fp in all_stage_commands[
+                STAGES.index(first_stage):STAGES.index(last_stage) + 1]:
+            if fast and stage == 'ptb_parsing':
+                continue
+            if profile_dir is not None and stage in PYTHON_STAGES:
+                command = profiling.profile_command(profile_dir, profile_run,
+                                                    stage, command)
+            stage_commands.append((stage, command, stdout_fp))
+        stage_infos = []
+        stream_commands = []
+        if streaming:
+            stream_commands = [stage_command
+                               for stage_command in stage_commands
+                               if stage_command[0] in STREAM_STAGES]
+            stage_commands = stage_commands[len(stream_commands):]
+        # Nothing is streamed when the pipeline starts at the parsing stages
+        if stream_commands:
+            if cancellation is not None:
+                cancellation.check()
+            stream_infos = _run_stream(stream_commands, env, cancellation)
+            for stage_info in stream_infos:
+                stage_info['bytes_written'] = 0
+            stream_infos[-1]['bytes_written'] = _disk_usage([working_dir])
+            stage_infos.extend(stream_infos)
+            if stage_callback is not None:
+                for stage_info in stream_infos:
+                    stage_callback(stage_info)
+        for stage, command, stdout_fp in stage_commands:
+            if cancellation is not None:
+                cancellation.check()
+            disk_usage = _disk_usage([working_dir, output_fp])
+            stage_info = _run_stage(stage, command, stdout_fp, env,
+                                    cancellation)
+            stage_info['bytes_written'] = _disk_usage([working_dir,
+                                                       output_fp]) - disk_usage
+            stage_infos.append(stage_info)
+            if stage_callback is not None:
+                stage_callback(stage_info)
+        return stage_infos
+    finally:
+        shutil.rmtree(str(working_dir))
@@ -1,37 +1,250 @@
 '''
-Python API to the TweeboParser. Module only caontains one function:
+Python API to the TweeboParser. The main function is:
 1. process_texts - Given a list of texts will process each text through \
 TweeboParser and return a list of the same size in two different output \
 formats: 1. CoNLL and 2. Stanford.
+
+process_texts writes the texts to a temporary file and runs the stages of \
+:py:mod:`tweebo.stages` on it, and can also:
+1. Shard the texts (`n_jobs`), running a pipeline on each shard in \
+parallel and merging the outputs in order see :py:func:`_process_shards`
+2. Isolate the texts the pipeline fails on (`isolate_errors`), running a \
+probe text first and then bisecting the batch see \
+:py:func:`_process_isolating` and :py:func:`_process_bisecting`
+3. Take Tweets that have already been tokenized and POS tagged \
+(`input_format` of `tagged` or `conll`), which skips the tagger see \
+:py:func:`_tagged_tokens`
+4. Stop after an earlier stage (`until`), parse in a single pass \
+(`fast`), and be cancelled or time out (`cancellation`, `timeout` and \
+`deadline`).
+5. Return a report of the time and resources each stage used \
+(`timing_report`) see :py:func:`_timing_report`, and profile the Python \
+stages (`profile_dir`) see :py:mod:`tweebo.profiling`
 '''
 
+from multiprocessing.pool import ThreadPool
+import multiprocessing
 from pathlib import Path
 import tempfile
 from traceback import format_exc
 import shutil
-import subprocess
+import time
+
+import profiling
+from stages import STAGES, Cancellation, PipelineCancelled, run_pipeline
+from stages import check_fast_parsing_model
+
+INPUT_FORMATS = ['text', 'tagged', 'conll']
+# Stages the pipeline can be stopped after, tagging also tokenizes the text.
+UNTIL_STAGES = ['tagging', 'token_selection', 'parsing']
+# A text of each input_format that the pipeline can always process, used to
+# tell whether a failing batch has bad texts or the pipeline cannot run.
+PROBE_TEXTS = {'text': u'Hello world',
+               'tagged': [(u'Hello', u'!'), (u'world', u'N')],
+               'conll': u'Hello\t!\nworld\tN'}
+
+
+def _stage_output_to_parse(stage_fp, stage, result_fp):
+    '''
+    Writes the output of a stage before parsing in the CoNLL format that \
+    the parser writes, so that it can be read by :py:func:`_to_conll` and \
+    :py:func:`_to_stanford`. The HEAD of each token is `_` as it is not \
+    known, except for tokens that token selection did not select which have \
+    a HEAD of -1 as they do in the parse.
+
+    :param stage_fp: File the stage wrote.
+    :param stage: Either `tagging` or `token_selection`
+    :param result_fp: File to write the CoNLL output to.
+    :type stage_fp: Path
+    :type stage: str
+    :type result_fp: Path
+    :return: None
+    '''
+
+    with stage_fp.open('r', encoding='utf-8') as stage_file, \
+            result_fp.open('w', encoding='utf-8') as result_file:
+        index = 0
+        for line in stage_file:
+            columns = line.strip().split(u'\t')
+            if columns == [u'']:
+                result_file.write(u'\n')
+                index = 0
+                continue
+            index += 1
+            head = u'_'
+            if stage == 'tagging':
+                # token, tag and confidence
+                token, tag = columns[0], columns[1]
+            else:
+                # The converted CoNLL columns followed by the Brown Clusters
+                # and whether the token is selected.
+                token, tag = columns[1], columns[3]
+                if columns[-1] == u'0':
+                    head = u'-1'
+            result_file.write(u'{}\t{}\t_\t{}\t{}\t_\t{}\t_\n'
+                              .format(index, token, tag, tag, head))
+
+
+def _read_tweets(file_path):
+    '''
+    :param file_path: CoNLL formatted file where each Tweet is seperated by \
+    an empty line.
+    :type file_path: Path
+    :return: A generator of the Tweets in the file, each a list of the \
+    columns of each line.
+    :rtype: Iterator[list[list[unicode]]]
+    '''
+
+    tweet = []
+    with file_path.open('r', encoding='utf-8') as conll_file:
+        for line in conll_file:
+            line = line.strip()
+            if not line:
+                if tweet:
+                    yield tweet
+                tweet = []
+                continue
+            tweet.append(line.split(u'\t'))
+    if tweet:
+        yield tweet
+
+
+def _split_trivial(selection_fp, parse_fp):
+    '''
+    Finds the trivial Tweets, those where token selection did not select any \
+    token e.g. Tweets of only hashtags, URLs, mentions and emoticons. The \
+    parser gives every token of these Tweets a HEAD of -1, so they do not \
+    need to be parsed.
+
+    :param selection_fp: Output of the token_selection stage.
+    :param parse_fp: File to write the Tweets that need parsing to, in the \
+    same format.
+    :type selection_fp: Path
+    :type parse_fp: Path
+    :return: For each Tweet in order, None if it needs parsing else the \
+    lines the parser would have written for it.
+    :rtype: list[list[unicode] or None]
+    '''
+
+    trivial_parses = []
+    with parse_fp.open('w', encoding='utf-8') as parse_file:
+        for tweet in _read_tweets(selection_fp):
+            # The last column is whether the token is selected
+            if any(columns[-1] != u'0' for columns in tweet):
+                for columns in tweet:
+                    parse_file.write(u'{}\n'.format(u'\t'.join(columns)))
+                parse_file.write(u'\n')
+                trivial_parses.append(None)
+            else:
+                trivial_parses.append([u'\t'.join(columns[:6] + [u'-1', u'_'])
+                                       for columns in tweet])
+    return trivial_parses
+
+
+def _merge_parses(trivial_parses, parsed_fp, result_fp):
+    '''
+    Writes the parses of the trivial Tweets and of the Tweets that were \
+    parsed to the result file in the original order.
+
+    :param trivial_parses: Output of :py:func:`_split_trivial`
+    :param parsed_fp: Parser output of the Tweets that were not trivial, \
+    it does not need to exist if every Tweet was trivial.
+    :param result_fp: File to write all of the parses to.
+    :type trivial_parses: list[list[unicode] or None]
+    :type parsed_fp: Path
+    :type result_fp: Path
+    :return: None
+    '''
 
-EMPTY_TOKEN = u'$$$EMPTY$$$'
+    parsed_tweets = iter([])
+    if any(lines is None for lines in trivial_parses):
+        parsed_tweets = _read_tweets(parsed_fp)
+    with result_fp.open('w', encoding='utf-8') as result_file:
+        for lines in trivial_parses:
+            if lines is None:
+                lines = [u'\t'.join(columns)
+                         for columns in next(parsed_tweets)]
+            for line in lines:
+                result_file.write(u'{}\n'.format(line))
+            result_file.write(u'\n')
 
 
-def _process_file(process_fp):
+def _process_file(process_fp, stage_callback=None, profile_dir=None,
+                  profile_run=None, first_stage='tagging',
+                  last_stage='parsing', fast=False, cancellation=None):
     '''
+    Runs the same pipeline as the run.sh script on the file, the result of \
+    which is written to the same file path with `.predict` appended. If \
+    last_stage is not `parsing` the result is the output of the last stage \
+    see :py:func:`_stage_output_to_parse`
+
+    The pipeline is run until token selection after which only the Tweets \
+    that are not trivial are parsed see :py:func:`_split_trivial`
+
     :param process_fp: File to run through the dependency parser.
+    :param stage_callback: Optional function that is called after each \
+    stage of the pipeline with information about the stage see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :param profile_dir: Directory to write profiles of the Python stages to \
+    see :py:func:`tweebo.stages.run_pipeline`
+    :param profile_run: Name to identify the profiles of this run.
+    :param first_stage: Stage to start the pipeline from see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :param last_stage: Stage to stop the pipeline after, one of \
+    `UNTIL_STAGES`
+    :param fast: Whether to parse in a single pass see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :param cancellation: Optional cancellation of the pipeline see \
+    :py:class:`tweebo.stages.Cancellation`
     :type process_fp: Path
-    :return: None
-    :raises SystemError: If the dependency parser run.sh script fails.
+    :type stage_callback: Callable[[Dict], None]
+    :type profile_dir: str
+    :type profile_run: str
+    :type first_stage: str
+    :type last_stage: str
+    :type fast: bool
+    :type cancellation: tweebo.stages.Cancellation
+    :return: Information about each stage of the pipeline see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :rtype: list[Dict]
+    :raises SystemError: If any stage of the dependency parser pipeline fails.
+    :raises PipelineCancelled: If the pipeline was cancelled.
     '''
 
-    this_dir = Path(__file__).absolute().parent.resolve()
-    run_file = this_dir.joinpath('..', 'run.sh').resolve()
+    result_fp = Path('{}.predict'.format(process_fp))
+    # The stages before parsing are run first
+    pre_parse_stage = last_stage
+    if last_stage == 'parsing':
+        pre_parse_stage = 'token_selection'
+    stage_fp = Path('{}.{}'.format(process_fp, pre_parse_stage))
     try:
-        sub_process_params = ['bash', str(run_file),
-                              str(process_fp)]
-        if subprocess.call(sub_process_params):
-            raise SystemError('Could not run the Tweebo run script')
-
+        stage_infos = run_pipeline(process_fp, stage_fp,
+                                   stage_callback=stage_callback,
+                                   profile_dir=profile_dir,
+                                   profile_run=profile_run,
+                                   first_stage=first_stage,
+                                   last_stage=pre_parse_stage,
+                                   cancellation=cancellation)
+        if last_stage != 'parsing':
+            _stage_output_to_parse(stage_fp, last_stage, result_fp)
+            return stage_infos
+        parse_fp = Path('{}.parse'.format(process_fp))
+        parsed_fp = Path('{}.parsed'.format(process_fp))
+        trivial_parses = _split_trivial(stage_fp, parse_fp)
+        if any(lines is None for lines in trivial_parses):
+            stage_infos.extend(run_pipeline(parse_fp, parsed_fp,
+                                            stage_callback=stage_callback,
+                                            profile_dir=profile_dir,
+                                            profile_run=profile_run,
+                                            first_stage='ptb_parsing',
+                                            fast=fast,
+                                            cancellation=cancellation))
+        _merge_parses(trivial_parses, parsed_fp, result_fp)
+        return stage_infos
+    except PipelineCancelled:
+        raise
     except Exception as e:
-        raise SystemError('Error {} during running the Tweebo run script, '
+        raise SystemError('Error {} during running the Tweebo pipeline, '
                           'Stack Trace:\n {}'.format(repr(e), format_exc()))
 
 
@@ -42,7 +255,8 @@ def _to_conll(result_fp):
     dependency data. Where each tweet is seprated by a line.
     :type result_fp: Path
     :return: A list of Strings where each String is each Tweets CoNLL \
-    output. If the Tweet was empty e.g. `` then `` will be returned.
+    output. Empty Tweets are not in the file, :py:func:`process_texts` \
+    adds their output back.
     :rtype: list[str]
     '''
     conll_strings = []
@@ -55,20 +269,11 @@ def _to_conll(result_fp):
             if last_line == '' and line == '':
                 continue
             elif line == '':
-                # If empty sentence then add empty String
-                if conll_string == [EMPTY_TOKEN]:
-                    conll_strings.append('')
-                else:
-                    conll_strings.append('\n'.join(conll_string))
+                conll_strings.append('\n'.join(conll_string))
                 conll_string = []
             else:
-                line_data = line.split('\t')
-                token_text = line_data[1].strip()
-                if token_text == EMPTY_TOKEN:
-                    conll_string.append(EMPTY_TOKEN)
-                else:
-                    line += '\t_\t_'
-                    conll_string.append(line)
+                line += '\t_\t_'
+                conll_string.append(line)
             last_line = line
         return conll_strings
 
@@ -101,7 +306,8 @@ def _to_stanford(result_fp):
     set is a Twitter specific one of which the tagset is explained in \
     the following `paper \
     <http://www.cs.cmu.edu/~ark/TweetNLP/gimpel+etal.acl11.pdf>`_.\
-    The list will contain empty dicts if the string was empty e.g. ` `.\
+    Empty Tweets are not in the file, :py:func:`process_texts` adds their \
+    output back.\
     This dictionary structure is based off the output that you will recive \
     from the Stanford Dependency Parse through the Python API when using the \
     json response. Stanford Python link \
@@ -148,24 +354,19 @@ def _to_stanford(result_fp):
             if last_line == '' and line == '':
                 continue
             elif line == '':
-                # If empty sentence then add an empty list
-                if basic_dependencies == [EMPTY_TOKEN]:
-                    tweet_data['basicDependencies'] = []
-                    tweet_data['tokens'] = []
-                else:
-                    # Need to add token data into the dependency inforamtion
-                    temp_basic_dependencies = []
-                    for dependecy_info in basic_dependencies:
-                        gov_word = index_2_word(dependecy_info['governor'],
-                                                tokens)
-                        dep_word = index_2_word(dependecy_info['dependent'],
-                                                tokens)
-                        dependecy_info['governorGloss'] = gov_word
-                        dependecy_info['dependentGloss'] = dep_word
-                        temp_basic_dependencies.append(dependecy_info)
-                    basic_dependencies = temp_basic_dependencies
-                    tweet_data['basicDependencies'] = basic_dependencies
-                    tweet_data['tokens'] = tokens
+                # Need to add token data into the dependency inforamtion
+                temp_basic_dependencies = []
+                for dependecy_info in basic_dependencies:
+                    gov_word = index_2_word(dependecy_info['governor'],
+                                            tokens)
+                    dep_word = index_2_word(dependecy_info['dependent'],
+                                            tokens)
+                    dependecy_info['governorGloss'] = gov_word
+                    dependecy_info['dependentGloss'] = dep_word
+                    temp_basic_dependencies.append(dependecy_info)
+                basic_dependencies = temp_basic_dependencies
+                tweet_data['basicDependencies'] = basic_dependencies
+                tweet_data['tokens'] = tokens
                 tweet_data['index'] = index
                 tweets.append(tweet_data)
                 index += 1
@@ -175,17 +376,16 @@ def _to_stanford(result_fp):
             else:
                 line = line.split('\t')
                 token_text = line[1].strip()
-                if token_text == EMPTY_TOKEN:
-                    basic_dependencies.append(EMPTY_TOKEN)
-                    tokens.append(EMPTY_TOKEN)
-                else:
-                    token_info = {}
-                    token_info['index'] = int(line[0])
-                    token_info['word'] = token_text
-                    token_info['originalText'] = token_text
-                    token_info['pos'] = line[4]
-                    tokens.append(token_info)
+                token_info = {}
+                token_info['index'] = int(line[0])
+                token_info['word'] = token_text
+                token_info['originalText'] = token_text
+                token_info['pos'] = line[4]
+                tokens.append(token_info)
 
+                # HEAD is not known when the pipeline is stopped before
+                # parsing.
+                if line[6] != '_':
                     dependecy_info = {}
                     relation = line[7]
                     dependecy_info['governor'] = int(line[6])
@@ -193,28 +393,600 @@ def _to_stanford(result_fp):
                     if dependecy_info['governor'] == 0:
                         relation = 'ROOT'
                     dependecy_info['dep'] = relation
-                    if token_text == EMPTY_TOKEN:
-                        basic_dependencies.append(EMPTY_TOKEN)
-                    else:
-                        basic_dependencies.append(dependecy_info)
+                    basic_dependencies.append(dependecy_info)
             last_line = line
         return tweets
 
 
-def process_texts(texts, output_type='conll'):
+def _count_tokens(processed_texts, output_type):
+    '''
+    :param processed_texts: Output of :py:func:`process_texts`
+    :param output_type: Either `stanford` or `conll`
+    :type processed_texts: list[Dict] or list[str]
+    :type output_type: str
+    :return: Number of tokens in the processed texts.
+    :rtype: int
+    '''
+
+    if output_type == 'stanford':
+        return sum(len(tweet['tokens']) for tweet in processed_texts)
+    return sum(len(tweet.splitlines()) for tweet in processed_texts)
+
+
+def _timing_report(stage_infos, processed_texts, output_type, start_time,
+                   input_bytes):
+    '''
+    :param stage_infos: Information about each stage of the pipeline see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :param processed_texts: Output of :py:func:`process_texts`
+    :param output_type: Either `stanford` or `conll`
+    :param start_time: Time that :py:func:`process_texts` was called.
+    :param input_bytes: Size in bytes of the file the texts were written to.
+    :type stage_infos: list[Dict]
+    :type processed_texts: list[Dict] or list[str]
+    :type output_type: str
+    :type start_time: float
+    :type input_bytes: int
+    :return: A dictionary containing the following keys:
+    1. tweets - Number of Tweets/texts processed.
+    2. tokens - Number of tokens in the processed Tweets.
+    3. wall_time - Wall clock time in seconds to process the Tweets.
+    4. user_time - CPU time in seconds spent in user mode by all stages.
+    5. system_time - CPU time in seconds spent in kernel mode by all stages.
+    6. max_rss - Peak resident set size in bytes of the largest process \
+    any stage ran.
+    7. bytes_written - Bytes written to temporary files, including the \
+    texts and the parse.
+    8. stages - List of information about each stage of the pipeline see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :rtype: Dict
+    '''
+
+    return {'tweets': len(processed_texts),
+            'tokens': _count_tokens(processed_texts, output_type),
+            'wall_time': time.time() - start_time,
+            'user_time': sum(info['user_time'] for info in stage_infos),
+            'system_time': sum(info['system_time'] for info in stage_infos),
+            'max_rss': max([info['max_rss'] for info in stage_infos] or
+                           [0]),
+            'bytes_written': input_bytes + sum(info['bytes_written']
+                                               for info in stage_infos),
+            'stages': stage_infos}
+
+
+def _num_shards(n_jobs, num_texts):
+    '''
+    :param n_jobs: Number of shards to run in parallel. -1 means one per CPU.
+    :param num_texts: Number of texts to be processed.
+    :type n_jobs: int
+    :type num_texts: int
+    :return: Number of shards to split the texts into, never more than the \
+    number of texts.
+    :rtype: int
+    :raises ValueError: If n_jobs is not a positive integer or -1
+    '''
+
+    if not isinstance(n_jobs, int) or (n_jobs < 1 and n_jobs != -1):
+        raise ValueError('n_jobs has to be a positive integer or -1 not {}'
+                         .format(n_jobs))
+    if n_jobs == -1:
+        n_jobs = multiprocessing.cpu_count()
+    return max(1, min(n_jobs, num_texts))
+
+
+def _shard_bounds(num_texts, num_shards):
     '''
-    :param texts: List of Strings that to dependency parse with Tweebo
+    :param num_texts: Number of texts to be processed.
+    :param num_shards: Number of shards to split the texts into.
+    :type num_texts: int
+    :type num_shards: int
+    :return: A list of (start, end) index tuples one for each shard, where \
+    the shards are contiguous, in input order and differ in size by at most \
+    one text.
+    :rtype: list[tuple[int, int]]
+    '''
+
+    shard_size, remainder = divmod(num_texts, num_shards)
+    bounds = []
+    start = 0
+    for shard_index in range(num_shards):
+        end = start + shard_size + (1 if shard_index < remainder else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _write_texts(texts, text_fp):
+    '''
+    Writes the texts to the file one text per line.
+
+    :param texts: Texts to write, which are not empty see \
+    :py:func:`_is_empty` as the tagger would not output a Tweet for them.
+    :param text_fp: File to write the texts to.
+    :type texts: list[str]
+    :type text_fp: Path
+    :return: None
+    :raises TypeError: If the texts are not Strings or unicode Strings.
+    '''
+
+    with text_fp.open('w', encoding='utf-8') as text_file:
+        for index, text in enumerate(texts):
+            if isinstance(text, str):
+                text = text.decode('utf-8')
+            elif not isinstance(text, unicode):
+                raise TypeError('The Strings in text must be of '
+                                'str or unicode not {}'
+                                .format(type(text)))
+            text_file.write(text.strip())
+            if index != (len(texts) - 1):
+                text_file.write(u'\n')
+
+
+def _tagged_tokens(text, input_format):
+    '''
+    :param text: A tagged Tweet, for the `tagged` input_format a list of \
+    (token, POS tag) pairs and for `conll` a String of one token per line \
+    where each line is either the output of the ark Twitter POS tagger \
+    (`token<TAB>tag<TAB>confidence`), `token<TAB>tag` or CoNLL-X where the \
+    token and POS tag are the 2nd and 4th columns.
+    :param input_format: Either `tagged` or `conll`
+    :type text: list[tuple[str, str]] or str
+    :type input_format: str
+    :return: The (token, POS tag) pairs of the Tweet as unicode Strings.
+    :rtype: list[tuple[unicode, unicode]]
+    :raises TypeError: If the text is not of the type the input_format \
+    expects.
+    :raises ValueError: If a token or tag is empty or contains a tab or new \
+    line, or a CoNLL line does not have 2, 3 or at least 6 columns.
+    '''
+
+    def to_unicode(value):
+        if isinstance(value, str):
+            return value.decode('utf-8')
+        elif not isinstance(value, unicode):
+            raise TypeError('Tokens and tags must be of str or unicode not {}'
+                            .format(type(value)))
+        return value
+
+    if input_format == 'conll':
+        if not isinstance(text, (str, unicode)):
+            raise TypeError('The CoNLL Strings in text must be of str or '
+                            'unicode not {}'.format(type(text)))
+        pairs = []
+        for line in to_unicode(text).strip().splitlines():
+            columns = line.strip().split(u'\t')
+            if len(columns) in [2, 3]:
+                pairs.append((columns[0], columns[1]))
+            elif len(columns) >= 6:
+                pairs.append((columns[1], columns[3]))
+            else:
+                raise ValueError('Expected CoNLL lines with 2, 3 or at least '
+                                 '6 tab separated columns not: {}'
+                                 .format(line))
+    else:
+        if not isinstance(text, (list, tuple)):
+            raise TypeError('The tagged texts must be lists of (token, tag) '
+                            'pairs not {}'.format(type(text)))
+        pairs = text
+    tagged_tokens = []
+    for pair in pairs:
+        if len(pair) != 2:
+            raise ValueError('Expected a (token, tag) pair not {}'
+                             .format(pair))
+        token, tag = [to_unicode(value).strip() for value in pair]
+        for value in [token, tag]:
+            if not value or any(char in value for char in u'\t\r\n'):
+                raise ValueError('Tokens and tags cannot be empty or contain '
+                                 'tabs or new lines: {}'.format(pair))
+        tagged_tokens.append((token, tag))
+    return tagged_tokens
+
+
+def _is_empty(text, input_format):
+    '''
+    :param text: A text or tagged Tweet see :py:func:`process_texts`
+    :param input_format: One of `INPUT_FORMATS`
+    :type text: str or list
+    :type input_format: str
+    :return: True if the text contains no tokens. Texts of the wrong type \
+    are not empty so that the error is raised when they are written.
+    :rtype: bool
+    '''
+
+    if isinstance(text, (str, unicode)):
+        return not text.strip()
+    if input_format == 'tagged' and isinstance(text, (list, tuple)):
+        return not text
+    return False
+
+
+def _write_tagged(texts, input_format, text_fp):
+    '''
+    Writes the tagged texts to the file in the CoNLL format that the \
+    conversion stage of the pipeline writes, so that the pipeline can be \
+    started from the `brown_clusters` stage.
+
+    :param texts: Tagged Tweets that are not empty see \
+    :py:func:`_tagged_tokens` and :py:func:`_is_empty`
+    :param input_format: Either `tagged` or `conll`
+    :param text_fp: File to write the tagged texts to.
+    :type texts: list
+    :type input_format: str
+    :type text_fp: Path
+    :return: None
+    :raises TypeError: See :py:func:`_tagged_tokens`
+    :raises ValueError: See :py:func:`_tagged_tokens`
+    '''
+
+    with text_fp.open('w', encoding='utf-8') as text_file:
+        for text in texts:
+            tagged_tokens = _tagged_tokens(text, input_format)
+            for index, (token, tag) in enumerate(tagged_tokens, 1):
+                text_file.write(u'{}\t{}\t_\t{}\t{}\t_\t0\t_\t_\t_\n'
+                                .format(index, token, tag, tag))
+            text_file.write(u'\n')
+
+
+def _process_shards(text_fps, shard_bounds, stage_callback=None,
+                    profile_dir=None, profile_runs=None,
+                    first_stage='tagging', last_stage='parsing',
+                    fast=False, cancellation=None):
+    '''
+    Runs the pipeline on each shard in parallel, each shard in its own \
+    working directory see :py:func:`_process_file`
+
+    :param text_fps: The text file of each shard.
+    :param shard_bounds: The (start, end) index of the texts in each shard \
+    see :py:func:`_shard_bounds`
+    :param stage_callback: Optional function that is called after each \
+    stage of each shard, it is called from a different thread for each \
+    shard.
+    :param profile_dir: Directory to write profiles of the Python stages to.
+    :param profile_runs: Name to identify the profiles of each shard.
+    :param first_stage: Stage to start the pipeline from.
+    :param last_stage: Stage to stop the pipeline after.
+    :param fast: Whether to parse in a single pass.
+    :param cancellation: Optional cancellation of the pipelines of every \
+    shard.
+    :type text_fps: list[Path]
+    :type shard_bounds: list[tuple[int, int]]
+    :type stage_callback: Callable[[Dict], None]
+    :type profile_dir: str
+    :type profile_runs: list[str]
+    :type first_stage: str
+    :type last_stage: str
+    :type fast: bool
+    :type cancellation: tweebo.stages.Cancellation
+    :return: Information about each stage of each shard see \
+    :py:func:`tweebo.stages.run_pipeline`, with the additional key `shard` \
+    which is the index of the shard.
+    :rtype: list[Dict]
+    :raises SystemError: If the pipeline fails on any shard, the error \
+    states which shards failed and the texts within those shards.
+    :raises PipelineCancelled: If the pipelines were cancelled.
+    '''
+
+    def process_shard(shard_index):
+        shard_run = None
+        if profile_runs is not None:
+            shard_run = profile_runs[shard_index]
+        try:
+            stage_infos = _process_file(text_fps[shard_index],
+                                        stage_callback=stage_callback,
+                                        profile_dir=profile_dir,
+                                        profile_run=shard_run,
+                                        first_stage=first_stage,
+                                        last_stage=last_stage, fast=fast,
+                                        cancellation=cancellation)
+        except Exception as error:
+            return None, error
+        for stage_info in stage_infos:
+            stage_info['shard'] = shard_index
+        return stage_infos, None
+
+    # The pipeline runs in child processes so threads are enough to run the
+    # shards in parallel.
+    pool = ThreadPool(len(text_fps))
+    try:
+        shard_results = pool.map(process_shard, range(len(text_fps)))
+    finally:
+        pool.close()
+        pool.join()
+    if cancellation is not None:
+        cancellation.check()
+    errors = ['Shard {} (texts {} to {}): {}'.format(shard_index, start,
+                                                     end - 1, error)
+              for shard_index, ((_, error), (start, end))
+              in enumerate(zip(shard_results, shard_bounds))
+              if error is not None]
+    if errors:
+        raise SystemError('The Tweebo pipeline failed on {} of {} shards:\n'
+                          '{}'.format(len(errors), len(text_fps),
+                                      '\n'.join(errors)))
+    return [stage_info for stage_infos, _ in shard_results
+            for stage_info in stage_infos]
+
+
+def _process_batch(texts, output_type, stage_callback, profile_dir, n_jobs,
+                   input_format, first_stage, until, fast, cancellation):
+    '''
+    Runs the pipeline once on the texts, the arguments have been validated \
+    by :py:func:`process_texts`
+
+    :param first_stage: Stage the pipeline starts from for the input_format.
+    :return: A tuple of: 1. The output of each text see \
+    :py:func:`process_texts`, where the Stanford index is the index within \
+    the shard, 2. information about each stage of the pipeline see \
+    :py:func:`tweebo.stages.run_pipeline`, 3. size in bytes of the files \
+    the texts were written to.
+    :rtype: tuple[list, list[Dict], int]
+    :raises SystemError: If the pipeline fails.
+    :raises PipelineCancelled: If the pipeline was cancelled.
+    '''
+
+    # Empty texts are not run through the pipeline, their output is added
+    # back in order once the other texts have been processed.
+    parse_indexes = [index for index, text in enumerate(texts)
+                     if not _is_empty(text, input_format)]
+    parse_texts = [texts[index] for index in parse_indexes]
+    num_shards = _num_shards(n_jobs, len(parse_texts))
+    profile_dir = profiling.get_profile_dir(profile_dir)
+    profile_runs = None
+    if profile_dir is not None:
+        profile_run = profiling.new_run_name()
+        profile_runs = [profile_run]
+        if num_shards > 1:
+            profile_runs = ['{}.shard{}'.format(profile_run, shard_index)
+                            for shard_index in range(num_shards)]
+    temp_dir_fp = tempfile.mkdtemp()
+    # The files of a pipeline that was cancelled or timed out are removed
+    # as well
+    try:
+        shard_bounds = _shard_bounds(len(parse_texts), num_shards)
+        text_fps = []
+        stage_infos = []
+        for shard_index, (start, end) in enumerate(shard_bounds):
+            if not parse_texts:
+                break
+            text_fp = Path(temp_dir_fp, 'text_file.txt')
+            if num_shards > 1:
+                text_fp = Path(temp_dir_fp,
+                               'text_file_{}.txt'.format(shard_index))
+            # Add the data to the text file
+            if input_format == 'text':
+                _write_texts(parse_texts[start:end], text_fp)
+            else:
+                _write_tagged(parse_texts[start:end], input_format, text_fp)
+            text_fps.append(text_fp)
+        if len(text_fps) == 1:
+            stage_infos = _process_file(
+                text_fps[0], stage_callback=stage_callback,
+                profile_dir=profile_dir,
+                profile_run=None if profile_runs is None else profile_runs[0],
+                first_stage=first_stage, last_stage=until, fast=fast,
+                cancellation=cancellation)
+        elif text_fps:
+            # The bounds of each shard within the original texts
+            text_bounds = [(parse_indexes[start], parse_indexes[end - 1] + 1)
+                           for start, end in shard_bounds]
+            stage_infos = _process_shards(text_fps, text_bounds,
+                                          stage_callback=stage_callback,
+                                          profile_dir=profile_dir,
+                                          profile_runs=profile_runs,
+                                          first_stage=first_stage,
+                                          last_stage=until, fast=fast,
+                                          cancellation=cancellation)
+        to_output = _to_stanford if output_type == 'stanford' else _to_conll
+        parsed_texts = []
+        for shard_index, text_fp in enumerate(text_fps):
+            result_fp = Path('{}.predict'.format(text_fp))
+            if profile_dir is not None:
+                shard_output = profiling.profile_call(
+                    profile_dir, profile_runs[shard_index],
+                    'to_{}'.format(output_type), to_output, result_fp)
+            else:
+                shard_output = to_output(result_fp)
+            parsed_texts.extend(shard_output)
+        processed_texts = ['' if output_type == 'conll'
+                           else {'basicDependencies': [], 'tokens': []}
+                           for _ in texts]
+        for index, tweet_output in zip(parse_indexes, parsed_texts):
+            processed_texts[index] = tweet_output
+        input_bytes = sum(text_fp.stat().st_size for text_fp in text_fps)
+        return processed_texts, stage_infos, input_bytes
+    finally:
+        shutil.rmtree(temp_dir_fp, ignore_errors=True)
+
+
+def _process_isolating(texts, error_callback, batch_options):
+    '''
+    Runs the pipeline on the texts and when it fails runs it on one of the \
+    `PROBE_TEXTS`. If the probe also fails the pipeline cannot run at all, \
+    e.g. java or a model is missing, so the error of the texts is raised \
+    rather than bisecting them see :py:func:`_process_bisecting`, which \
+    would run the pipeline about twice for every text and report every \
+    text as failing.
+
+    :param texts: Texts to process see :py:func:`process_texts`
+    :param error_callback: Optional function called for each text that \
+    fails on its own see :py:func:`process_texts`
+    :param batch_options: Keyword arguments to :py:func:`_process_batch`
+    :type texts: list
+    :type error_callback: Callable[[Dict], None]
+    :type batch_options: Dict
+    :return: See :py:func:`_process_bisecting`
+    :rtype: tuple[list, int]
+    :raises SystemError: If both the texts and the probe fail.
+    :raises PipelineCancelled: If the pipeline was cancelled.
+    '''
+
+    try:
+        processed_texts, _, input_bytes = _process_batch(texts,
+                                                         **batch_options)
+        return processed_texts, input_bytes
+    except SystemError as error:
+        texts_error = error
+    probe_text = PROBE_TEXTS[batch_options['input_format']]
+    try:
+        _process_batch([probe_text], **batch_options)
+    except SystemError:
+        raise texts_error
+    return _process_bisecting(texts, 0, error_callback, batch_options,
+                              texts_error)
+
+
+def _process_bisecting(texts, offset, error_callback, batch_options,
+                       error=None):
+    '''
+    Runs the pipeline on the texts and when it fails splits the texts in \
+    half and runs each half again, until the texts that fail on their own \
+    are found, so that one text that breaks the tagger or parser does not \
+    lose the output of every other text.
+
+    :param texts: Texts to process see :py:func:`process_texts`
+    :param offset: Index of the first text within the texts given to \
+    :py:func:`process_texts`
+    :param error_callback: Optional function called for each text that \
+    fails on its own see :py:func:`process_texts`
+    :param batch_options: Keyword arguments to :py:func:`_process_batch`
+    :param error: The error the pipeline already failed with on the texts, \
+    if None the pipeline is run on the texts first.
+    :type texts: list
+    :type offset: int
+    :type error_callback: Callable[[Dict], None]
+    :type batch_options: Dict
+    :type error: SystemError
+    :return: A tuple of: 1. The output of each text, None for the texts \
+    that failed, 2. size in bytes of the files the texts that did not fail \
+    were written to.
+    :rtype: tuple[list, int]
+    :raises PipelineCancelled: If the pipeline was cancelled.
+    '''
+
+    if error is None:
+        try:
+            processed_texts, _, input_bytes = _process_batch(texts,
+                                                             **batch_options)
+            return processed_texts, input_bytes
+        except SystemError as batch_error:
+            error = batch_error
+    if len(texts) == 1:
+        if error_callback is not None:
+            error_callback({'index': offset, 'text': texts[0],
+                            'error': str(error)})
+        return [None], 0
+    middle = len(texts) // 2
+    first_texts, first_bytes = _process_bisecting(texts[:middle], offset,
+                                                  error_callback,
+                                                  batch_options)
+    last_texts, last_bytes = _process_bisecting(texts[middle:],
+                                                offset + middle,
+                                                error_callback, batch_options)
+    return first_texts + last_texts, first_bytes + last_bytes
+
+
+def process_texts(texts, output_type='conll', stage_callback=None,
+                  timing_report=False, profile_dir=None, n_jobs=1,
+                  input_format='text', until='parsing', fast=False,
+                  cancellation=None, isolate_errors=False,
+                  error_callback=None, timeout=None, deadline=None):
+    '''
+    :param texts: List of Strings that to dependency parse with Tweebo, or \
+    if the input_format is not `text` a list of tagged Tweets.
     :param output_type: String specifying the output type. Either `stanford` \
     or `conll`.
+    :param stage_callback: Optional function that is called after each \
+    stage of the pipeline with information about the stage see \
+    :py:func:`tweebo.stages.run_pipeline`
+    :param timing_report: Whether to also return a report of the time and \
+    resources (CPU, memory and disk) each stage of the pipeline used and the \
+    number of Tweets and tokens processed.
+    :param profile_dir: Directory to write cProfile and tracemalloc \
+    profiles of the Python stages of the pipeline to. If None the \
+    `TWEEBO_PROFILE_DIR` environment variable is used and if that is not \
+    set nothing is profiled. See :py:mod:`tweebo.profiling`
+    :param n_jobs: Number of shards to split the texts into, where the \
+    pipeline is run on each shard in parallel. -1 uses one shard per CPU. \
+    Each shard runs its own tagger and parser processes, so peak memory \
+    grows with the number of shards. When greater than 1 the stage \
+    information of each stage also contains the `shard` index.
+    :param input_format: Either `text`, raw text that is tokenized and \
+    POS tagged, or Tweets that have already been tokenized and tagged with \
+    the ark Twitter POS tagger tagset, which skips the tagging and \
+    conversion stages: `tagged` where each Tweet is a list of (token, \
+    POS tag) pairs, or `conll` where each Tweet is a CoNLL String see \
+    :py:func:`_tagged_tokens`
+    :param until: Stage to stop the pipeline after, one of `UNTIL_STAGES`. \
+    `tagging` only tokenizes and POS tags the texts, `token_selection` also \
+    finds the tokens that are not part of the dependency tree, which have a \
+    HEAD of -1, and `parsing` runs the whole pipeline. When stopped before \
+    parsing the output is in the same format but the HEAD and relation of \
+    the tokens that are not known are `_` and for `stanford` only the \
+    tokens that were not selected have basicDependencies.
+    :param fast: Experimental. Whether to parse in a single pass with a \
+    model that does not use the posteriors of the PTB model as features, \
+    which skips the PTB parse for an unmeasured loss in accuracy see \
+    :py:mod:`tweebo.evaluate`. Requires the fast parsing model to have been \
+    trained see :py:mod:`tweebo.stages`
+    :param cancellation: Optional cancellation to cancel the pipeline from \
+    another thread, which kills the processes of the pipeline see \
+    :py:class:`tweebo.stages.Cancellation` and :py:mod:`tweebo.jobs`
+    :param isolate_errors: Whether to find the texts that make the pipeline \
+    fail, rather than raising SystemError for the whole batch, by splitting \
+    the texts in half and running each half again until the texts that \
+    fail on their own are found. Each failed text costs about two runs of \
+    the pipeline for every halving of the batch. The output of a text that \
+    fails is None. Before bisecting, the pipeline is run on a text it can \
+    always process and if that also fails the error is raised, as the \
+    pipeline cannot run at all.
+    :param error_callback: Optional function that is called, when \
+    isolate_errors is True, for each text that fails with a dictionary \
+    containing the `index` of the text, the `text` and the `error` message.
+    :param timeout: Optional seconds the texts have to be processed within, \
+    after which the processes of the pipeline are killed and \
+    PipelineTimeout is raised.
+    :param deadline: Optional time, in seconds since the epoch, the texts \
+    have to be processed by e.g. the deadline of the request the texts came \
+    from, otherwise the same as timeout. The earlier of the two is used. \
+    When a cancellation is given the deadline is set on it see \
+    :py:meth:`tweebo.stages.Cancellation.set_deadline`, and it stops \
+    waiting for the deadline once the texts are processed.
     :type texts: list[str]
     :type output_type: str
+    :type stage_callback: Callable[[Dict], None]
+    :type timing_report: bool
+    :type profile_dir: str
+    :type n_jobs: int
+    :type input_format: str
+    :type until: str
+    :type fast: bool
+    :type cancellation: tweebo.stages.Cancellation
+    :type isolate_errors: bool
+    :type error_callback: Callable[[Dict], None]
+    :type timeout: float
+    :type deadline: float
     :return: Depending on the output_type for `stanford` see \
-    :py:func:`_to_stanford`. For conll see :py:func:`_to_conll`
-    :rtype: either list[Dict] or list[str]
+    :py:func:`_to_stanford`. For conll see :py:func:`_to_conll`. If \
+    timing_report is True a tuple of the output and the report see \
+    :py:func:`_timing_report`, which when isolate_errors is True includes \
+    every run of the pipeline but only counts the texts that did not fail.
+    :rtype: either list[Dict] or list[str] or a tuple of the output and Dict
     :raises TypeError: If the texts are not a list of Strings or unicode \
-    Strings.
+    Strings, or of the tagged Tweets the input_format expects.
     :raises ValueError: If the output_type is not equal to `stanford` or \
-    `conll`
+    `conll`, n_jobs is not a positive integer or -1, the input_format is \
+    not one of `INPUT_FORMATS`, a tagged Tweet is not formatted correctly \
+    or until is not one of `UNTIL_STAGES` or is `tagging` for tagged \
+    input, or timeout is not positive.
+    :raises SystemError: If the pipeline fails and isolate_errors is \
+    False, or is True and the pipeline fails on every text. When n_jobs is \
+    greater than 1 the error states which shards failed.
+    :raises IOError: If fast and until is `parsing` and the fast parsing \
+    model has not been trained, before any stage is run.
+    :raises PipelineTimeout: If the texts were not processed before the \
+    timeout or deadline, this is raised rather than SystemError and the \
+    texts are not bisected when isolate_errors is True.
+    :raises PipelineCancelled: If cancelled before the texts were processed.
     '''
 
     if not isinstance(texts, list):
@@ -226,33 +998,65 @@ def process_texts(texts, output_type='conll'):
     if output_type not in allowed_output_types:
         raise ValueError('output_type has to be one of the following: {}\n'
                          'Not {}'.format(allowed_output_types, output_type))
-    temp_dir_fp = tempfile.mkdtemp()
+    if input_format not in INPUT_FORMATS:
+        raise ValueError('input_format has to be one of the following: {}\n'
+                         'Not {}'.format(INPUT_FORMATS, input_format))
+    if until not in UNTIL_STAGES:
+        raise ValueError('until has to be one of the following: {}\n'
+                         'Not {}'.format(UNTIL_STAGES, until))
+    first_stage = 'tagging' if input_format == 'text' else 'brown_clusters'
+    if STAGES.index(until) < STAGES.index(first_stage):
+        raise ValueError('The {} input_format has already been tagged so '
+                         'until cannot be {}'.format(input_format, until))
+    if timeout is not None and timeout <= 0:
+        raise ValueError('timeout has to be positive not {}'.format(timeout))
+    # Otherwise the missing model is only found after the tagging and token
+    # selection, and never for a batch of only trivial Tweets.
+    if fast and until == 'parsing':
+        check_fast_parsing_model()
+    start_time = time.time()
+    has_deadline = timeout is not None or deadline is not None
+    if has_deadline:
+        if cancellation is None:
+            cancellation = Cancellation()
+        if timeout is not None:
+            cancellation.set_deadline(start_time + timeout)
+        if deadline is not None:
+            cancellation.set_deadline(deadline)
+    batch_options = {'output_type': output_type, 'profile_dir': profile_dir,
+                     'n_jobs': n_jobs, 'input_format': input_format,
+                     'first_stage': first_stage, 'until': until, 'fast': fast,
+                     'cancellation': cancellation}
     try:
-        text_fp = Path(temp_dir_fp, 'text_file.txt')
-        # Add the data to the text file
-        with text_fp.open('w', encoding='utf-8') as text_file:
-            for index, text in enumerate(texts):
-                if isinstance(text, str):
-                    text = text.decode('utf-8')
-                elif not isinstance(text, unicode):
-                    raise TypeError('The Strings in text must be of '
-                                    'str or unicode not {}'
-                                    .format(type(text)))
-                text = text.strip()
-                if not text:
-                    text_file.write(EMPTY_TOKEN)
-                else:
-                    text_file.write(text)
-                if index != (len(texts) - 1):
-                    text_file.write(u'\n')
-        _process_file(text_fp)
-        result_fp = Path(temp_dir_fp, 'text_file.txt.predict')
-        if output_type == 'stanford':
-            return _to_stanford(result_fp)
+        if isolate_errors:
+            # Every run of the bisection is recorded, including those that
+            # fail
+            stage_infos = []
+
+            def record_stage(stage_info):
+                stage_infos.append(stage_info)
+                if stage_callback is not None:
+                    stage_callback(stage_info)
+
+            batch_options['stage_callback'] = record_stage
+            processed_texts, input_bytes = _process_isolating(
+                texts, error_callback, batch_options)
         else:
-            return _to_conll(result_fp)
-    except Exception as error:
-        shutil.rmtree(temp_dir_fp)
-        raise error
-    else:
-        shutil.rmtree(temp_dir_fp)
+            batch_options['stage_callback'] = stage_callback
+            processed_texts, stage_infos, input_bytes = _process_batch(
+                texts, **batch_options)
+    finally:
+        if has_deadline:
+            cancellation.close()
+    if output_type == 'stanford':
+        # Each shard or bisected batch indexes its Tweets from 0 and skips
+        # the empty texts
+        for index, tweet_data in enumerate(processed_texts):
+            if tweet_data is not None:
+                tweet_data['index'] = index
+    if timing_report:
+        return processed_texts, _timing_report(
+            stage_infos, [tweet_output for tweet_output in processed_texts
+                          if tweet_output is not None],
+            output_type, start_time, input_bytes)
+    return processed_texts
@@ -0,0 +1,322 @@
+'''
+Unix domain socket endpoint for clients on the same host as the API server \
+in :py:mod:`tweebo.server`, which avoids the TCP and HTTP overhead of each \
+request. The server listens on the socket when started with \
+`--unix-socket`
+
+Each message is a frame of a 4 byte big-endian unsigned length followed by \
+that many bytes of `MessagePack <https://msgpack.org/>`_. A connection can \
+send any number of requests one after the other, each answered by one \
+response frame before the next request is read:
+1. Request - The same map as the body of a HTTP request to the server, the \
+`priority` and `timeout` fields taking the place of the headers.
+2. Response - A map with the HTTP status code of the request, `status`, \
+and either the processed texts, `data`, or the error, `message`. When the \
+queue is full the response also has the seconds to wait before retrying, \
+`retry_after`
+
+Example:
+
+    with UnixSocketClient('/tmp/tweebo.sock') as client:
+        conll_parses = client.parse(texts)
+'''
+
+import logging
+import os
+import socket
+import SocketServer
+import stat
+import struct
+import threading
+
+import msgpack
+
+# Frames longer than this are rejected before they are read
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_FRAME_LENGTH = struct.Struct('>I')
+
+
+class SocketRequestError(Exception):
+    '''
+    Raised by :py:class:`UnixSocketClient` when the server returns an error.
+
+    :param message: The error message of the server.
+    :param status_code: HTTP status code of the error.
+    :param retry_after: Seconds to wait before retrying if the queue of the \
+    server was full otherwise None.
+    :type message: str
+    :type status_code: int
+    :type retry_after: int
+    '''
+
+    def __init__(self, message, status_code, retry_after=None):
+        super(SocketRequestError, self).__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _receive(connection, num_bytes):
+    '''
+    :param connection: Socket to read from.
+    :param num_bytes: Number of bytes to read.
+    :type connection: socket.socket
+    :type num_bytes: int
+    :return: The bytes read, empty if the connection was closed before any \
+    bytes were read.
+    :rtype: bytes
+    :raises EOFError: If the connection was closed part way through.
+    '''
+
+    chunks = []
+    remaining = num_bytes
+    while remaining:
+        chunk = connection.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            if remaining == num_bytes:
+                return b''
+            raise EOFError('The connection was closed part way through a '
+                           'frame')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(connection):
+    '''
+    :param connection: Socket to read a frame from.
+    :type connection: socket.socket
+    :return: The body of the frame, None if the connection was closed \
+    between frames.
+    :rtype: bytes
+    :raises EOFError: If the connection was closed part way through a frame.
+    :raises ValueError: If the frame is longer than `MAX_FRAME_BYTES`
+    '''
+
+    header = _receive(connection, _FRAME_LENGTH.size)
+    if not header:
+        return None
+    length, = _FRAME_LENGTH.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError('The frame of {} bytes is longer than the maximum '
+                         'of {} bytes'.format(length, MAX_FRAME_BYTES))
+    body = _receive(connection, length)
+    if len(body) != length:
+        raise EOFError('The connection was closed part way through a frame')
+    return body
+
+
+def write_frame(connection, body):
+    '''
+    :param connection: Socket to write the frame to.
+    :param body: Body of the frame.
+    :type connection: socket.socket
+    :type body: bytes
+    :return: None
+    '''
+
+    connection.sendall(_FRAME_LENGTH.pack(len(body)) + body)
+
+
+def _encode(message):
+    '''
+    :param message: Request or response.
+    :type message: Dict
+    :return: The body of the frame of the message.
+    :rtype: bytes
+    '''
+
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def _decode(body):
+    '''
+    :param body: The body of a frame.
+    :type body: bytes
+    :return: The request or response in the frame.
+    :rtype: Dict
+    :raises ValueError: If the body is not MessagePack.
+    '''
+
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except Exception as error:
+        raise ValueError('Could not decode the MessagePack frame: {}'
+                         .format(repr(error)))
+
+
+class _FrameHandler(SocketServer.BaseRequestHandler):
+    '''
+    Answers the request frames of a connection until it is closed.
+    '''
+
+    def handle(self):
+        while True:
+            try:
+                body = read_frame(self.request)
+            except (EOFError, ValueError, socket.error) as error:
+                # The frames cannot be followed any further
+                logging.warning('Closing Unix socket connection: {}'
+                                .format(error))
+                if isinstance(error, ValueError):
+                    self._respond({'status': 413, 'message': str(error)})
+                return
+            if body is None:
+                return
+            try:
+                message = _decode(body)
+            except ValueError as error:
+                response = {'status': 400, 'message': str(error)}
+            else:
+                try:
+                    response = self.server.handle_message(message)
+                except Exception as error:
+                    logging.exception('Error handling a Unix socket request')
+                    response = {'status': 500,
+                                'message': 'Error: {}'.format(repr(error))}
+            if not self._respond(response):
+                return
+
+    def _respond(self, response):
+        '''
+        :return: False if the client has gone.
+        :rtype: bool
+        '''
+
+        try:
+            write_frame(self.request, _encode(response))
+        except socket.error:
+            return False
+        return True
+
+
+class UnixFrameServer(SocketServer.ThreadingMixIn,
+                      SocketServer.UnixStreamServer):
+    '''
+    Serves length prefixed MessagePack requests on a Unix domain socket, \
+    each connection in its own thread.
+
+    :param path: Path of the socket. A socket left at the path by a server \
+    that did not shut down cleanly is replaced.
+    :param handle_message: Function that is given each decoded request and \
+    returns the response see :py:mod:`tweebo.unix_socket`
+    :type path: str
+    :type handle_message: Callable[[Dict], Dict]
+    :raises OSError: If something other than a socket exists at the path.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, path, handle_message):
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise OSError('{} exists and is not a socket'.format(path))
+            os.remove(path)
+        self.path = path
+        self.handle_message = handle_message
+        SocketServer.UnixStreamServer.__init__(self, path, _FrameHandler)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def serve_in_background(path, handle_message):
+    '''
+    :param path: Path of the socket see :py:class:`UnixFrameServer`
+    :param handle_message: Function that is given each decoded request and \
+    returns the response.
+    :type path: str
+    :type handle_message: Callable[[Dict], Dict]
+    :return: The server, which is serving from a daemon thread and is \
+    stopped with `shutdown` followed by `server_close`
+    :rtype: UnixFrameServer
+    '''
+
+    server = UnixFrameServer(path, handle_message)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class UnixSocketClient(object):
+    '''
+    Client for the Unix domain socket of the API server, the connection is \
+    opened on the first request and kept open. A client should only be used \
+    by one thread at a time.
+
+    :param path: Path of the socket the server listens on.
+    :param timeout: Seconds to wait for the server to respond see \
+    `socket.settimeout`. If None waits until it responds.
+    :type path: str
+    :type timeout: float
+    '''
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the connection to the server.
+
+        :return: None
+        '''
+
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def request(self, message):
+        '''
+        :param message: The request see :py:mod:`tweebo.unix_socket`
+        :type message: Dict
+        :return: The response of the server.
+        :rtype: Dict
+        :raises EOFError: If the server closed the connection.
+        '''
+
+        if self._connection is None:
+            self._connection = socket.socket(socket.AF_UNIX,
+                                             socket.SOCK_STREAM)
+            self._connection.settimeout(self.timeout)
+            self._connection.connect(self.path)
+        try:
+            write_frame(self._connection, _encode(message))
+            body = read_frame(self._connection)
+        except Exception:
+            # The connection is part way through a frame
+            self.close()
+            raise
+        if body is None:
+            self.close()
+            raise EOFError('The server closed the connection')
+        return _decode(body)
+
+    def parse(self, texts, output_type='conll', **options):
+        '''
+        :param texts: Texts to parse see :py:func:`tweebo.process_texts`
+        :param output_type: Either `conll` or `stanford`
+        :param options: Other fields of the request e.g. `input_format`, \
+        `fast`, `priority` or `timeout` see :py:mod:`tweebo.server`
+        :type texts: list
+        :type output_type: str
+        :return: The processed texts.
+        :rtype: list
+        :raises SocketRequestError: If the server returns an error.
+        '''
+
+        response = self.request(dict(options, texts=texts,
+                                     output_type=output_type))
+        if response['status'] != 200:
+            raise SocketRequestError(response['message'], response['status'],
+                                     response.get('retry_after'))
+        return response['data']